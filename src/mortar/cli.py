@@ -1,7 +1,11 @@
+from subprocess import CalledProcessError
+
 import click
 from mktech.path import Path
 
 from . import shell, tesseract, video
+from .config import config
+from .transcribe import Transcriber, load_pipeline
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -30,14 +34,35 @@ def shell_command(file: str | None) -> None:
 
 @cli.command('tesseract')
 @click.argument(
-    'image', required=True, type=click.Path(dir_okay=False, path_type=Path)
+    'images',
+    nargs=-1,
+    required=True,
+    type=click.Path(dir_okay=False, path_type=Path)
+)
+@click.option(
+    '-j',
+    '--workers',
+    required=False,
+    type=click.IntRange(min=1),
+    help=(
+        'number of pooled Tesseract workers to use. Defaults to the' +
+        ' tesseract.workers configuration value, or 1 for a single image'
+    )
 )
-def tesseract_command(image: Path) -> None:
+def tesseract_command(images: tuple[Path, ...], workers: int | None) -> None:
     """
-    Generate OCR text from an image using Tesseract, and print the OCR result.
+    Generate OCR text from images using Tesseract, and print the OCR results
+    in order.
     """
 
-    tesseract.print_ocr(str(image))
+    if len(images) == 1 and workers is None:
+        tesseract.print_ocr(str(images[0]))
+    else:
+        if workers is not None:
+            config.tesseract.workers = workers
+
+        for it in tesseract.ocr_many(str(it) for it in images):
+            print(it)
 
 
 @cli.command('video')
@@ -51,14 +76,223 @@ def tesseract_command(image: Path) -> None:
         ' \'jp\' subdirectory of input directory'
     )
 )
-def video_command(input: Path | None) -> None:
+@click.option(
+    '-j',
+    '--jobs',
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='number of videos to extract concurrently'
+)
+@click.option(
+    '-f',
+    '--force',
+    is_flag=True,
+    help='extract videos again even if they were extracted before'
+)
+@click.option(
+    '-r',
+    '--rate',
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    help=(
+        'number of frames to extract, or to sample for --scene or --region,' +
+        ' per second. Defaults to 1, or 10 with --region'
+    )
+)
+@click.option(
+    '--scene',
+    required=False,
+    type=click.FloatRange(min=0, max=1),
+    help=(
+        'extract only frames whose ffmpeg scene change score is above' +
+        ' SCENE, between 0 and 1'
+    )
+)
+@click.option(
+    '--region',
+    required=False,
+    type=(int, int, int, int),
+    metavar='LEFT TOP RIGHT BOTTOM',
+    help=(
+        'extract a frame for each distinct content of a region of the' +
+        ' frames, such as a text box'
+    )
+)
+@click.option(
+    '--settle',
+    default=0.25,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help=(
+        'seconds for which the content of --region must stay unchanged' +
+        ' before it is extracted'
+    )
+)
+@click.option(
+    '-p',
+    '--profile',
+    required=False,
+    help=(
+        'name of the video.profiles configuration entry to extract with.' +
+        ' Defaults to the profile named after the directory of each video'
+    )
+)
+def video_command(
+    input: Path | None,
+    jobs: int,
+    force: bool,
+    rate: float | None,
+    scene: float | None,
+    region: tuple[int, int, int, int] | None,
+    settle: float,
+    profile: str | None
+) -> None:
     """
     Extract frames from input videos.
+
+    Videos which were extracted before with the same options, and haven't
+    changed since, are skipped, so an interrupted extraction resumes where it
+    left off.
     """
 
-    if video.extract_frames(input) != 0:
+    if scene is not None and region is not None:
+        raise click.UsageError('--scene and --region are exclusive.')
+
+    try:
+        result = video.extract_frames(
+            input, jobs, force, rate, scene, region, settle, profile
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    if result != 0:
         raise click.ClickException('Command failed.')
 
 
+@cli.command('transcribe')
+@click.argument(
+    'video_path',
+    metavar='VIDEO',
+    type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+@click.option(
+    '-o',
+    '--output',
+    required=False,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help='file to write the transcript to. Defaults to standard output'
+)
+@click.option(
+    '--format',
+    'format_',
+    default='jsonl',
+    show_default=True,
+    type=click.Choice(['jsonl', 'srt']),
+    help='transcript format'
+)
+@click.option(
+    '-p',
+    '--profile',
+    required=False,
+    help='name of the video.profiles configuration entry of the video'
+)
+@click.option(
+    '--pipeline',
+    'pipeline_path',
+    required=False,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help=(
+        'Python file defining the OCR pipeline as a variable named' +
+        ' pipeline. Defaults to the pipeline of the profile'
+    )
+)
+@click.option(
+    '--region',
+    required=False,
+    type=(int, int, int, int),
+    metavar='LEFT TOP RIGHT BOTTOM',
+    help='region of the frames in which dialog is shown'
+)
+@click.option(
+    '-r',
+    '--rate',
+    default=10.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help='number of frames to sample per second'
+)
+@click.option(
+    '--settle',
+    default=0.25,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help='seconds for which dialog must stay unchanged before it is OCRed'
+)
+@click.option(
+    '-j',
+    '--jobs',
+    required=False,
+    type=click.IntRange(min=1),
+    help='number of frames to OCR concurrently. Defaults to one per CPU'
+)
+def transcribe_command(
+    video_path: Path,
+    output: Path | None,
+    format_: str,
+    profile: str | None,
+    pipeline_path: Path | None,
+    region: tuple[int, int, int, int] | None,
+    rate: float,
+    settle: float,
+    jobs: int | None
+) -> None:
+    """
+    Transcribe the dialog of a video into timestamped captions.
+
+    Frames are decoded in memory, and only frames at which the dialog has
+    changed are OCRed. Each caption is written as soon as the dialog moves on.
+    Throughput statistics are printed to standard error at the end.
+    """
+
+    video_profile = None
+
+    if profile is not None:
+        video_profile = config.video.profiles.get(profile)
+
+        if video_profile is None:
+            raise click.ClickException(f'unknown video profile {profile!r}')
+
+    try:
+        transcriber = Transcriber(
+            None if pipeline_path is None else load_pipeline(pipeline_path),
+            video_profile,
+            region,
+            rate,
+            settle,
+            jobs
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    with click.open_file(
+        '-' if output is None else str(output), 'w', encoding='utf-8'
+    ) as fo:
+        try:
+            for it in transcriber.run(video_path):
+                _ = fo.write(
+                    f'{it.to_json()}\n' if format_ == 'jsonl' else
+                    f'{it.to_srt()}\n'
+                )
+
+                fo.flush()
+        except CalledProcessError as e:
+            raise click.ClickException(
+                f'ffmpeg failed: {e.stderr.decode()}'  # pyright: ignore[reportAny] # noqa: E501
+            )
+
+    click.echo(str(transcriber.stats), err=True)
+
+
 def main() -> None:
     cli()
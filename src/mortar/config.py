@@ -20,6 +20,17 @@ _config_dir = f'{_xdg_config_home}/mortar'
 _config_path = f'{_config_dir}/config.toml'
 
 
+class SSHHost(BaseModel):
+    """ A remote host for SSH connections. """
+
+    host: str | None = None
+    " Hostname of the remote host. "
+    port: int = 22
+    " Port of the remote host. "
+    weight: int = 1
+    " Maximum number of concurrent jobs run on the remote host. "
+
+
 class SSH(BaseModel):
     """ SSH client configuration. """
 
@@ -29,6 +40,98 @@ class SSH(BaseModel):
     " Hostname for remote SSH connections. "
     port: int = 22
     " Port for remote SSH connections. "
+    multiplex: bool = True
+    " If true, share one master connection per remote host. "
+    hosts: list[SSHHost] = []
+    (
+        " Remote hosts between which OCR jobs are balanced. If empty, the host"
+        " defined by host and port is used. "
+    )
+
+
+class Tesseract(BaseModel):
+    """ Tesseract configuration. """
+
+    workers: int = 0
+    (
+        " Number of pooled Tesseract workers used for OCR. If 0, each OCR"
+        " operation runs Tesseract directly. "
+    )
+    batch_size: int = 32
+    " Maximum number of images a pooled worker passes to one Tesseract run. "
+    cache: bool = True
+    " If true, OCR results are cached in a database under the data directory. "
+    cache_max_bytes: int = 256 * 1024 * 1024
+    " Size limit of the OCR result cache, in bytes. "
+    index: bool = False
+    (
+        " If true, OCR of an image reuses the text of a nearly identical image"
+        " found in an index under the data directory. "
+    )
+    index_distance: int = 3
+    " Greatest Hamming distance between hashes of nearly identical images. "
+    index_verify: bool = False
+    (
+        " If true, text found in the index is only reused for an image with"
+        " the same pixel content, rather than a nearly identical one. "
+    )
+    backend: str = ''
+    (
+        " Name of the OCR backend: wsl, native, ssh, capi or fake. If empty,"
+        " ssh is used if ssh.use_ssh is true, and wsl otherwise. "
+    )
+    library: str = ''
+    (
+        " Path of the libtesseract library. If empty, the library is found in"
+        " the default library search path. "
+    )
+    fake_texts: str = ''
+    (
+        " Directory of images and text files with the same names, which hold"
+        " the texts returned by the fake backend. "
+    )
+    fake_startup: float = 0.0
+    " Seconds the fake backend sleeps per run. "
+    fake_latency: float = 0.0
+    " Seconds the fake backend sleeps per image. "
+
+
+class VideoProfile(BaseModel):
+    """
+    Frame extraction settings for the videos of a game, applied by ffmpeg as
+    the frames are decoded.
+    """
+
+    crop: tuple[int, int, int, int] | None = None
+    (
+        " Box (left, top, right, bottom) to which frames are cropped, such as"
+        " the text box of the game. If None, frames are not cropped. "
+    )
+    gray: bool = False
+    " If true, frames are converted to 8-bit grayscale. "
+    scale: float = 1.0
+    " Factor by which frames are scaled, after cropping. "
+    format: str = 'png'
+    (
+        " Format of extracted frame files: png, or pnm for uncompressed PGM"
+        " or PPM files, which are larger but faster to read. "
+    )
+    pipeline: str = ''
+    (
+        " Path of a Python file defining the OCR pipeline which transcribes"
+        " the frames of the game, as a variable named pipeline. If empty, the"
+        " frames are OCRed as they are. "
+    )
+
+
+class Video(BaseModel):
+    """ Video frame extraction configuration. """
+
+    profiles: dict[str, VideoProfile] = {}
+    (
+        " Extraction profiles by name. Videos in a directory with the name of"
+        " a profile are extracted with that profile. "
+    )
 
 
 class Config(BaseConfig):
@@ -42,6 +145,10 @@ class Config(BaseConfig):
 
     ssh: SSH = SSH()
 
+    tesseract: Tesseract = Tesseract()
+
+    video: Video = Video()
+
     def __init__(self, toml_path: Path | str) -> None:
         super().__init__(toml_path)
 
@@ -46,7 +46,7 @@ class MultiCrop(Filter):
 
         while y_bot < y_max:
             line_crop_rect = (0, y_top, crop_width, y_bot)
-            line_image = input.copy().crop(line_crop_rect)
+            line_image = input.crop(line_crop_rect)
 
             line_images.append(line_image)
             y_top = y_bot
@@ -100,15 +100,31 @@ final_stage = output.stages[-1]
 
 print(f':::={final_stage.data}')
 
-# Show each image from the multi-crop result.
+# Show each image from the multi-crop result, stacked into one image.
 
-# The Output class has a show method which is used, but its implementation
-# only knows what to do when the type of the output stage is str or Image. If
-# we were to add support for list[Image], we could call output.show() to see
-# the results, but since we don't have that yet, we can inspect the results
-# in the loop below.
+output.show()
 
-# output.show()
+# Run OCR on all of the line images with a single Tesseract run, and print the
+# text of each line.
 
-for it in final_stage.data:
-    it.show()
+pipeline.add(OCR(batch=True))
+
+output = pipeline.run(image)
+
+for it in output.stages[-1].data:
+    print(it)
+
+# Run structured OCR on the text, and print each line that Tesseract found,
+# with its bounding box and confidence. Unlike MultiCrop, this doesn't depend
+# on a fixed line height, and all the lines come from a single Tesseract run.
+
+pipeline = Pipeline()
+pipeline.add(Crop(rect_crop))
+pipeline.add(Gray())
+pipeline.add(Invert())
+pipeline.add(OCR(structured=True))
+
+output = pipeline.run(image)
+
+for it in output.stages[-1].data.lines:
+    print(f'{it.box} {it.confidence:.1f} {it.text}')
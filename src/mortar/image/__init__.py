@@ -5,10 +5,19 @@ This package provides tools for working with images.
 from PIL import ImageShow
 
 from .detector import Detector
+from .hash import ChangeDetector, dedup, dhash, hamming
 from .image import Image
 from .text import create_text
 from .viewer import Viewer
 
-__all__ = ['Image', 'create_text', 'Detector']
+__all__ = [
+    'ChangeDetector',
+    'Detector',
+    'Image',
+    'create_text',
+    'dedup',
+    'dhash',
+    'hamming',
+]
 
 ImageShow.register(Viewer(), 0)  # pyright: ignore[reportUnknownMemberType]
@@ -4,6 +4,8 @@ from typing import Callable
 import cv2
 from cv2.typing import MatLike
 
+from .image import Image
+
 
 class Detector:
     def __init__(self) -> None:
@@ -11,14 +13,15 @@ class Detector:
 
     def detect_rects(
         self,
-        img_path: str,
+        img_path: str | Image,
         fn: Callable[[int, int, int, int], bool],
         draw: bool = False
     ) -> list[tuple[int, int, int, int]]:
         """
         Detects all rectangles in the provided image.
 
-        Arg img_path is where the image will be loaded from.
+        Arg img_path is where the image will be loaded from. It may also be an
+        Image, which is used directly instead of loading from disk.
 
         Arg fn will be called like fn(x,y,w,h) with detected rectangles,
         and is expected to return a bool.
@@ -27,7 +30,12 @@ class Detector:
         Arg draw is optional and defaults to False,
         It is used mostly for debugging. Will modify self.img with drawn rects.
         """
-        self.img = cv2.imread(img_path)
+        if isinstance(img_path, Image):
+            self.img = cv2.cvtColor(
+                img_path.convert('RGB').as_array(), cv2.COLOR_RGB2BGR
+            )
+        else:
+            self.img = cv2.imread(img_path)
 
         # Grayscale and threshold image for easier detecting
         gray = cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
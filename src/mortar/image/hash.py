@@ -0,0 +1,116 @@
+# pyright: reportAny=false,reportExplicitAny=false
+"""
+This module provides image hashes for detecting duplicate images.
+
+A difference hash (dhash) is a 64-bit perceptual hash, which changes little
+when an image changes little. The Hamming distance between the hashes of two
+images measures how different they are. An exact hash is the digest of the
+pixel content of an image.
+
+A ChangeDetector compares each image of a sequence, such as the text regions of
+consecutive video frames, with the last image that changed. It compares exact
+hashes by default, as the difference hash of a text region barely changes when
+a line of text is added to it.
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+import PIL.Image
+
+from .image import Image
+
+_hash_size = 8
+
+
+def dhash(image: Image) -> int:
+    """
+    Return the 64-bit difference hash of an image.
+
+    The image is reduced to 9x8 grayscale pixels, and each bit of the hash is
+    set if a pixel is brighter than its left neighbour.
+    """
+
+    small = image.convert('L').resize(
+        (_hash_size + 1, _hash_size), PIL.Image.Resampling.BILINEAR
+    ).as_array()
+
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    """ Return the number of bits which differ between two hashes. """
+
+    return (a ^ b).bit_count()
+
+
+class ChangeDetector:
+    """
+    Detect changes in a sequence of images.
+
+    If exact is True, an image is unchanged only if its pixel content is the
+    same as the last changed image. Otherwise, it is unchanged if the Hamming
+    distance between their difference hashes is at most max_distance.
+    Difference hashes tolerate noise, such as the artifacts of lossy video,
+    but may miss small changes, such as a new line of text, so they are only
+    used if exact is False.
+    """
+    def __init__(self, max_distance: int = 0, exact: bool = True) -> None:
+        self.max_distance: int = max_distance
+        " The greatest Hamming distance between unchanged images. "
+
+        self.exact: bool = exact
+        " If True, compare the pixel content of images instead of hashes. "
+
+        self._last: int | str | None = None
+
+    def changed(self, image: Image) -> bool:
+        """
+        Return True if image differs from the last changed image, or if it is
+        the first image. A changed image becomes the one compared with the
+        next images.
+        """
+
+        if self.exact:
+            key: int | str = image.digest()
+
+            result = key != self._last
+        else:
+            key = dhash(image)
+
+            result = not isinstance(self._last, int) or hamming(
+                key, self._last
+            ) > self.max_distance
+
+        if result:
+            self._last = key
+
+        return result
+
+    def reset(self) -> None:
+        """ Forget the last changed image. """
+
+        self._last = None
+
+
+def dedup(
+    images: Iterable[Image],
+    max_distance: int = 0,
+    exact: bool = True
+) -> list[int]:
+    """
+    Find runs of unchanged images in a sequence of images. Return the index of
+    the first image of the run of each image, whose results may be reused for
+    the image. See ChangeDetector for max_distance and exact.
+    """
+
+    detector = ChangeDetector(max_distance, exact)
+
+    result: list[int] = []
+
+    for index, image in enumerate(images):
+        result.append(index if detector.changed(image) else result[-1])
+
+    return result
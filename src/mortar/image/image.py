@@ -5,8 +5,11 @@ This module provides an Image class to be used for reading, writing, and
 manipulating images.
 """
 
+import hashlib
 from typing import Any, override
 
+import numpy as np
+import numpy.typing as npt
 import PIL.Image
 from PIL import ImageChops
 
@@ -15,34 +18,82 @@ class Image:
     """
     This class represents an image object. It's a convenience wrapper around
     the pillow library's Image class.
+
+    Images have copy-on-write semantics. Methods that transform an image, such
+    as convert, crop and resize, return a new Image and leave the original
+    unchanged. Copies share pixel data with the original until one of them is
+    modified in place, for example by paste.
     """
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
 
         self.pil_image: PIL.Image.Image = PIL.Image.Image()
-        " The instance of PIL.Image.Image wrapped by the Image object. "
+        (
+            " The instance of PIL.Image.Image wrapped by the Image object. It"
+            " may be shared with copies of the Image, so it must not be"
+            " modified in place. "
+        )
+
+        self._shared: bool = False
+
+    def as_array(self) -> npt.NDArray[Any]:
+        """
+        Return the pixel data of the image as a read-only NumPy array. The
+        array has shape (height, width) for single channel images, and
+        (height, width, channels) otherwise.
+
+        The pixel data is copied into the array in a single block through the
+        array interface of the PIL image, without iterating over pixels.
+        """
+
+        return np.asarray(self.pil_image)
 
     def convert(self, *args: Any, **kwargs: Any) -> 'Image':
         """
         See [PIL.Image.Image.convert](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.convert)
         """  # noqa: E501
-        self.pil_image = self.pil_image.convert(*args, **kwargs)
 
-        return self
+        # Converting to the current mode is a copy in PIL. Share the pixel data
+        # instead.
+
+        if args == (self.mode, ) and not kwargs:
+            return self.copy()
+
+        return self.from_pil_image(self.pil_image.convert(*args, **kwargs))
 
     def copy(self) -> 'Image':
         """
         See [PIL.Image.Image.copy](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.copy)
+
+        The pixel data is not copied until either image is modified in place.
         """  # noqa: E501
-        return self.from_pil_image(self.pil_image.copy())
+
+        result = self.from_pil_image(self.pil_image)
+
+        self._shared = True
+        result._shared = True
+
+        return result
 
     def crop(self, *args: Any, **kwargs: Any) -> 'Image':
         """
         See [PIL.Image.Image.crop](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.crop)
         """  # noqa: E501
-        self.pil_image = self.pil_image.crop(*args, **kwargs)
+        return self.from_pil_image(self.pil_image.crop(*args, **kwargs))
+
+    def digest(self) -> str:
+        """
+        Return a digest identifying the pixel content of the image. Images with
+        the same mode, size and pixel values have the same digest, regardless
+        of how they were encoded.
+        """
+
+        hash = hashlib.sha256()
 
-        return self
+        hash.update(f'{self.mode} {self.size}'.encode())
+        hash.update(self.tobytes())
+
+        return hash.hexdigest()
 
     def getdata(self, *args: Any, **kwargs: Any) -> Any:
         """
@@ -60,15 +111,19 @@ class Image:
         """
         See [PIL.Image.Image.paste](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.paste)
         """  # noqa: E501
-        self.pil_image.paste(image.pil_image, *args, **kwargs)
+        self._writable().paste(image.pil_image, *args, **kwargs)
+
+    def point(self, *args: Any, **kwargs: Any) -> 'Image':
+        """
+        See [PIL.Image.Image.point](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.point)
+        """  # noqa: E501
+        return self.from_pil_image(self.pil_image.point(*args, **kwargs))
 
     def resize(self, *args: Any, **kwargs: Any) -> 'Image':
         """
         See [PIL.Image.Image.resize](https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.resize)
         """  # noqa: E501
-        self.pil_image = self.pil_image.resize(*args, **kwargs)
-
-        return self
+        return self.from_pil_image(self.pil_image.resize(*args, **kwargs))
 
     def save(self, *args: Any, **kwargs: Any) -> None:
         """
@@ -109,6 +164,22 @@ class Image:
         """  # noqa: E501
         return cls.from_pil_image(PIL.Image.effect_mandelbrot(*args, **kwargs))
 
+    @classmethod
+    def from_array(cls, array: npt.NDArray[Any]) -> 'Image':
+        """
+        Return a new Image with the pixel data of a NumPy array, of the form
+        returned by as_array. The mode is determined by the shape and data type
+        of the array.
+
+        Where PIL supports it, such as for 8-bit grayscale and RGBA data, the
+        image shares the memory of the array instead of copying it, so the
+        array must not be modified afterward.
+        """
+
+        return cls.from_pil_image(
+            PIL.Image.fromarray(np.ascontiguousarray(array))
+        )
+
     @classmethod
     def fromarray(cls, *args: Any, **kwargs: Any) -> 'Image':
         """
@@ -163,6 +234,21 @@ class Image:
 
         return instance
 
+    def _writable(self) -> PIL.Image.Image:
+        """
+        Return the wrapped PIL image for modification in place. If the pixel
+        data is shared with a copy, copy it first.
+        """
+
+        if self._shared:
+            self.pil_image = self.pil_image.copy()
+            self._shared = False
+
+        return self.pil_image
+
+    def __copy__(self) -> 'Image':
+        return self.copy()
+
     @override
     def __repr__(self) -> str:
         return (
@@ -19,3 +19,17 @@ def win_from_wsl(path: str) -> PurePath:
     parts = path.split('/')
 
     return PurePath(f'{parts[2]}:/{"/".join(parts[3:])}')
+
+
+def wsl_from_win(path: str) -> str:
+    """
+    Convert an absolute Windows path into the corresponding path on a WSL
+    system.
+    """
+
+    drive, _, rest = path.replace('\\', '/').partition(':')
+
+    if len(drive) != 1 or not rest.startswith('/'):
+        raise Exception('path is expected to be an absolute Windows path')
+
+    return f'/mnt/{drive.lower()}{rest}'
@@ -3,28 +3,57 @@ This package provides the image processing pipeline facility.
 """
 
 import copy
+import os
+import traceback
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from enum import Enum, auto
 from functools import reduce
 from typing import Any, override
 
 from mktech.path import Path, PathInput
+from mktech.validate import ensure_type
 from PIL import ImageDraw
 
 from mortar import font
 from mortar.font import text_size
 from mortar.image import Image, create_text
 
-from .filter import OCR, Crop, Filter, Gray, Invert, Threshold
+from .cache import StageCache
+from .filter import (
+    OCR,
+    Crop,
+    Dedup,
+    Filter,
+    Fused,
+    Gray,
+    Invert,
+    Refine,
+    Scale,
+    Threshold,
+)
 
 __all__ = [
     'Filter',
     'Image',
     'Pipeline',
+    'Retention',
+    'StageCache',
     # image re-exports
     'Crop',
+    'Dedup',
+    'Fused',
     'Gray',
     'Invert',
     'OCR',
     'Output',
+    'Refine',
+    'Scale',
     'Threshold'
 ]  # yapf: disable
 
@@ -40,6 +69,81 @@ def _image_info(image: Image) -> str:
     return f'{image.mode} {image.size}'
 
 
+# The pipeline run by a run_many worker process. It is set once per worker by
+# the process pool initializer, rather than being sent along with every input.
+
+_worker_pipeline: 'Pipeline | None' = None
+
+
+def _init_worker(pipeline: 'Pipeline') -> None:
+    global _worker_pipeline
+
+    _worker_pipeline = pipeline
+
+
+def _run_worker(
+    index: int,
+    input: Image | PathInput,
+    retention: 'Retention',
+    spill: PathInput | None
+) -> 'Output':
+    assert _worker_pipeline is not None
+
+    return _run_one(_worker_pipeline, index, input, retention, spill)
+
+
+def _run_one(
+    pipeline: 'Pipeline',
+    index: int,
+    input: Image | PathInput,
+    retention: 'Retention',
+    spill: PathInput | None
+) -> 'Output':
+    """
+    Run pipeline on a single input of a batch. If processing fails, return an
+    Output describing the error instead of raising it.
+    """
+
+    try:
+        image = input if isinstance(input, Image) else Image.open(input)
+
+        output = pipeline.run(
+            image,
+            retention=retention,
+            spill=None if spill is None else Path(spill, str(index))
+        )
+    except Exception:
+        output = Output(pipeline)
+        output.error = traceback.format_exc()
+
+    output.index = index
+
+    return output
+
+
+def _is_text(data: Any) -> bool:  # pyright: ignore[reportExplicitAny]
+    """ Return True if data is a string or a list of strings. """
+
+    return isinstance(data, str) or (
+        isinstance(data, list) and len(data) > 0  # pyright: ignore[reportUnknownArgumentType] # noqa: E501
+        and all(isinstance(it, str) for it in data)  # pyright: ignore[reportUnknownVariableType] # noqa: E501
+    )
+
+
+class Retention(Enum):
+    """ Selects which stage results a Pipeline Output retains. """
+
+    ALL = auto()
+    " Retain the results of all stages. "
+    TEXT = auto()
+    (
+        " Retain the result of the final stage, and any text results, which"
+        " are strings or lists of strings. "
+    )
+    FINAL = auto()
+    " Retain only the result of the final stage. "
+
+
 class Pipeline:
     """
     A Pipeline is a series of stages through which an image is
@@ -70,33 +174,220 @@ class Pipeline:
 
         return self.stages.pop(index)
 
-    def run(self, input: Image) -> 'Output':
+    def run(
+        self,
+        input: Image,
+        cache: StageCache | None = None,
+        retention: Retention = Retention.ALL,
+        spill: PathInput | None = None
+    ) -> 'Output':
         """
         Run the pipeline using input as the input image. Return the result.
+
+        If a cache is provided, the result of each stage is looked up in it
+        before the stage is run, and stored in it afterwards. Running a
+        modified pipeline on the same input then only recomputes the stages
+        from the first modified stage onward.
+
+        retention selects which stage results are kept in the Output. The
+        result of a stage that is not retained is released as soon as the next
+        stage has consumed it. If spill is a directory path, released results
+        are first written to files in it, and can be read back with
+        Output.Stage.load.
         """
 
+        if spill is not None:
+            os.makedirs(spill, exist_ok=True)
+
         output = Output(self)
 
         output.add(input, ['Start', _image_info(input)])
 
         filter_input: Image | str = input
 
-        for _, it in enumerate(self.stages):
-            filter_output = it.run(filter_input)  # pyright: ignore[reportAny]
+        key = '' if cache is None else cache.digest(input)
 
-            assert (
-                isinstance(filter_output, Image)
-                or isinstance(filter_output, str)
-            )
+        for it in self.stages:
+            filters = it.filters if isinstance(it, Fused) else [it]
 
             assert isinstance(filter_input, Image)
 
-            output.add(filter_output, [it.info(), _image_info(filter_input)])
+            cached = None
+
+            if cache is not None:
+                for stage in filters:
+                    key = cache.chain(key, stage)
+
+                # A fused stage doesn't materialize the results of its filters
+                # other than the last, so a cached result of a fused stage can
+                # only be used if the mode of each intermediate result is
+                # known. Otherwise, the cache isn't consulted at all.
+
+                if not isinstance(it, Fused) or it.fusible(filter_input.mode):
+                    cached = cache.get(key)  # pyright: ignore[reportAny]
+
+            if cached is not None:
+                results = [(filter_input, None)] * (len(filters) - 1)
+                results.append((filter_input, cached))
+            else:
+                if isinstance(it, Fused):
+                    results = it.run_stages(filter_input)
+                else:
+                    results = [(filter_input, it.run(filter_input))]  # pyright: ignore[reportAny] # noqa: E501
+
+                if cache is not None:
+                    cache.put(key, results[-1][1])
+
+            for stage, (stage_input, stage_output) in zip(filters, results):
+                output.add(
+                    stage_output, [stage.info(), _image_info(stage_input)]
+                )
+                output.release(len(output.stages) - 2, retention, spill)
+
+            it.reset()
 
-            filter_input = filter_output
+            filter_input = results[-1][1]  # pyright: ignore[reportAny]
+
+            assert (
+                isinstance(filter_input, Image)
+                or isinstance(filter_input, str)
+                or isinstance(filter_input, list)
+            )
 
         return output
 
+    def compile(self) -> 'Pipeline':
+        """
+        Return a copy of the pipeline in which each run of consecutive
+        point-wise stages is fused into a single Fused stage. A fused stage
+        applies one lookup table to the image instead of making a pass over it
+        for each stage.
+
+        The compiled pipeline produces the same results as the original, and
+        its Output contains a stage for each original stage. Only the result
+        of the last stage of each fused run is materialized, so the data of
+        the other fused stages is None.
+        """
+
+        result = self.copy()
+
+        stages: list[Filter] = []
+        run: list[Filter] = []
+
+        for it in [*result.stages, None]:
+            if it is not None and it.pointwise:
+                run.append(it)
+
+                continue
+
+            if len(run) > 1:
+                stages.append(Fused(run))
+            else:
+                stages.extend(run)
+
+            run = []
+
+            if it is not None:
+                stages.append(it)
+
+        result.stages = stages
+
+        return result
+
+    def run_many(
+        self,
+        inputs: Iterable[Image | PathInput],
+        jobs: int | None = None,
+        ordered: bool = True,
+        retention: Retention = Retention.ALL,
+        spill: PathInput | None = None
+    ) -> Iterator['Output']:
+        """
+        Run the pipeline on each of inputs, which are Image objects or paths to
+        image files. Yield an Output for each input.
+
+        Inputs are processed by a pool of jobs worker processes. If jobs is
+        None, one worker per CPU is used. If jobs is 1, inputs are processed
+        serially in the current process. At most twice as many inputs as
+        workers are in flight at once, so inputs may be a lazy iterable of any
+        length.
+
+        If ordered is True, Outputs are yielded in input order. Otherwise, they
+        are yielded as they complete. Output.index is the position of the
+        corresponding input in inputs.
+
+        A failure to process one input does not abort the batch. The Output for
+        that input has no stages, and Output.error describes the failure.
+
+        retention and spill are as for run. Released results of each input are
+        spilled to a subdirectory of spill named after Output.index.
+        """
+
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        if jobs < 1:
+            raise ValueError(f'jobs must be at least 1, not {jobs}')
+
+        if jobs == 1:
+            for index, it in enumerate(inputs):
+                yield _run_one(self, index, it, retention, spill)
+
+            return
+
+        items = enumerate(inputs)
+        exhausted = False
+        limit = jobs * 2
+
+        pending: dict[Future[Output], int] = {}
+
+        with ProcessPoolExecutor(
+            jobs, initializer=_init_worker, initargs=(self, )
+        ) as executor:
+            try:
+                while True:
+                    while not exhausted and len(pending) < limit:
+                        item = next(items, None)
+
+                        if item is None:
+                            exhausted = True
+                        else:
+                            future = executor.submit(
+                                _run_worker, *item, retention, spill
+                            )
+                            pending[future] = item[0]
+
+                    if len(pending) == 0:
+                        break
+
+                    if ordered:
+                        done = [next(iter(pending))]
+                    else:
+                        finished, _ = wait(
+                            pending, return_when=FIRST_COMPLETED
+                        )
+                        done = [it for it in pending if it in finished]
+
+                    for it in done:
+                        index = pending.pop(it)
+
+                        try:
+                            output = it.result()
+                        except Exception:
+                            # The worker itself failed, for example because
+                            # the input could not be sent to it.
+
+                            output = Output(self)
+                            output.error = traceback.format_exc()
+                            output.index = index
+
+                        output.pipeline = self
+
+                        yield output
+            finally:
+                for it in pending:
+                    _ = it.cancel()
+
     @property
     def name(self) -> str:
         """ The name of the pipeline. """
@@ -148,6 +439,77 @@ class Output:
             " The output of the corresponding Pipeline stage Filter. "
             self.info: list[str] = [] if info is None else info
             " Text information describing the output of the stage. "
+            self.path: Path | None = None
+            (
+                " The file the output was written to, if it was spilled to"
+                " disk. "
+            )
+
+        def load(self) -> Any:  # pyright: ignore[reportExplicitAny]
+            """
+            Return the output of the stage, reading it from the file it was
+            spilled to if it is no longer held in memory. Return None if the
+            output was released without being spilled.
+            """
+
+            result = self.data  # pyright: ignore[reportAny]
+
+            if result is None and self.path is not None:
+                if self.path.is_dir():
+                    paths = sorted(
+                        self.path.iterdir(), key=lambda it: int(it.stem)
+                    )
+
+                    result = [Output.Stage.spilled(it).load() for it in paths]
+                elif self.path.suffix == '.png':
+                    result = Image.open(self.path)
+                else:
+                    with open(self.path, 'r') as file:
+                        result = file.read()
+
+            return result  # pyright: ignore[reportAny]
+
+        def write(self, directory: PathInput, index: int) -> Path:
+            """
+            Write the output of the stage to a file in directory, named after
+            index. Return the path of the file.
+
+            If the output is a list, its items are written to files in a
+            subdirectory named after index, and the path of the subdirectory is
+            returned.
+            """
+
+            data = self.load()  # pyright: ignore[reportAny]
+
+            if isinstance(data, Image):
+                file_path = Path(directory, f'{index}.png')
+
+                data.save(file_path)
+            elif isinstance(data, str):
+                file_path = Path(directory, f'{index}.txt')
+
+                with open(file_path, 'w') as file:
+                    _ = file.write(data)
+            elif isinstance(data, list):
+                file_path = Path(directory, str(index))
+
+                os.makedirs(file_path, exist_ok=True)
+
+                for item_index, it in enumerate(data):  # pyright: ignore[reportUnknownVariableType, reportUnknownArgumentType] # noqa: E501
+                    _ = Output.Stage(it).write(file_path, item_index)
+            else:
+                raise TypeError()
+
+            return file_path
+
+        @staticmethod
+        def spilled(path: Path) -> 'Output.Stage':
+            """ Return a stage whose output was spilled to path. """
+
+            result = Output.Stage(None)
+            result.path = path
+
+            return result
 
         @override
         def __repr__(self) -> str:
@@ -171,6 +533,12 @@ class Output:
             " stages. "
         )
 
+        self.index: int | None = None
+        " The position of the input in the batch, if run by run_many. "
+
+        self.error: str | None = None
+        " A description of the failure, if the pipeline failed to run. "
+
         self._frames: list[Image] = []
 
     def add(self, stage: Image | str, text: list[str] | None = None) -> None:
@@ -182,24 +550,45 @@ class Output:
 
         self.stages.append(Output.Stage(stage, text))
 
+    def release(
+        self,
+        index: int,
+        retention: Retention,
+        spill: PathInput | None = None
+    ) -> None:
+        """
+        Release the output of the stage at index, unless retention selects it
+        to be retained. The final stage is always retained. If spill is a
+        directory path, write the output to a file in it before releasing it.
+        """
+
+        stage = self.stages[index]
+
+        retain = (
+            retention == Retention.ALL
+            or stage is self.stages[-1]
+            or (retention == Retention.TEXT and _is_text(stage.data))  # pyright: ignore[reportAny] # noqa: E501
+        )
+
+        if retain or stage.data is None:  # pyright: ignore[reportAny]
+            return
+
+        if spill is not None:
+            stage.path = stage.write(spill, index)
+
+        stage.data = None
+
     def save(self, path: PathInput) -> None:
         """
         Create a composite image showing the results of all stages. Save the
         image to path.
+
+        Stages whose output was released without being spilled are omitted.
         """
 
         for idx, it in enumerate(self.stages):
-            if isinstance(it.data, Image):  # pyright: ignore[reportAny]
-                file_path = Path(path, f'{idx}.png')
-
-                it.data.save(file_path)
-            elif isinstance(it.data, str):  # pyright: ignore[reportAny]
-                file_path = Path(path, f'{idx}.txt')
-
-                with open(file_path, 'w') as file:
-                    _ = file.write(it.data)
-            else:
-                raise TypeError()
+            if it.load() is not None:
+                _ = it.write(path, idx)
 
         self._composite().save(Path(path, 'all.png'))
 
@@ -252,9 +641,16 @@ class Output:
         self._frames = []
 
         for index, it in enumerate(self.stages):
-            if isinstance(it.data, Image):  # pyright: ignore[reportAny]
-                frame_image = it.data
-            elif isinstance(it.data, str):  # pyright: ignore[reportAny]
+            data = it.load()  # pyright: ignore[reportAny]
+
+            if isinstance(data, list):
+                data = self._join(data)  # pyright: ignore[reportUnknownArgumentType] # noqa: E501
+
+            if data is None:
+                continue
+            elif isinstance(data, Image):
+                frame_image = data
+            elif isinstance(data, str):
                 """
                 The OCR result is drawn onto the resulting image, using a font
                 that supports the required Japanese glyphs.
@@ -264,7 +660,7 @@ class Output:
                 """
 
                 frame_image = create_text(
-                    it.data, _font['reiko_48'], 'rgb(235, 235, 235)', (10, 10)
+                    data, _font['reiko_48'], 'rgb(235, 235, 235)', (10, 10)
                 )
             else:
                 raise TypeError()
@@ -305,6 +701,32 @@ class Output:
 
             self._frames.append(image)
 
+    def _join(self, items: list[Any]) -> Image | str:  # pyright: ignore[reportExplicitAny] # noqa: E501
+        """
+        Join a list of text items into lines of one string, or a list of
+        images into one image in which they are stacked vertically.
+        """
+
+        if all(isinstance(it, str) for it in items):  # pyright: ignore[reportAny] # noqa: E501
+            return '\n'.join(items)
+
+        images = [ensure_type(it, Image) for it in items]  # pyright: ignore[reportAny] # noqa: E501
+
+        width = max(it.size[0] for it in images)
+        height = sum(it.size[1] for it in images)
+        height += self._margin * (len(images) - 1)
+
+        result = Image.new('RGB', (width, height), color=self._bg_color)
+
+        y = 0
+
+        for it in images:
+            result.paste(it, (0, y))
+
+            y += it.size[1] + self._margin
+
+        return result
+
     @override
     def __repr__(self) -> str:
         return (
@@ -316,6 +738,9 @@ class Output:
     def __str__(self) -> str:
         lines = ['Stages:']
 
+        if self.error is not None:
+            lines.insert(0, f'Error: {self.error}')
+
         for index, it in enumerate(self.stages):
             lines.append(f'{index}:')
             lines.append(f'  info={it.info}')
@@ -0,0 +1,233 @@
+# pyright: reportAny=false,reportExplicitAny=false
+"""
+This module provides a cache for the results of pipeline stages.
+
+Each stage result is keyed by a digest of the pipeline input image and the
+class and parameters of every filter up to and including the stage. When a
+pipeline is modified and run again with the same input, the results of the
+unchanged stages preceding the first modified stage are reused, and only the
+remaining stages are recomputed.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from copy import copy
+from tempfile import mkstemp
+from typing import Any
+
+from mktech.path import Path, PathInput
+
+from mortar.config import config
+from mortar.image import Image
+
+from .filter import Filter
+
+_default_max_bytes = 256 * 1024 * 1024
+_default_disk_max_bytes = 4 * 1024 * 1024 * 1024
+
+
+def _size(data: Any) -> int:
+    """ Return the approximate number of bytes held by a stage result. """
+
+    if isinstance(data, Image):
+        result = len(data.pil_image.getbands()) * data.size[0] * data.size[1]
+    elif isinstance(data, str):
+        result = len(data.encode())
+    else:
+        result = len(pickle.dumps(data))
+
+    return result
+
+
+class StageCache:
+    """
+    A cache of pipeline stage results.
+
+    Results are held in memory, up to a total of max_bytes. When the limit is
+    exceeded, the least recently used results are evicted.
+
+    If disk is True, results are also written to a directory under
+    config.data, and results evicted from memory can be loaded from there.
+    The directory is pruned of its least recently written results when it
+    grows beyond disk_max_bytes.
+    """
+    def __init__(
+        self,
+        max_bytes: int = _default_max_bytes,
+        disk: bool = False,
+        disk_max_bytes: int = _default_disk_max_bytes,
+        directory: PathInput | None = None
+    ) -> None:
+        self.max_bytes: int = max_bytes
+        " The memory budget for cached results, in bytes. "
+
+        self.disk_max_bytes: int = disk_max_bytes
+        " The disk budget for cached results, in bytes. "
+
+        self.directory: Path | None = None
+        " The directory of the disk tier, or None if it is disabled. "
+
+        if directory is not None:
+            self.directory = Path(directory)
+        elif disk:
+            self.directory = Path(config.data, 'cache', 'stages')
+
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._bytes: int = 0
+        self._disk_bytes: int = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+            self._disk_bytes = sum(
+                it.stat().st_size for it in os.scandir(self.directory)
+            )
+
+        self.hits: int = 0
+        " The number of successful lookups. "
+
+        self.misses: int = 0
+        " The number of failed lookups. "
+
+    @staticmethod
+    def digest(image: Image) -> str:
+        """ Return a digest identifying the pixel content of an image. """
+
+        return image.digest()
+
+    @staticmethod
+    def chain(key: str, stage: Filter) -> str:
+        """
+        Return the key of the result of running stage on the result identified
+        by key.
+        """
+
+        params = sorted(stage.params().items())
+        cls = stage.__class__
+
+        hash = hashlib.sha256()
+
+        hash.update(key.encode())
+        hash.update(f'{cls.__module__}.{cls.__qualname__}'.encode())
+        hash.update(repr(params).encode())
+
+        return hash.hexdigest()
+
+    def get(self, key: str) -> Any:
+        """ Return the result identified by key, or None if it is missing. """
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+            result = copy(self._entries[key][0])
+        else:
+            result = self._load(key)
+
+            if result is not None:
+                self._remember(key, result)
+
+                result = copy(result)
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return result
+
+    def put(self, key: str, data: Any) -> None:
+        """ Store the result identified by key. """
+
+        if data is None:
+            return
+
+        data = copy(data)
+
+        self._remember(key, data)
+        self._store(key, data)
+
+    def clear(self) -> None:
+        """ Remove all results from memory and from disk. """
+
+        self._entries.clear()
+        self._bytes = 0
+
+        if self.directory is not None:
+            for it in os.scandir(self.directory):
+                os.remove(it.path)
+
+            self._disk_bytes = 0
+
+    def _remember(self, key: str, data: Any) -> None:
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+        size = _size(data)
+
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (data, size)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+
+            self._bytes -= evicted_size
+
+    def _load(self, key: str) -> Any:
+        if self.directory is None:
+            return None
+
+        path = Path(self.directory, key)
+
+        try:
+            with open(path, 'rb') as file:
+                result = pickle.load(file)
+        except FileNotFoundError:
+            result = None
+
+        return result
+
+    def _store(self, key: str, data: Any) -> None:
+        if self.directory is None:
+            return
+
+        path = Path(self.directory, key)
+
+        if os.path.exists(path):
+            return
+
+        # Write to a temporary file first, so that a partially written result
+        # is never visible under its key.
+
+        fd, temp_path = mkstemp(dir=self.directory, prefix='.')
+
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(data, file)
+
+        os.replace(temp_path, path)
+
+        self._disk_bytes += os.stat(path).st_size
+
+        if self._disk_bytes > self.disk_max_bytes:
+            self._prune()
+
+    def _prune(self) -> None:
+        assert self.directory is not None
+
+        entries = sorted(
+            os.scandir(self.directory), key=lambda it: it.stat().st_mtime
+        )
+
+        for it in entries:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+
+            size = it.stat().st_size
+
+            os.remove(it.path)
+
+            self._disk_bytes -= size
@@ -6,17 +6,32 @@ A filter accepts an input, performs an operation on it, and returns the
 processed output.
 """
 
-import os
+import math
 from copy import copy
 from typing import Any, override
 
 import cv2 as cv
-import numpy as np
 from mktech.validate import ensure_type
 
-from mortar.image import Image
-from mortar.tesseract import ocr
-from mortar.util import mktemp
+from mortar.image import ChangeDetector, Image
+from mortar.tesseract import (
+    Line,
+    OCRText,
+    Word,
+    describe_engine,
+    ocr_image,
+    ocr_images,
+    ocr_structured,
+)
+
+
+def _describe(filter: 'Filter') -> tuple[str, list[tuple[str, Any]]]:
+    """
+    Return a description of a filter by its class and parameters, which is
+    independent of its object identity.
+    """
+
+    return (type(filter).__qualname__, sorted(filter.params().items()))
 
 
 class Filter:
@@ -26,6 +41,11 @@ class Filter:
 
     name: str = 'Filter'
     " The name of the filter. "
+    pointwise: bool = False
+    (
+        " True if the filter maps each pixel value independently of the"
+        " others, so that it can be expressed as a lookup table. See lut. "
+    )
     _input_type: Any = Any
 
     def __init__(self) -> None:
@@ -35,12 +55,41 @@ class Filter:
         """ Return the name of the filter. """
         return self.name
 
+    def params(self) -> dict[str, Any]:
+        """
+        Return the parameters of the filter. Filters of the same class with
+        equal parameters produce equal output from equal input.
+        """
+
+        return {
+            attr: value
+            for attr, value in self.__dict__.items()
+            if attr not in ('_input', '_input_type')
+        }
+
+    def lut(self, mode: str) -> list[int] | None:
+        """
+        Return a 256-entry lookup table which has the same effect as running
+        the filter on an image of the given mode, producing an 8-bit grayscale
+        image. Return None if the filter can't be expressed as such a table.
+        """
+
+        return None
+
+    def reset(self) -> None:
+        """ Release any references held since the filter was last run. """
+
+        self._input = None
+
     def run(self, input: Any) -> Any:
         """ Run the filter and return the resulting image. """
 
         ensure_type(input, self._input_type)
 
-        self._input = copy(input)
+        # Images are copy-on-write, and filters return new images rather than
+        # modifying their input, so the input is not copied.
+
+        self._input = input
 
         return None
 
@@ -112,12 +161,191 @@ class Crop(Filter):
         )
 
 
+class Dedup(Filter):
+    """
+    Run an inner filter on an image only if the image has changed since the
+    last image the inner filter was run on. Otherwise, return the output of
+    that run again.
+
+    Images are compared by a ChangeDetector, using max_distance and exact. The
+    filter is meant for consecutive images, such as the text regions of video
+    frames, run in order through the same pipeline. For example, Dedup(OCR())
+    after cropping and thresholding the text region of each frame runs OCR
+    only when the text changes.
+
+    Images are compared exactly by default. For noisy sources, exact=False
+    compares their difference hashes within max_distance instead.
+    """
+
+    name: str = 'Dedup'
+    _input_type: Any = Image
+
+    def __init__(
+        self, inner: Filter, max_distance: int = 0, exact: bool = True
+    ) -> None:
+        super().__init__()
+
+        self.inner: Filter = inner
+        self.max_distance: int = max_distance
+        self.exact: bool = exact
+
+        self._detector: ChangeDetector = ChangeDetector(max_distance, exact)
+        self._output: Any = None
+        self._runs: int = 0
+        self._skips: int = 0
+
+    @property
+    def runs(self) -> int:
+        """ The number of times the inner filter has been run. """
+
+        return self._runs
+
+    @property
+    def skips(self) -> int:
+        """ The number of times the output of a previous run was reused. """
+
+        return self._skips
+
+    @override
+    def info(self) -> str:
+        return f'{self.name} {self.inner.info()}'
+
+    @override
+    def params(self) -> dict[str, Any]:
+        return {
+            'inner': _describe(self.inner),
+            'max_distance': self.max_distance,
+            'exact': self.exact
+        }
+
+    def clear(self) -> None:
+        """ Forget the last image, so that the next image is always run. """
+
+        self._detector.reset()
+        self._output = None
+
+    @override
+    def run(self, input: Image) -> Any:
+        super().run(input)
+
+        if self._input is None:
+            return None
+
+        if self._detector.changed(self._input):
+            self._output = self.inner.run(self._input)
+            self.inner.reset()
+
+            self._runs += 1
+        else:
+            self._skips += 1
+
+        return copy(self._output)
+
+    @override
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Dedup) and self.params() == other.params()
+
+
+class Fused(Filter):
+    """
+    A run of point-wise filters fused into a single stage.
+
+    Consecutive filters which can be expressed as lookup tables for the mode of
+    their input are composed into one table, which is applied to the image in
+    a single pass. The remaining filters are run as usual. The result is the
+    same as running each filter in turn.
+    """
+
+    name: str = 'Fused'
+    _input_type: Any = Image
+
+    def __init__(self, filters: list[Filter]) -> None:
+        super().__init__()
+
+        self.filters: list[Filter] = filters
+        " The fused filters, in the order they are applied. "
+
+    @override
+    def info(self) -> str:
+        return f'{self.name} {[it.info() for it in self.filters]}'
+
+    def fusible(self, mode: str) -> bool:
+        """
+        Return True if every fused filter can be applied to an image of mode as
+        a lookup table.
+        """
+
+        return all(it.lut(mode) is not None for it in self.filters)
+
+    @override
+    def reset(self) -> None:
+        super().reset()
+
+        for it in self.filters:
+            it.reset()
+
+    @override
+    def run(self, input: Image) -> Any:
+        return self.run_stages(input)[-1][1]
+
+    def run_stages(self, input: Image) -> list[tuple[Any, Any]]:
+        """
+        Run the fused filters on input. Return a tuple for each filter,
+        containing an image with the mode and size of the filter's input, and
+        the filter's output. The output is None if it was fused into the
+        lookup table of a later filter.
+        """
+
+        super().run(input)
+
+        results: list[tuple[Any, Any]] = []
+        current: Any = input
+        table: list[int] | None = None
+
+        for it in self.filters:
+            lut = it.lut(current.mode) if isinstance(current, Image) else None
+
+            if lut is not None:
+                table = lut if table is None else [lut[v] for v in table]
+
+                results.append((current, None))
+            else:
+                if table is not None:
+                    current = current.point(table)
+                    table = None
+
+                    results[-1] = (results[-1][0], current)
+
+                output = it.run(current)
+
+                results.append((current, output))
+
+                current = output
+
+        if table is not None:
+            results[-1] = (results[-1][0], current.point(table))
+
+        return results
+
+    @override
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__module__} {self.__class__.__name__}'
+            f' filters={self.filters} at 0x{id(self):X}>'
+        )
+
+
 class Gray(Filter):
     """ Convert an image to 8-bit grayscale mode. """
 
     name: str = 'Gray'
+    pointwise: bool = True
     _input_type: Any = Image
 
+    @override
+    def lut(self, mode: str) -> list[int] | None:
+        return list(range(0, 256)) if mode == 'L' else None
+
     @override
     def run(self, input: Image) -> Image | None:
         super().run(input)
@@ -134,8 +362,13 @@ class Invert(Filter):
     """ Invert an image channel. """
 
     name: str = 'Invert'
+    pointwise: bool = True
     _input_type: Any = Image
 
+    @override
+    def lut(self, mode: str) -> list[int] | None:
+        return [255 - v for v in range(0, 256)] if mode == 'L' else None
+
     @override
     def run(self, input: Image) -> Image | None:
         super().run(input)
@@ -149,13 +382,67 @@ class Invert(Filter):
 
 
 class OCR(Filter):
-    """ Perform OCR on an image. """
+    """
+    Perform OCR on an image.
+
+    If batch is True, the input is a list of images instead, and the output
+    is a list of the OCR text of each image. The images are passed to
+    Tesseract together in memory, rather than running it once per image.
+
+    If structured is True, the output is an OCRText, which also holds the lines
+    and words of the text with their bounding boxes and confidences. Structured
+    output isn't available in batch mode.
+
+    index is passed to ocr_image as use_index, to reuse the text of nearly
+    identical images OCRed before. It only applies to single images of plain
+    text.
+    """
 
     name: str = 'OCR'
     _input_type: Any = Image
 
+    def __init__(
+        self,
+        batch: bool = False,
+        structured: bool = False,
+        index: bool | None = None
+    ) -> None:
+        super().__init__()
+
+        if batch and structured:
+            raise ValueError('structured OCR is not available in batch mode')
+
+        self.batch: bool = batch
+        self.structured: bool = structured
+        self.index: bool | None = index
+
+        if batch:
+            self._input_type = list
+
+    @override
+    def params(self) -> dict[str, Any]:
+        result = super().params()
+
+        # The text depends on the OCR engine, so results of different engines
+        # are told apart.
+
+        result['engine'] = describe_engine()
+
+        return result
+
+    @override
+    def info(self) -> str:
+        if self.batch:
+            result = f'{self.name} batch'
+        elif self.structured:
+            result = f'{self.name} structured'
+        else:
+            result = self.name
+
+        return result
+
     @override
-    def run(self, input: Image) -> str | None:
+    def run(self, input: Image | list[Image]) -> str | list[str] | None:
         """
         Perform OCR on an image and return the result.
         """
@@ -164,14 +451,204 @@ class OCR(Filter):
 
         if self._input is None:
             result = None
+        elif self.batch:
+            result = ocr_images(self._input)
+        elif self.structured:
+            result = ocr_structured(self._input)
         else:
-            output_path = mktemp(suffix='.png')
+            result = ocr_image(self._input, use_index=self.index)
+
+        return result
+
+
+class Refine(Filter):
+    """
+    Perform structured OCR on an image, then OCR its low-confidence lines again
+    using alternate preprocessing.
+
+    Each line whose confidence is below min_confidence is cropped from the
+    image, with padding pixels of margin, and run through the filters of each
+    of variants in turn before OCR. The result with the highest confidence
+    replaces the line, and its text is merged into the text of the image.
+    Lines with enough confidence are only OCRed once.
+
+    The output is an OCRText, like the output of OCR with structured=True.
+    """
+
+    name: str = 'Refine'
+    _input_type: Any = Image
+
+    def __init__(
+        self,
+        variants: list[list[Filter]],
+        min_confidence: float = 80.0,
+        padding: int = 4
+    ) -> None:
+        super().__init__()
+
+        self.variants: list[list[Filter]] = variants
+        self.min_confidence: float = min_confidence
+        self.padding: int = padding
+
+    @override
+    def params(self) -> dict[str, Any]:
+        result = super().params()
+
+        # The filters of the variants are identified by their classes and
+        # parameters, rather than by their object identities.
+
+        result['variants'] = [
+            [_describe(it) for it in variant] for variant in self.variants
+        ]
+        result['engine'] = describe_engine()
+
+        return result
+
+    @override
+    def reset(self) -> None:
+        super().reset()
+
+        for variant in self.variants:
+            for it in variant:
+                it.reset()
+
+    @override
+    def run(self, input: Image) -> OCRText | None:
+        super().run(input)
+
+        if self._input is None:
+            return None
+
+        text = ocr_structured(self._input)
+        lines = list(text.lines)
 
-            self._input.save(output_path)
+        for index, line in enumerate(lines):
+            if line.confidence < self.min_confidence:
+                lines[index] = self._refine(self._input, line)
 
-            result = ocr(output_path)
+        return OCRText(self._merge(text, lines), lines)
 
-            os.remove(output_path)
+    def _refine(self, image: Image, line: Line) -> Line:
+        """
+        Return the line with the highest confidence among the line and its OCR
+        results for each variant.
+        """
+
+        x1, y1, x2, y2 = line.rect()
+
+        box = (
+            max(x1 - self.padding, 0),
+            max(y1 - self.padding, 0),
+            min(x2 + self.padding, image.size[0]),
+            min(y2 + self.padding, image.size[1])
+        )
+
+        crop = image.crop(box)
+
+        result = line
+
+        for variant in self.variants:
+            data: Any = crop
+
+            for it in variant:
+                data = it.run(data)
+                it.reset()
+
+                if data is None:
+                    break
+
+            if not isinstance(data, Image):
+                continue
+
+            candidate = self._to_line(ocr_structured(data), box, data.size)
+
+            if candidate.confidence > result.confidence:
+                result = candidate
+
+        return result
+
+    @staticmethod
+    def _to_line(
+        text: OCRText,
+        box: tuple[int, int, int, int],
+        size: tuple[int, int],
+    ) -> Line:
+        """
+        Return a line of the words of text, which was read from an image of
+        the given size made from box of the input. The boxes of the words are
+        mapped back to the coordinates of the input.
+        """
+
+        x1, y1, x2, y2 = box
+        scale_x = (x2 - x1) / size[0]
+        scale_y = (y2 - y1) / size[1]
+
+        words = [
+            Word(
+                it.text,
+                (
+                    x1 + round(it.box[0] * scale_x),
+                    y1 + round(it.box[1] * scale_y),
+                    round(it.box[2] * scale_x),
+                    round(it.box[3] * scale_y)
+                ),
+                it.confidence
+            ) for it in text.words
+        ]
+
+        return Line((x1, y1, x2 - x1, y2 - y1), words)
+
+    @staticmethod
+    def _merge(text: OCRText, lines: list[Line]) -> str:
+        """
+        Return text with its lines replaced by the text of lines, keeping its
+        blank lines.
+        """
+
+        rows = text.splitlines(keepends=True)
+        indexes = [index for index, it in enumerate(rows) if it.strip() != '']
+
+        # Text lines match the structure of the text one to one, unless
+        # Tesseract split or joined lines differently between its outputs.
+
+        if len(indexes) != len(text.lines):
+            return ''.join(f'{it.text}\n' for it in lines)
+
+        for index, old, new in zip(indexes, text.lines, lines):
+            if new is not old:
+                row = rows[index]
+
+                rows[index] = new.text + row[len(row.rstrip('\r\n')):]
+
+        return ''.join(rows)
+
+
+class Scale(Filter):
+    """ Scale an image by a factor. """
+
+    name: str = 'Scale'
+    _input_type: Any = Image
+
+    def __init__(self, factor: float) -> None:
+        super().__init__()
+
+        self.factor: float = factor
+
+    @override
+    def run(self, input: Image) -> Image | None:
+        super().run(input)
+
+        if self._input is None:
+            result = None
+        else:
+            width, height = self._input.size
+
+            result = self._input.resize(
+                (
+                    max(round(width * self.factor), 1),
+                    max(round(height * self.factor), 1)
+                )
+            )
 
         return result
 
@@ -183,6 +660,7 @@ class Threshold(Filter):
     """
 
     name: str = 'Threshold'
+    pointwise: bool = True
     _input_type: Any = Image
 
     def __init__(
@@ -197,6 +675,21 @@ class Threshold(Filter):
         self.maxval: float = maxval
         self.invert: bool = invert
 
+    @override
+    def lut(self, mode: str) -> list[int] | None:
+        if mode != 'L':
+            return None
+
+        # Match the rounding of OpenCV, which thresholds 8-bit images using the
+        # floor of threshval and the nearest integer to maxval.
+
+        threshval = math.floor(self.threshval)
+        maxval = min(max(round(self.maxval), 0), 255)
+
+        high, low = (0, maxval) if self.invert else (maxval, 0)
+
+        return [high if v > threshval else low for v in range(0, 256)]
+
     @override
     def run(self, input: Image) -> Image | None:
         super().run(input)
@@ -204,7 +697,13 @@ class Threshold(Filter):
         if self._input is None or self._input.mode not in ['1', 'L']:
             result = None
         else:
-            img = np.array([self._input.getdata()], dtype='uint8')
+            # Bilevel images are thresholded as 8-bit grayscale, with pixel
+            # values of 0 and 255.
+
+            if self._input.mode == '1':
+                img = self._input.convert('L').as_array()
+            else:
+                img = self._input.as_array()
 
             thresh_type = (
                 cv.THRESH_BINARY_INV if self.invert else cv.THRESH_BINARY
@@ -212,6 +711,6 @@ class Threshold(Filter):
             _, thresh = cv.threshold(img, self.threshval, self.maxval,
                                      thresh_type)
 
-            result = Image.frombytes('L', self._input.size, bytes(thresh))
+            result = Image.from_array(thresh)
 
         return result
@@ -3,12 +3,12 @@ This module provides facilities for executing operating system processes.
 """
 
 import subprocess
-from subprocess import CalledProcessError, CompletedProcess
+from subprocess import CalledProcessError, CompletedProcess, Popen
 from typing import Any, cast
 
 from mktech import log
 
-__all__ = ['CompletedProcess', 'run']
+__all__ = ['CompletedProcess', 'Popen', 'run', 'start']
 
 
 def run(
@@ -43,3 +43,21 @@ def run(
     log.info(f'stderr={cast(str, result.stderr)}')
 
     return result  # pyright: ignore[reportUnknownVariableType]
+
+
+def start(
+    *args: Any,  # pyright: ignore[reportAny,reportExplicitAny]
+    **kwargs: Any,  # pyright: ignore[reportAny,reportExplicitAny]
+) -> Popen[bytes]:
+    """
+    Start the command described by args in a child process, without waiting
+    for it to exit. args is as for run.
+
+    Return a Popen instance for the child. Its output is not captured unless
+    requested in kwargs, which are passed through to the underlying Popen
+    constructor.
+    """
+
+    log.info(f'start {args}')
+
+    return Popen(*args, **kwargs)  # pyright: ignore[reportAny]
@@ -3,13 +3,33 @@ Use SSH remote sessions.
 
 This module provides facilities to use SSH remote sessions. Copying files using
 scp is supported, as is executing arbitrary commands over SSH.
+
+Connections are multiplexed. The first operation on a remote host opens a
+master connection, and later operations on the same host and port reuse it
+instead of connecting and authenticating again. Master connections are closed
+when the process exits.
 """
 
+import atexit
+import shutil
+import subprocess
+import threading
 from enum import Enum, auto
+from tempfile import mkdtemp
 
 from mortar import process
 from mortar.process import CompletedProcess
 
+# Master connections are kept alive for this long after their last use, in
+# case the process exits without closing them.
+
+_control_persist = '10m'
+
+_control_dir: str | None = None
+_control_lock = threading.Lock()
+
+_masters: set[tuple[str | None, int | None]] = set()
+
 
 class Command(Enum):
     """ Supported SSH operations. """
@@ -21,19 +41,28 @@ class Command(Enum):
 
 
 class SSH:
-    """ Execute SSH operations between the local host and a remote host. """
+    """
+    Execute SSH operations between the local host and a remote host.
+
+    If multiplex is True, operations share a master connection to the host.
+    """
     def __init__(
-        self, host: str | None = None, port: int | None = None
+        self,
+        host: str | None = None,
+        port: int | None = None,
+        multiplex: bool = True
     ) -> None:
         self.host: str | None = host
         " Remote host name "
         self.port: int | None = port
         " Remote host port "
+        self.multiplex: bool = multiplex
+        " If True, share a master connection to the remote host. "
 
     def scp_to(self, local: str, remote: str) -> CompletedProcess[bytes]:
         """ Copy a file from the local host to the remote host. """
 
-        args = self._build_args(Command.SCP, self.port)
+        args = self._build_args(Command.SCP)
 
         cmd = ['scp'] + args + [local, f'{self.host}:/{remote}']
 
@@ -44,7 +73,7 @@ class SSH:
     def scp_from(self, remote: str, local: str) -> CompletedProcess[bytes]:
         """ Copy a file from the remote host to the local host. """
 
-        args = self._build_args(Command.SCP, self.port)
+        args = self._build_args(Command.SCP)
 
         cmd = ['scp'] + args + [f'{self.host}:/{remote}', local]
 
@@ -52,32 +81,110 @@ class SSH:
 
         return result
 
-    def run(self, command: list[str]) -> CompletedProcess[bytes]:
+    def run(
+        self, command: list[str], input: bytes | None = None
+    ) -> CompletedProcess[bytes]:
         """
         Execute a command on the remote host over an SSH connection.
 
         command is a sequence representing the command name and its
-        space-separated arguments.
+        space-separated arguments. If input is provided, it is sent to the
+        standard input of the command.
 
         Return a CompletedProcess instance with the result.
         """
 
-        args = self._build_args(Command.SSH, self.port)
+        args = self._build_args(Command.SSH)
 
         ssh_command = ['ssh'] + args + [self.host] + command
 
-        return process.run(ssh_command)
+        return process.run(ssh_command, input=input)
+
+    def close(self) -> None:
+        """
+        Close the master connection to the remote host, if one is open.
+        """
 
-    @staticmethod
-    def _build_args(command: Command, port: int | None) -> list[str]:
+        with _control_lock:
+            if (self.host, self.port) not in _masters:
+                return
+
+            _masters.remove((self.host, self.port))
+
+        _exit_master(self.host, self.port)
+
+    def __enter__(self) -> 'SSH':
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def _build_args(self, command: Command) -> list[str]:
         args: list[str] = []
 
-        if port is not None:
+        if self.port is not None:
             if command == Command.SSH:
                 args.append('-p')
             elif command == Command.SCP:
                 args.append('-P')
 
-            args.append(str(port))
+            args.append(str(self.port))
+
+        if self.multiplex:
+            with _control_lock:
+                _masters.add((self.host, self.port))
+
+            args += _control_args()
 
         return args
+
+
+def _control_args() -> list[str]:
+    """
+    Return the options which make ssh and scp share a master connection per
+    remote host, user and port.
+    """
+
+    global _control_dir
+
+    with _control_lock:
+        if _control_dir is None:
+            # Socket paths are limited in length, so the directory is kept
+            # short.
+
+            _control_dir = mkdtemp(prefix='mortar-ssh-')
+
+    return [
+        '-o', 'ControlMaster=auto',
+        '-o', f'ControlPath={_control_dir}/%C',
+        '-o', f'ControlPersist={_control_persist}'
+    ]  # yapf: disable
+
+
+def _exit_master(host: str | None, port: int | None) -> None:
+    assert host is not None
+
+    args = [] if port is None else ['-p', str(port)]
+
+    # The master may already have exited, so failure is not an error.
+
+    _ = subprocess.run(
+        ['ssh'] + args + _control_args() + ['-O', 'exit', host],
+        capture_output=True
+    )
+
+
+@atexit.register
+def _close_all() -> None:
+    """ Close all master connections, and remove their sockets. """
+
+    with _control_lock:
+        masters = list(_masters)
+
+        _masters.clear()
+
+    for host, port in masters:
+        _exit_master(host, port)
+
+    if _control_dir is not None:
+        shutil.rmtree(_control_dir, ignore_errors=True)
@@ -0,0 +1,586 @@
+"""
+This package provides an interface for performing OCR operations using
+Tesseract.
+
+OCR is performed by a backend, selected by name in configuration. The
+registered backends are:
+
+- wsl: runs Tesseract for Windows from the local WSL environment.
+- native: runs a Tesseract installed on the local Linux host.
+- ssh: runs Tesseract on remote hosts over SSH connections. Jobs are spread
+  between the hosts by a Balancer, which takes unreachable hosts out of use
+  and retries their jobs on other hosts.
+- capi: runs Tesseract in-process, through the libtesseract library, passing
+  images to it as pixel buffers.
+- fake: returns stored texts after a configurable latency, for exercising the
+  pipeline and measuring its throughput without Tesseract.
+
+Further backends may be added by subclassing OCRBackend and registering the
+class with register.
+
+Images held in memory are streamed to Tesseract's standard input, and the OCR
+text is read from its standard output, without using temporary files.
+
+OCR operations may be performed by a Pool of worker threads. A worker passes
+all the images waiting in the pool to a single backend run, so that the cost
+of starting Tesseract and loading its model is shared between them. On a
+remote host, the images of a run are sent in a single archive.
+
+ocr_structured generates OCRText, which holds the lines and words of the text
+with their bounding boxes and confidences, from the same Tesseract run as the
+text.
+
+OCR results are cached in an OCRCache, keyed by the decoded image pixels and
+the configuration of the OCR engine, so that OCR of an image that has been
+seen before doesn't run Tesseract again. An OCRIndex finds the results of
+nearly identical images, by perceptual hash.
+"""
+
+import atexit
+import functools
+import hashlib
+import os
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+
+from mortar.config import config
+from mortar.image import Image, dhash
+
+from .backend import OCRBackend, backends, get_backend, register
+from .balance import Balancer
+from .cache import OCRCache
+from .capi import (
+    CAPIBackend, Engine, tesseract_capi, tesseract_capi_structured
+)
+from .fake import FakeBackend
+from .index import OCRIndex
+from .local import (
+    NativeBackend, WSLBackend, tesseract_wsl, tesseract_wsl_list,
+    tesseract_wsl_stdin, tesseract_wsl_structured
+)
+from .remote import (
+    SSHBackend, tesseract_ssh, tesseract_ssh_list, tesseract_ssh_stdin,
+    tesseract_ssh_structured
+)
+from .structured import Line, OCRText, Word, parse_tsv
+
+__all__ = [
+    'Balancer',
+    'CAPIBackend',
+    'Engine',
+    'FakeBackend',
+    'Line',
+    'NativeBackend',
+    'OCRBackend',
+    'OCRCache',
+    'OCRIndex',
+    'OCRText',
+    'Pool',
+    'SSHBackend',
+    'WSLBackend',
+    'Word',
+    'backends',
+    'describe_engine',
+    'get_backend',
+    'ocr',
+    'ocr_image',
+    'ocr_images',
+    'ocr_many',
+    'ocr_structured',
+    'print_ocr',
+    'register',
+    'tesseract_capi',
+    'tesseract_capi_structured',
+    'tesseract_ssh',
+    'tesseract_ssh_list',
+    'tesseract_ssh_stdin',
+    'tesseract_ssh_structured',
+    'tesseract_wsl',
+    'tesseract_wsl_list',
+    'tesseract_wsl_stdin',
+    'tesseract_wsl_structured',
+]
+
+
+def _ocr_list(paths: list[str]) -> list[str]:
+    return get_backend().ocr_paths(paths)
+
+
+def _ocr_inputs(inputs: list[Image | str]) -> list[str]:
+    """
+    Generate OCR text from Images and image file paths, passing the images and
+    the paths to the backend in one run each. Return a string for each input.
+    """
+
+    images = [it for it in inputs if isinstance(it, Image)]
+    paths = [it for it in inputs if isinstance(it, str)]
+
+    image_texts = iter(get_backend().ocr_images(images) if images else [])
+    path_texts = iter(_ocr_list(paths) if paths else [])
+
+    return [
+        next(image_texts) if isinstance(it, Image) else next(path_texts)
+        for it in inputs
+    ]
+
+
+class Pool:
+    """
+    A pool of worker threads which generate OCR text using Tesseract.
+
+    Each worker waits for images to be submitted to the pool, as Images held
+    in memory or as paths to image files. It then takes up to batch_size of
+    the waiting images and generates OCR text for all of them using a single
+    Tesseract run, or one run for Images and one for paths. The results are
+    identical to running Tesseract separately for each image.
+
+    With the ssh backend, each batch is sent to a remote host as a single job.
+    """
+    def __init__(
+        self, workers: int | None = None, batch_size: int | None = None
+    ) -> None:
+        if workers is None:
+            workers = (
+                config.tesseract.workers or get_backend().concurrency()
+                or os.cpu_count() or 1
+            )
+
+        self.batch_size: int = (
+            config.tesseract.batch_size if batch_size is None else batch_size
+        )
+        " Maximum number of images passed to one Tesseract run. "
+
+        self._queue: SimpleQueue[tuple[Image | str, Future[str]] | None] = (
+            SimpleQueue()
+        )
+
+        self._workers: list[threading.Thread] = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(0, workers)
+        ]
+
+        for it in self._workers:
+            it.start()
+
+    def submit(self, image: Image | str) -> Future[str]:
+        """
+        Submit an Image, or the path of an image file, for OCR. Return a
+        Future for the OCR text.
+        """
+
+        future: Future[str] = Future()
+
+        self._queue.put((image, future))
+
+        return future
+
+    def map(self, images: Iterable[Image | str]) -> list[str]:
+        """
+        Generate OCR text from each of images, which are Images or paths of
+        image files, and return the strings in the same order.
+        """
+
+        return [it.result() for it in [self.submit(it) for it in images]]
+
+    def ocr(self, image: Image | str) -> str:
+        """
+        Generate OCR text from an Image, or an image file at a path, and
+        return the string.
+        """
+
+        return self.submit(image).result()
+
+    def close(self) -> None:
+        """
+        Stop the workers once they have finished the submitted images.
+        """
+
+        for _ in self._workers:
+            self._queue.put(None)
+
+        for it in self._workers:
+            it.join()
+
+        self._workers = []
+
+    def __enter__(self) -> 'Pool':
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+
+            if job is None:
+                break
+
+            jobs = [job]
+
+            while len(jobs) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except Empty:
+                    break
+
+                if job is None:
+                    # Leave the stop request for this worker until the jobs
+                    # already taken are done.
+
+                    self._queue.put(None)
+
+                    break
+
+                jobs.append(job)
+
+            self._run(jobs)
+
+    @staticmethod
+    def _run(jobs: list[tuple[Image | str, Future[str]]]) -> None:
+        try:
+            results = _ocr_inputs([image for image, _ in jobs])
+        except Exception as e:
+            if len(jobs) == 1:
+                jobs[0][1].set_exception(e)
+
+                return
+
+            # Run the images separately, so that one bad image doesn't fail
+            # the others.
+
+            for it in jobs:
+                Pool._run([it])
+
+            return
+
+        for (_, future), result in zip(jobs, results):
+            future.set_result(result)
+
+
+def ocr_many(
+    paths: Iterable[str],
+    batch_size: int | None = None,
+    use_cache: bool = True
+) -> list[str]:
+    """
+    Generate OCR text from several images using Tesseract, and return a string
+    for each image, in order.
+
+    The images are passed to Tesseract in batches of up to batch_size images
+    per run, or tesseract.batch_size in configuration if batch_size is None.
+    Tesseract is started and loads its model once per batch, rather than once
+    per image. If tesseract.workers is greater than 0 in configuration, the
+    batches are run by the shared worker Pool.
+
+    If use_cache is False, the OCR result cache is bypassed.
+    """
+
+    def run(paths: list[str]) -> list[str]:
+        if config.tesseract.workers > 0:
+            return _shared_pool().map(paths)
+
+        return _run_batches(paths, batch_size, _ocr_list)
+
+    return _cached(list(paths), Image.open, run, use_cache)
+
+
+def ocr_images(
+    images: Iterable[Image],
+    batch_size: int | None = None,
+    use_cache: bool = True
+) -> list[str]:
+    """
+    Generate OCR text from several Images using Tesseract, and return a string
+    for each image, in order.
+
+    Like ocr_many, the images are passed to Tesseract in batches of up to
+    batch_size images per run, or tesseract.batch_size in configuration if
+    batch_size is None. The images of a batch are passed to the OCR backend in
+    memory, rather than being saved to files. See OCRBackend.ocr_images. If
+    tesseract.workers is greater than 0 in configuration, the images are
+    batched by the shared worker Pool instead.
+
+    If use_cache is False, the OCR result cache is bypassed.
+    """
+
+    def run(images: list[Image]) -> list[str]:
+        if config.tesseract.workers > 0:
+            return _shared_pool().map(images)
+
+        return _run_batches(images, batch_size, get_backend().ocr_images)
+
+    return _cached(list(images), lambda it: it, run, use_cache)
+
+
+def _run_batches[T](
+    inputs: list[T],
+    batch_size: int | None,
+    run: Callable[[list[T]], list[str]]
+) -> list[str]:
+    """
+    Split inputs into batches of up to batch_size, or tesseract.batch_size in
+    configuration if batch_size is None, and call run on each batch. Return the
+    text of each input, in order.
+    """
+
+    size = config.tesseract.batch_size if batch_size is None else batch_size
+
+    batches = [
+        inputs[start:start + size] for start in range(0, len(inputs), size)
+    ]
+
+    # Batches are run concurrently by backends which handle concurrent runs
+    # well, such as remote hosts.
+
+    concurrency = get_backend().concurrency()
+
+    if concurrency is not None and len(batches) > 1:
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(run, batches))
+    else:
+        results = [run(it) for it in batches]
+
+    return [text for it in results for text in it]
+
+
+@functools.cache
+def _engine(backend: str) -> str:
+    """
+    Return a description of the OCR engine of a backend. Cached OCR results are
+    only reused with the same engine.
+    """
+
+    return get_backend(backend).describe()
+
+
+def describe_engine() -> str:
+    """
+    Return a description of the OCR engine of the backend in configuration.
+    The OCR text of an image only changes along with the description.
+    """
+
+    return _engine(get_backend().name)
+
+
+def _cache_key(image: Image, variant: str = '') -> str:
+    hash = hashlib.sha256()
+
+    hash.update(describe_engine().encode())
+    hash.update(image.digest().encode())
+
+    if variant != '':
+        hash.update(variant.encode())
+
+    return hash.hexdigest()
+
+
+def _index_scope(image: Image) -> str:
+    """
+    Return the scope of the OCR index in which the text of image is stored,
+    identifying the OCR engine and the size of the image.
+    """
+
+    width, height = image.size
+
+    return hashlib.sha256(
+        f'{describe_engine()}\n{width}x{height}'.encode()
+    ).hexdigest()
+
+
+_ocr_cache: OCRCache | None = None
+_ocr_cache_lock = threading.Lock()
+
+
+def _shared_cache() -> OCRCache:
+    global _ocr_cache
+
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OCRCache(max_bytes=config.tesseract.cache_max_bytes)
+
+    return _ocr_cache
+
+
+def _cached[T](
+    inputs: list[T],
+    load: Callable[[T], Image],
+    run: Callable[[list[T]], list[str]],
+    use_cache: bool,
+    variant: str = ''
+) -> list[str]:
+    """
+    Return the OCR text of each of inputs. Look the text up in the OCR result
+    cache, and call run to generate the text for inputs which are missing from
+    it. load returns the image of an input.
+
+    variant distinguishes results other than plain text, which are cached
+    separately.
+    """
+
+    if not (use_cache and config.tesseract.cache):
+        return run(inputs)
+
+    cache = _shared_cache()
+
+    keys = [_cache_key(load(it), variant) for it in inputs]
+    result = [cache.get(it) for it in keys]
+
+    missing = [index for index, it in enumerate(result) if it is None]
+
+    if len(missing) > 0:
+        texts = run([inputs[it] for it in missing])
+
+        for index, text in zip(missing, texts):
+            cache.put(keys[index], text)
+
+            result[index] = text
+
+    return [it for it in result if it is not None]
+
+
+_ocr_index: OCRIndex | None = None
+_ocr_index_lock = threading.Lock()
+
+
+def _shared_index() -> OCRIndex:
+    global _ocr_index
+
+    with _ocr_index_lock:
+        if _ocr_index is None:
+            _ocr_index = OCRIndex()
+
+    return _ocr_index
+
+
+_pool: Pool | None = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool() -> Pool:
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = Pool()
+
+            _ = atexit.register(_pool.close)
+
+    return _pool
+
+
+def ocr(path: str, use_cache: bool = True) -> str:
+    """
+    Generate OCR text from an image using Tesseract, and return the string.
+
+    The operation is performed by the OCR backend in configuration. See
+    get_backend. If tesseract.workers is greater than 0 in configuration, it
+    is performed by a shared Pool of that many workers.
+
+    If use_cache is False, the OCR result cache is bypassed.
+    """
+
+    def run(paths: list[str]) -> list[str]:
+        if config.tesseract.workers > 0:
+            result = _shared_pool().ocr(paths[0])
+        else:
+            result = get_backend().ocr_path(paths[0])
+
+        return [result]
+
+    return _cached([path], Image.open, run, use_cache)[0]
+
+
+def ocr_image(
+    image: Image, use_cache: bool = True, use_index: bool | None = None
+) -> str:
+    """
+    Generate OCR text from an Image using Tesseract, and return the string.
+
+    The image is passed to the OCR backend in configuration in memory, rather
+    than being saved to a file. See get_backend. If tesseract.workers is
+    greater than 0 in configuration, it is passed to the shared worker Pool,
+    which may batch it with other images.
+
+    If use_cache is False, the OCR result cache is bypassed.
+
+    If use_index is True, the text of a nearly identical image is looked up in
+    the shared OCRIndex first, within tesseract.index_distance in
+    configuration, and the text is added to the index otherwise. Only images
+    of the same size, read by the same OCR engine, are compared. If
+    tesseract.index_verify is true in configuration, text is only reused for
+    an image with the same pixel content, rather than a nearly identical one.
+    If use_index is None, tesseract.index in configuration decides.
+    """
+
+    if use_index is None:
+        use_index = config.tesseract.index
+
+    if use_index:
+        hash = dhash(image)
+        digest = image.digest()
+        scope = _index_scope(image)
+        index = _shared_index()
+
+        result = index.get(
+            hash,
+            config.tesseract.index_distance,
+            scope,
+            digest if config.tesseract.index_verify else None
+        )
+
+        if result is None:
+            result = ocr_image(image, use_cache, False)
+
+            index.put(hash, result, scope, digest)
+
+        return result
+
+    def run(images: list[Image]) -> list[str]:
+        if config.tesseract.workers > 0:
+            result = _shared_pool().ocr(images[0])
+        else:
+            result = get_backend().ocr(images[0])
+
+        return [result]
+
+    return _cached([image], lambda it: it, run, use_cache)[0]
+
+
+def ocr_structured(image: Image | str, use_cache: bool = True) -> OCRText:
+    """
+    Generate OCR text from an Image, or an image file at a path, using
+    Tesseract. Return the text together with the lines and words it was read
+    from, and their bounding boxes and confidences.
+
+    The text and its structure are generated by a single run of the OCR
+    backend in configuration. The text is the same as the result of ocr_image.
+
+    If use_cache is False, the OCR result cache is bypassed.
+    """
+
+    if isinstance(image, str):
+        image = Image.open(image)
+
+    def run(images: list[Image]) -> list[str]:
+        text, tsv = get_backend().ocr_structured(images[0])
+
+        # The outputs are cached together, separated by a null character.
+
+        return [f'{text}\0{tsv}']
+
+    result = _cached([image], lambda it: it, run, use_cache, 'structured')[0]
+
+    text, tsv = result.split('\0', 1)
+
+    return OCRText(text, parse_tsv(tsv))
+
+
+def print_ocr(path: str) -> None:
+    """
+    Generate OCR text from an image using Tesseract, and print the OCR result.
+    """
+
+    print(ocr(path))
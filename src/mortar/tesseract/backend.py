@@ -0,0 +1,246 @@
+"""
+This module provides the interface of OCR backends, and the registry from
+which the backend in configuration is selected.
+
+A backend generates OCR text from images in one particular way, such as
+running a Tesseract process, or calling Tesseract over SSH. Backends register
+themselves by name with the register decorator, and get_backend returns the
+shared instance of a backend.
+
+The module also provides helpers shared by the backends which run the
+Tesseract command line.
+"""
+
+import io
+import os
+import threading
+
+from mortar.config import config
+from mortar.image import Image
+from mortar.path import wsl_from_win
+
+# Options which make Tesseract write its TSV output alongside the text.
+
+structured_args = [
+    '-c', 'tessedit_create_txt=1',
+    '-c', 'tessedit_create_tsv=1'
+]  # yapf: disable
+
+
+class OCRBackend:
+    """
+    Base class which any OCR backend inherits.
+
+    Subclasses implement ocr, ocr_structured and describe. The other methods
+    have defaults built on them.
+    """
+
+    name: str = 'OCRBackend'
+    " The name the backend is registered under. "
+
+    def ocr(self, image: Image) -> str:
+        """ Generate OCR text from an Image, and return the string. """
+
+        raise NotImplementedError
+
+    def ocr_path(self, path: str) -> str:
+        """
+        Generate OCR text from an image file, and return the string.
+        """
+
+        return self.ocr(Image.open(path))
+
+    def ocr_paths(self, paths: list[str]) -> list[str]:
+        """
+        Generate OCR text from several image files, and return a string for
+        each image. Backends which can do so process the images together.
+        """
+
+        return [self.ocr_path(it) for it in paths]
+
+    def ocr_images(self, images: list[Image]) -> list[str]:
+        """
+        Generate OCR text from several Images, and return a string for each
+        image. Backends which can do so process the images together, without
+        writing them to files.
+        """
+
+        return [self.ocr(it) for it in images]
+
+    def ocr_structured(self, image: Image) -> tuple[str, str]:
+        """
+        Generate OCR text and its structure from an Image in a single run.
+        Return the text and Tesseract's TSV output.
+        """
+
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        """
+        Return a description of the OCR engine of the backend, which changes
+        whenever its results might. Cached OCR results are only reused with
+        the same description.
+        """
+
+        raise NotImplementedError
+
+    def concurrency(self) -> int | None:
+        """
+        Return the number of OCR runs the backend handles well at once, or
+        None if it is limited by the processors of the local host.
+        """
+
+        return None
+
+
+_backends: dict[str, type[OCRBackend]] = {}
+_instances: dict[str, OCRBackend] = {}
+_lock = threading.Lock()
+
+
+def register[T: type[OCRBackend]](cls: T) -> T:
+    """ Register an OCR backend class under its name. """
+
+    _backends[cls.name] = cls
+
+    return cls
+
+
+def backends() -> list[str]:
+    """ Return the names of the registered OCR backends. """
+
+    return sorted(_backends)
+
+
+def get_backend(name: str | None = None) -> OCRBackend:
+    """
+    Return the shared instance of the OCR backend registered under name.
+
+    If name is None, tesseract.backend in configuration is used. If that is
+    empty, the backend is 'ssh' if ssh.use_ssh is true in configuration, and
+    'wsl' otherwise.
+    """
+
+    if name is None:
+        name = config.tesseract.backend or (
+            'ssh' if config.ssh.use_ssh else 'wsl'
+        )
+
+    with _lock:
+        if name not in _instances:
+            if name not in _backends:
+                raise ValueError(
+                    f'unknown OCR backend {name!r}, expected one of'
+                    f' {", ".join(backends())}'
+                )
+
+            _instances[name] = _backends[name]()
+
+    return _instances[name]
+
+
+def encode(image: Image) -> bytes:
+    """ Encode an Image as PNG, to pass it to Tesseract. """
+
+    # The image is encoded losslessly, so the OCR result is the same as for an
+    # image file. Light compression is fastest for the short trip through a
+    # pipe.
+
+    buffer = io.BytesIO()
+
+    image.save(buffer, format='PNG', compress_level=1)
+
+    return buffer.getvalue()
+
+
+def encode_pages(images: list[Image]) -> bytes:
+    """
+    Encode Images as the pages of a multi-page TIFF, to pass them to a single
+    Tesseract run.
+    """
+
+    # Tesseract reads each page of a TIFF as a separate image, and separates
+    # the text of the pages with form feeds, as for a list file. The pages are
+    # stored uncompressed, which any build of Tesseract can read.
+
+    buffer = io.BytesIO()
+
+    images[0].pil_image.save(
+        buffer,
+        format='TIFF',
+        save_all=True,
+        append_images=[it.pil_image for it in images[1:]]
+    )
+
+    return buffer.getvalue()
+
+
+def decode(stdout: bytes) -> str:
+    """ Decode the standard output of Tesseract. """
+
+    # Normalize line endings, in case a Windows process writes its standard
+    # output in text mode.
+
+    return stdout.decode().replace('\r\n', '\n')
+
+
+def split_pages(output: str, count: int) -> list[str]:
+    """
+    Split the text output of a multi-page Tesseract run into the text of each
+    page.
+    """
+
+    # Pages are separated by form feeds. Tesseract versions before 5 also
+    # terminate the last page with one.
+
+    result = output.split('\f')
+
+    if len(result) == count + 1 and result[-1] == '':
+        _ = result.pop()
+
+    if len(result) != count:
+        raise RuntimeError(
+            f'expected OCR text for {count} images, found {len(result)}'
+        )
+
+    return result
+
+
+def tess_args(data: str | None) -> list[str]:
+    """
+    Return the options of the Tesseract command line, using the tessdata
+    directory data, or the default directory if data is None.
+    """
+
+    result = ['-l', 'jpn']
+
+    if data is not None:
+        result += ['--tessdata-dir', data]
+
+    return result + ['--psm', '3', '--oem', '1']
+
+
+def traineddata(data: str | None) -> str:
+    """
+    Return a description identifying the trained data in the tessdata
+    directory data by its size and modification time, or an empty string if it
+    isn't accessible on the local host.
+    """
+
+    if data is None:
+        return ''
+
+    paths = [data]
+
+    if len(data) > 1 and data[1] == ':':
+        paths.append(wsl_from_win(data))
+
+    for it in paths:
+        try:
+            stat = os.stat(f'{it}/jpn.traineddata')
+        except OSError:
+            continue
+
+        return f'{stat.st_size} {stat.st_mtime_ns}'
+
+    return ''
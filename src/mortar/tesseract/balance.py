@@ -0,0 +1,170 @@
+"""
+This module balances remote OCR jobs between several SSH hosts.
+
+Each host runs a limited number of jobs at once, given by its weight. A job is
+run on the host with the lowest load relative to its weight. Hosts which can't
+be reached are taken out of use for a while, and their jobs are retried on
+other hosts.
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from subprocess import CalledProcessError
+
+from mktech import log
+
+from mortar.config import SSHHost
+from mortar.ssh import SSH
+
+# The exit status of ssh when the connection to the remote host fails.
+
+_unreachable = 255
+
+
+class Balancer:
+    """
+    Run jobs on a set of remote hosts.
+
+    A host runs at most weight jobs at once. Jobs wait for a host to become
+    free when all hosts are busy.
+
+    When a job fails because its host can't be reached, the host is marked as
+    down and the job is retried on another host. Each host is tried at most
+    once per job. A host which is down is checked again cooldown seconds later,
+    when a job would use it, and used again if it can be reached.
+    """
+    def __init__(
+        self,
+        hosts: list[SSHHost],
+        multiplex: bool = True,
+        cooldown: float = 30.0
+    ) -> None:
+        if len(hosts) == 0:
+            raise ValueError('no hosts to balance between')
+
+        self.hosts: list[SSHHost] = hosts
+        " The remote hosts. "
+
+        self.cooldown: float = cooldown
+        " The number of seconds a host which is down is left unused. "
+
+        self._ssh: list[SSH] = [
+            SSH(host=it.host, port=it.port, multiplex=multiplex)
+            for it in hosts
+        ]
+
+        self._weights: list[int] = [max(it.weight, 1) for it in hosts]
+        self._load: list[int] = [0 for _ in hosts]
+        self._down: list[float | None] = [None for _ in hosts]
+        self._condition: threading.Condition = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        """ The number of jobs which may run at once over all hosts. """
+
+        return sum(self._weights)
+
+    def down(self) -> list[SSHHost]:
+        """ Return the hosts which are currently marked as down. """
+
+        with self._condition:
+            return [
+                host for host, down in zip(self.hosts, self._down)
+                if down is not None
+            ]
+
+    def run[T](self, job: Callable[[SSH], T]) -> T:
+        """
+        Call job with the SSH connection of a host, and return its result.
+        """
+
+        tried: set[int] = set()
+        error: CalledProcessError | None = None
+
+        while True:
+            index = self._acquire(tried)
+
+            if index is None:
+                if error is None:
+                    raise RuntimeError('no remote host is reachable')
+
+                raise error
+
+            tried.add(index)
+
+            try:
+                if self._down[index] is not None:
+                    _ = self._ssh[index].run(['true'])
+
+                    self._set_down(index, False)
+
+                return job(self._ssh[index])
+            except CalledProcessError as e:
+                if e.returncode != _unreachable:
+                    raise e
+
+                host = self.hosts[index]
+
+                log.error(f'host {host.host}:{host.port} is unreachable')
+
+                self._set_down(index, True)
+
+                error = e
+            finally:
+                self._release(index)
+
+    def _acquire(self, tried: set[int]) -> int | None:
+        """
+        Wait for a host which hasn't been tried to become free, and take a job
+        slot on it. Return the index of the host, or None if no hosts are left
+        to try.
+        """
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+
+                candidates = [
+                    index for index, down in enumerate(self._down)
+                    if index not in tried and (
+                        down is None or now - down >= self.cooldown
+                    )
+                ]
+
+                if len(candidates) == 0:
+                    return None
+
+                free = [
+                    it for it in candidates
+                    if self._load[it] < self._weights[it]
+                ]
+
+                if len(free) > 0:
+                    result = min(
+                        free, key=lambda it: self._load[it] / self._weights[it]
+                    )
+
+                    self._load[result] += 1
+
+                    if self._down[result] is not None:
+                        # Restart the cooldown, so that other jobs don't check
+                        # the host at the same time.
+
+                        self._down[result] = now
+
+                    return result
+
+                _ = self._condition.wait()
+
+    def _release(self, index: int) -> None:
+        with self._condition:
+            self._load[index] -= 1
+
+            self._condition.notify_all()
+
+    def _set_down(self, index: int, down: bool) -> None:
+        with self._condition:
+            self._down[index] = time.monotonic() if down else None
+
+            self._condition.notify_all()
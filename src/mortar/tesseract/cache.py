@@ -0,0 +1,137 @@
+"""
+This module provides a persistent cache of OCR results.
+
+Results are stored in a single SQLite database. Each result is identified by a
+key, which the caller derives from the image pixels and the configuration of
+the OCR engine. When the stored results grow beyond a size limit, the least
+recently used results are evicted.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from mktech.path import Path, PathInput
+
+from mortar.config import config
+
+_default_max_bytes = 256 * 1024 * 1024
+
+# Eviction sums the size of all results, so it is only checked periodically.
+
+_evict_interval = 64
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS ocr (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used);
+'''
+
+
+class OCRCache:
+    """
+    A persistent cache of OCR results, stored in an SQLite database at path.
+    If path is None, the database is stored under config.data.
+
+    The cache may be shared by threads and processes.
+    """
+    def __init__(
+        self,
+        path: PathInput | None = None,
+        max_bytes: int = _default_max_bytes
+    ) -> None:
+        self.path: Path = (
+            Path(config.data, 'cache', 'ocr.sqlite3')
+            if path is None else Path(path)
+        )
+        " The path of the database file. "
+
+        self.max_bytes: int = max_bytes
+        " The size limit of the stored results, in bytes. "
+
+        os.makedirs(self.path.parent, exist_ok=True)
+
+        self._lock: threading.Lock = threading.Lock()
+        self._puts: int = 0
+
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+
+        with self._lock, self._connection:
+            _ = self._connection.execute('PRAGMA journal_mode=WAL')
+            _ = self._connection.executescript(_schema)
+
+        self._evict()
+
+    def get(self, key: str) -> str | None:
+        """ Return the result identified by key, or None if it is missing. """
+
+        with self._lock, self._connection:
+            row: tuple[str] | None = self._connection.execute(
+                'SELECT text FROM ocr WHERE key = ?', (key, )
+            ).fetchone()
+
+            if row is not None:
+                _ = self._connection.execute(
+                    'UPDATE ocr SET used = ? WHERE key = ?', (time.time(), key)
+                )
+
+        return None if row is None else row[0]
+
+    def put(self, key: str, text: str) -> None:
+        """ Store the result identified by key. """
+
+        with self._lock, self._connection:
+            _ = self._connection.execute(
+                'INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?)',
+                (key, text, len(key) + len(text.encode()), time.time())
+            )
+
+            self._puts += 1
+
+        if self._puts % _evict_interval == 0:
+            self._evict()
+
+    def clear(self) -> None:
+        """ Remove all results. """
+
+        with self._lock, self._connection:
+            _ = self._connection.execute('DELETE FROM ocr')
+
+    def close(self) -> None:
+        """ Close the database. """
+
+        self._connection.close()
+
+    def _evict(self) -> None:
+        with self._lock, self._connection:
+            row: tuple[int] = self._connection.execute(
+                'SELECT total(size) FROM ocr'
+            ).fetchone()
+
+            excess = row[0] - self.max_bytes
+
+            if excess <= 0:
+                return
+
+            # Delete the least recently used results, up to and including the
+            # one at which the sum of the deleted sizes reaches the excess.
+
+            _ = self._connection.execute(
+                '''
+                DELETE FROM ocr WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, sum(size) OVER (
+                            ORDER BY used, key ROWS UNBOUNDED PRECEDING
+                        ) - size AS preceding
+                        FROM ocr
+                    ) WHERE preceding < ?
+                )
+                ''', (excess, )
+            )
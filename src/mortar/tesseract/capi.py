@@ -0,0 +1,292 @@
+# pyright: reportAny=false
+"""
+This module provides an in-process interface to Tesseract, through the C API
+of the libtesseract shared library.
+
+An Engine loads a Tesseract model once, and then recognizes images by passing
+their pixel buffers directly to the library, without starting a process or
+encoding the images. The 'capi' backend gives each thread an Engine of its
+own.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import threading
+from typing import Any, override
+
+from mktech.validate import ensure_type
+
+from mortar.config import config
+from mortar.image import Image
+
+from .backend import (
+    OCRBackend,
+    get_backend,
+    register,
+    tess_args,
+    traineddata,
+)
+
+# Values of the OcrEngineMode and PageSegMode enumerations of the C API,
+# matching the --oem and --psm options of the command line.
+
+_oem_lstm_only = 1
+_psm_auto = 3
+
+# The resolution assumed by the command line for images without one.
+
+_default_resolution = 70
+
+_tsv_header = (
+    'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\t'
+    'left\ttop\twidth\theight\tconf\ttext\n'
+)
+
+_libraries: dict[str, ctypes.CDLL] = {}
+
+
+def load_library(path: str = '') -> ctypes.CDLL:
+    """
+    Load the libtesseract shared library from path, or from the default
+    library search path if path is empty, and return it. Raise OSError if the
+    library isn't found.
+    """
+
+    if path in _libraries:
+        return _libraries[path]
+
+    name = path or ctypes.util.find_library('tesseract')
+
+    if name is None:
+        raise OSError('libtesseract was not found')
+
+    lib = ctypes.CDLL(name)
+
+    handle = ctypes.c_void_p
+    text = ctypes.c_void_p
+
+    functions: dict[str, tuple[Any, list[Any]]] = {
+        'TessVersion': (ctypes.c_char_p, []),
+        'TessBaseAPICreate': (handle, []),
+        'TessBaseAPIDelete': (None, [handle]),
+        'TessBaseAPIEnd': (None, [handle]),
+        'TessBaseAPIInit2': (
+            ctypes.c_int,
+            [handle, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        ),
+        'TessBaseAPISetPageSegMode': (None, [handle, ctypes.c_int]),
+        'TessBaseAPISetImage': (
+            None,
+            [
+                handle,
+                ctypes.c_char_p,
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_int,
+                ctypes.c_int
+            ]
+        ),
+        'TessBaseAPISetSourceResolution': (None, [handle, ctypes.c_int]),
+        'TessBaseAPIGetUTF8Text': (text, [handle]),
+        'TessBaseAPIGetTsvText': (text, [handle, ctypes.c_int]),
+        'TessBaseAPIClear': (None, [handle]),
+        'TessDeleteText': (None, [text]),
+    }
+
+    for function, (restype, argtypes) in functions.items():
+        getattr(lib, function).restype = restype
+        getattr(lib, function).argtypes = argtypes
+
+    _libraries[path] = lib
+
+    return lib
+
+
+class Engine:
+    """
+    A Tesseract engine with the model of language loaded from the tessdata
+    directory data, or the default directory if data is None, in the
+    libtesseract library at library. See load_library for library.
+
+    An engine may only be used by one thread at a time.
+    """
+    def __init__(
+        self, data: str | None, language: str = 'jpn', library: str = ''
+    ) -> None:
+        # The handle is set first, so that an engine which fails to load the
+        # library can still be closed.
+
+        self._handle: int | None = None
+        self._lib: ctypes.CDLL = load_library(library)
+        self._handle = self._lib.TessBaseAPICreate()
+
+        if self._lib.TessBaseAPIInit2(
+            self._handle,
+            None if data is None else data.encode(),
+            language.encode(),
+            _oem_lstm_only
+        ) != 0:
+            self.close()
+
+            raise RuntimeError(
+                f'failed to load Tesseract model {language} from {data}'
+            )
+
+        self._lib.TessBaseAPISetPageSegMode(self._handle, _psm_auto)
+
+    def version(self) -> str:
+        """ Return the version of the library. """
+
+        return self._lib.TessVersion().decode()
+
+    def text(self, image: Image) -> str:
+        """ Recognize an image, and return its OCR text. """
+
+        self._set_image(image)
+
+        try:
+            result = self._take_text(
+                self._lib.TessBaseAPIGetUTF8Text(self._handle)
+            )
+        finally:
+            self._lib.TessBaseAPIClear(self._handle)
+
+        return result
+
+    def structured(self, image: Image) -> tuple[str, str]:
+        """
+        Recognize an image, and return its OCR text and TSV output, like the
+        txt and tsv outputs of the command line.
+        """
+
+        self._set_image(image)
+
+        try:
+            text = self._take_text(
+                self._lib.TessBaseAPIGetUTF8Text(self._handle)
+            )
+            tsv = self._take_text(
+                self._lib.TessBaseAPIGetTsvText(self._handle, 0)
+            )
+        finally:
+            self._lib.TessBaseAPIClear(self._handle)
+
+        return (text, _tsv_header + tsv)
+
+    def close(self) -> None:
+        """ Unload the model, and release the engine. """
+
+        if self._handle is not None:
+            self._lib.TessBaseAPIEnd(self._handle)
+            self._lib.TessBaseAPIDelete(self._handle)
+
+            self._handle = None
+
+    def __del__(self) -> None:
+        self.close()
+
+    def _set_image(self, image: Image) -> None:
+        # The library accepts 8-bit grayscale and 24 or 32-bit color buffers,
+        # and copies them.
+
+        if image.mode not in ['L', 'RGB', 'RGBA']:
+            image = image.convert('RGBA' if 'A' in image.mode else 'L')
+
+        depth = len(image.mode)
+        width, height = image.size
+
+        self._lib.TessBaseAPISetImage(
+            self._handle, image.tobytes(), width, height, depth, width * depth
+        )
+        self._lib.TessBaseAPISetSourceResolution(
+            self._handle, _default_resolution
+        )
+
+    def _take_text(self, pointer: int | None) -> str:
+        if pointer is None:
+            raise RuntimeError('Tesseract failed to recognize the image')
+
+        try:
+            result = ctypes.string_at(pointer).decode()
+        finally:
+            self._lib.TessDeleteText(pointer)
+
+        return result
+
+
+@register
+class CAPIBackend(OCRBackend):
+    """
+    Run Tesseract in-process, through the libtesseract library.
+
+    The library is loaded from tesseract.library in configuration. The
+    tessdata directory is read from the TESSERACT_DATA environment variable,
+    and must be accessible on the local host. It is Tesseract's default
+    directory if the variable is unset.
+    """
+
+    name: str = 'capi'
+
+    def __init__(self) -> None:
+        self.data: str | None = os.environ.get('TESSERACT_DATA')
+        " The tessdata directory, or None for the default directory. "
+
+        self._engines: threading.local = threading.local()
+
+    def engine(self) -> Engine:
+        """ Return the engine of the current thread. """
+
+        engine: Engine | None = getattr(self._engines, 'engine', None)
+
+        if engine is None:
+            engine = Engine(self.data, library=config.tesseract.library)
+
+            self._engines.engine = engine
+
+        return engine
+
+    @override
+    def ocr(self, image: Image) -> str:
+        return self.engine().text(image)
+
+    @override
+    def ocr_structured(self, image: Image) -> tuple[str, str]:
+        return self.engine().structured(image)
+
+    @override
+    def describe(self) -> str:
+        return '\n'.join(
+            [
+                ' '.join(['libtesseract'] + tess_args(self.data)),
+                traineddata(self.data),
+                self.engine().version(),
+            ]
+        )
+
+
+def tesseract_capi(image: Image) -> str:
+    """
+    Generate OCR text from an Image using Tesseract in-process, and return the
+    string.
+
+    The pixels of the image are passed directly to the libtesseract library.
+    Each thread loads the model into its own Engine once, on first use. See
+    CAPIBackend.
+    """
+
+    return _capi().ocr(image)
+
+
+def tesseract_capi_structured(image: Image) -> tuple[str, str]:
+    """
+    Generate OCR text and its structure from an Image using Tesseract
+    in-process. Return the text and Tesseract's TSV output. See
+    tesseract_capi.
+    """
+
+    return _capi().ocr_structured(image)
+
+
+def _capi() -> CAPIBackend:
+    return ensure_type(get_backend('capi'), CAPIBackend)
@@ -0,0 +1,186 @@
+"""
+This module provides a fake OCR backend, which returns stored text without
+running Tesseract.
+
+The fake backend is deterministic, and simulates the cost of Tesseract with a
+configurable latency. It makes it possible to measure the throughput of
+pipelines, batching and caching on any host.
+"""
+
+import os
+import threading
+import time
+from typing import override
+
+from mortar.config import config
+from mortar.image import Image
+
+from .backend import OCRBackend, register
+
+_image_suffixes = ['.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff']
+
+# The confidence of the words of structured output.
+
+_confidence = 95.0
+
+
+@register
+class FakeBackend(OCRBackend):
+    """
+    Return stored text for images, without running Tesseract.
+
+    Texts are keyed by the pixel content of images. They are added with add,
+    or loaded from the directory texts, in which each image file may have a
+    text file with the same name and the suffix .txt. Other images get a text
+    derived from their pixel content.
+
+    Each run sleeps for startup seconds, and for latency seconds per image. A
+    run of several images pays the startup cost once, like a batched
+    Tesseract run. If texts, startup or latency is None, tesseract.fake_texts,
+    tesseract.fake_startup or tesseract.fake_latency in configuration is used.
+    """
+
+    name: str = 'fake'
+
+    def __init__(
+        self,
+        texts: str | None = None,
+        startup: float | None = None,
+        latency: float | None = None
+    ) -> None:
+        self.startup: float = (
+            config.tesseract.fake_startup if startup is None else startup
+        )
+        " The simulated cost of starting a run, in seconds. "
+
+        self.latency: float = (
+            config.tesseract.fake_latency if latency is None else latency
+        )
+        " The simulated cost of recognizing an image, in seconds. "
+
+        self.runs: int = 0
+        " The number of runs. "
+
+        self.images: int = 0
+        " The number of images recognized. "
+
+        self._texts: dict[str, str] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+        if texts is None:
+            texts = config.tesseract.fake_texts
+
+        if texts != '':
+            self.load(texts)
+
+    def add(self, image: Image, text: str) -> None:
+        """ Store the text of an image. """
+
+        with self._lock:
+            self._texts[image.digest()] = text
+
+    def load(self, directory: str) -> None:
+        """
+        Store the texts of the images in directory and its subdirectories,
+        from text files alongside the images.
+        """
+
+        for root, _, names in os.walk(directory):
+            for name in names:
+                stem, suffix = os.path.splitext(name)
+                text_path = f'{root}/{stem}.txt'
+
+                if suffix.lower() not in _image_suffixes or not os.path.exists(
+                    text_path
+                ):
+                    continue
+
+                with open(text_path, 'r') as fi:
+                    self.add(Image.open(f'{root}/{name}'), fi.read())
+
+    def text(self, image: Image) -> str:
+        """ Return the text of an image, without simulating its cost. """
+
+        digest = image.digest()
+
+        with self._lock:
+            result = self._texts.get(digest)
+
+        return f'fake {digest[:16]}\n' if result is None else result
+
+    @override
+    def ocr(self, image: Image) -> str:
+        self._run(1)
+
+        return self.text(image)
+
+    @override
+    def ocr_path(self, path: str) -> str:
+        return self.ocr_paths([path])[0]
+
+    @override
+    def ocr_paths(self, paths: list[str]) -> list[str]:
+        self._run(len(paths))
+
+        return [self.text(Image.open(it)) for it in paths]
+
+    @override
+    def ocr_images(self, images: list[Image]) -> list[str]:
+        self._run(len(images))
+
+        return [self.text(it) for it in images]
+
+    @override
+    def ocr_structured(self, image: Image) -> tuple[str, str]:
+        self._run(1)
+
+        text = self.text(image)
+
+        return (text, self._tsv(text, image.size))
+
+    @override
+    def describe(self) -> str:
+        return self.name
+
+    def _run(self, count: int) -> None:
+        with self._lock:
+            self.runs += 1
+            self.images += count
+
+        time.sleep(self.startup + self.latency * count)
+
+    @staticmethod
+    def _tsv(text: str, size: tuple[int, int]) -> str:
+        """
+        Return TSV output describing text, with its lines spread evenly over
+        the height of an image of the given size, and each word of a line over
+        its width.
+        """
+
+        width, height = size
+
+        lines = [it.split() for it in text.splitlines() if it.strip() != '']
+        line_height = height // max(len(lines), 1)
+
+        rows = [
+            'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\t'
+            'left\ttop\twidth\theight\tconf\ttext'
+        ]
+
+        for line_index, words in enumerate(lines):
+            top = line_index * line_height
+            word_width = width // len(words)
+
+            rows.append(
+                f'4\t1\t1\t1\t{line_index + 1}\t0\t0\t{top}\t{width}\t'
+                f'{line_height}\t-1\t'
+            )
+
+            for word_index, word in enumerate(words):
+                rows.append(
+                    f'5\t1\t1\t1\t{line_index + 1}\t{word_index + 1}\t'
+                    f'{word_index * word_width}\t{top}\t{word_width}\t'
+                    f'{line_height}\t{_confidence}\t{word}'
+                )
+
+        return '\n'.join(rows) + '\n'
@@ -0,0 +1,221 @@
+"""
+This module provides a persistent index of OCR results by perceptual hash.
+
+Each result is stored with the 64-bit difference hash of the image it was
+read from. A lookup finds a result whose hash is within a Hamming distance of
+a given hash, so that the text of an image which is nearly identical to one
+OCRed before can be reused.
+
+Results are stored in scopes, such as the OCR engine and the size of the
+image, and a lookup only finds results of its own scope. Each result also
+stores the digest of the pixel content of its image, so that a lookup may
+confirm that the image is the same, rather than nearly identical.
+
+Lookups use multi-index hashing. Each hash is split into 4 chunks of 16 bits,
+which are indexed separately. Two hashes within a distance of d bits differ
+in at most d // 4 bits of at least one chunk, so candidates are found by
+looking up the chunks of the given hash, and their neighbours within that many
+bits, in the indexes. Only the candidates are compared in full. Up to a
+distance of 3, only exact chunks are looked up.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+
+from mktech.path import Path, PathInput
+
+from mortar.config import config
+
+_chunks = 4
+_chunk_bits = 16
+_chunk_mask = (1 << _chunk_bits) - 1
+
+# The number of chunk neighbours grows quickly with the distance, so lookups
+# are limited to a distance at which each chunk has at most 137 neighbours.
+
+_max_distance = 3 * _chunks - 1
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS entries (
+    scope TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    c0 INTEGER NOT NULL,
+    c1 INTEGER NOT NULL,
+    c2 INTEGER NOT NULL,
+    c3 INTEGER NOT NULL,
+    PRIMARY KEY (scope, hash, digest)
+);
+CREATE INDEX IF NOT EXISTS entries_c0 ON entries (scope, c0);
+CREATE INDEX IF NOT EXISTS entries_c1 ON entries (scope, c1);
+CREATE INDEX IF NOT EXISTS entries_c2 ON entries (scope, c2);
+CREATE INDEX IF NOT EXISTS entries_c3 ON entries (scope, c3);
+'''
+
+
+def _split(hash: int) -> list[int]:
+    return [
+        (hash >> (it * _chunk_bits)) & _chunk_mask for it in range(0, _chunks)
+    ]
+
+
+def _signed(hash: int) -> int:
+    # SQLite integers are signed 64-bit values.
+
+    return hash - (1 << 64) if hash >= 1 << 63 else hash
+
+
+def _neighbours(chunk: int, radius: int) -> list[int]:
+    """ Return the chunks which differ from chunk in at most radius bits. """
+
+    result: list[int] = []
+
+    for count in range(0, radius + 1):
+        for bits in itertools.combinations(range(0, _chunk_bits), count):
+            result.append(chunk ^ sum(1 << it for it in bits))
+
+    return result
+
+
+class OCRIndex:
+    """
+    A persistent index of OCR results by the difference hash of their images,
+    stored in an SQLite database at path. If path is None, the database is
+    stored under config.data.
+
+    The index may be shared by threads and processes.
+    """
+    def __init__(self, path: PathInput | None = None) -> None:
+        self.path: Path = (
+            Path(config.data, 'cache', 'ocr_index.sqlite3')
+            if path is None else Path(path)
+        )
+        " The path of the database file. "
+
+        os.makedirs(self.path.parent, exist_ok=True)
+
+        self._lock: threading.Lock = threading.Lock()
+
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+
+        with self._lock, self._connection:
+            _ = self._connection.execute('PRAGMA journal_mode=WAL')
+            _ = self._connection.executescript(_schema)
+
+    def __len__(self) -> int:
+        with self._lock:
+            row: tuple[int] = self._connection.execute(
+                'SELECT count(*) FROM entries'
+            ).fetchone()
+
+        return row[0]
+
+    def get(
+        self,
+        hash: int,
+        max_distance: int = 0,
+        scope: str = '',
+        digest: str | None = None
+    ) -> str | None:
+        """
+        Return the result in scope whose hash is nearest to hash, if it is
+        within max_distance bits. Otherwise, return None.
+
+        If digest is not None, only a result read from an image with that
+        digest is returned.
+        """
+
+        result = self.nearest(hash, max_distance, scope, digest)
+
+        return None if result is None else result[1]
+
+    def nearest(
+        self,
+        hash: int,
+        max_distance: int,
+        scope: str = '',
+        digest: str | None = None
+    ) -> tuple[int, str] | None:
+        """
+        Return the distance and the result in scope whose hash is nearest to
+        hash, if it is within max_distance bits. Otherwise, return None.
+
+        If digest is not None, only a result read from an image with that
+        digest is returned.
+        """
+
+        if not 0 <= max_distance <= _max_distance:
+            raise ValueError(
+                f'max_distance must be from 0 to {_max_distance}'
+            )
+
+        radius = max_distance // _chunks
+
+        queries: list[str] = []
+        args: list[int | str] = []
+
+        for index, chunk in enumerate(_split(hash)):
+            values = _neighbours(chunk, radius)
+
+            query = (
+                f'SELECT hash, text FROM entries WHERE scope = ? AND c{index}'
+                f' IN ({", ".join("?" * len(values))})'
+            )
+
+            args.append(scope)
+            args.extend(values)
+
+            if digest is not None:
+                query += ' AND digest = ?'
+
+                args.append(digest)
+
+            queries.append(query)
+
+        with self._lock:
+            rows: list[tuple[int, str]] = self._connection.execute(
+                ' UNION '.join(queries), args
+            ).fetchall()
+
+        result: tuple[int, str] | None = None
+
+        for row_hash, text in rows:
+            distance = ((row_hash & (1 << 64) - 1) ^ hash).bit_count()
+
+            if distance <= max_distance and (
+                result is None or distance < result[0]
+            ):
+                result = (distance, text)
+
+        return result
+
+    def put(
+        self, hash: int, text: str, scope: str = '', digest: str = ''
+    ) -> None:
+        """
+        Store the result read from an image with the given hash and digest, in
+        scope.
+        """
+
+        with self._lock, self._connection:
+            _ = self._connection.execute(
+                'INSERT OR REPLACE INTO entries'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (scope, digest, _signed(hash), text, *_split(hash))
+            )
+
+    def clear(self) -> None:
+        """ Remove all results. """
+
+        with self._lock, self._connection:
+            _ = self._connection.execute('DELETE FROM entries')
+
+    def close(self) -> None:
+        """ Close the database. """
+
+        self._connection.close()
@@ -0,0 +1,258 @@
+"""
+This module provides OCR backends which run a Tesseract process on the local
+host.
+
+The 'wsl' backend runs the Windows build of Tesseract from WSL, making the
+path manipulations this requires. The 'native' backend runs a Tesseract
+installed on a Linux host.
+"""
+
+import os
+from tempfile import mkstemp
+from typing import override
+
+from mktech.validate import ensure_type
+
+import mortar.process as process
+from mortar.image import Image
+from mortar.path import win_from_wsl
+from mortar.util import mktemp
+
+from .backend import (
+    OCRBackend,
+    decode,
+    encode,
+    encode_pages,
+    get_backend,
+    register,
+    split_pages,
+    structured_args,
+    tess_args,
+    traineddata,
+)
+
+
+class ProcessBackend(OCRBackend):
+    """
+    Base class of backends which run a local Tesseract process, with the
+    executable command and the tessdata directory data.
+    """
+    def __init__(self, command: str, data: str | None) -> None:
+        self.command: str = command
+        " The Tesseract executable. "
+
+        self.data: str | None = data
+        " The tessdata directory, or None for the default directory. "
+
+    def cmd(self) -> list[str]:
+        """ Return the Tesseract command line, without inputs and outputs. """
+
+        return [self.command] + tess_args(self.data)
+
+    @override
+    def ocr(self, image: Image) -> str:
+        return self.ocr_encoded(encode(image))
+
+    def ocr_encoded(self, data: bytes) -> str:
+        """
+        Generate OCR text from an encoded image, and return the string.
+
+        The image is written to Tesseract's standard input, and the text is
+        read from its standard output.
+        """
+
+        result = process.run(self.cmd() + ['stdin', 'stdout'], input=data)
+
+        return decode(result.stdout)
+
+    @override
+    def ocr_path(self, path: str) -> str:
+        result = process.run(self.cmd() + [self._path(path), 'stdout'])
+
+        return decode(result.stdout)
+
+    @override
+    def ocr_paths(self, paths: list[str]) -> list[str]:
+        if len(paths) == 0:
+            return []
+
+        list_path = self._temp(suffix='.txt')
+
+        try:
+            with open(list_path, 'w') as fo:
+                _ = fo.write(''.join(f'{self._path(it)}\n' for it in paths))
+
+            result = process.run(
+                self.cmd() + [self._path(list_path), 'stdout']
+            )
+        finally:
+            os.remove(list_path)
+
+        return split_pages(decode(result.stdout), len(paths))
+
+    @override
+    def ocr_images(self, images: list[Image]) -> list[str]:
+        if len(images) == 0:
+            return []
+
+        text = self.ocr_encoded(encode_pages(images))
+
+        return split_pages(text, len(images))
+
+    @override
+    def ocr_structured(self, image: Image) -> tuple[str, str]:
+        return self.ocr_structured_encoded(encode(image))
+
+    def ocr_structured_encoded(self, data: bytes) -> tuple[str, str]:
+        """
+        Generate OCR text and its structure from an encoded image in a single
+        run. Return the text and Tesseract's TSV output.
+        """
+
+        out_stem = self._temp()
+        out_paths = [f'{out_stem}.txt', f'{out_stem}.tsv']
+
+        try:
+            _ = process.run(
+                self.cmd() + structured_args +
+                ['stdin', self._path(out_stem)],
+                input=data
+            )
+
+            with open(out_paths[0], 'r') as fi:
+                text = fi.read()
+
+            with open(out_paths[1], 'r') as fi:
+                tsv = fi.read()
+        finally:
+            for it in [out_stem] + out_paths:
+                if os.path.exists(it):
+                    os.remove(it)
+
+        return (text, tsv)
+
+    @override
+    def describe(self) -> str:
+        version = process.run([self.command, '--version'])
+
+        return '\n'.join(
+            [
+                ' '.join(self.cmd()),
+                traineddata(self.data),
+                decode(version.stdout + version.stderr).split('\n')[0],
+            ]
+        )
+
+    def _path(self, path: str) -> str:
+        """ Return a local path as seen by the Tesseract process. """
+
+        return path
+
+    def _temp(self, suffix: str = '') -> str:
+        """
+        Make a temporary file accessible to the Tesseract process, and return
+        its path.
+        """
+
+        fd, result = mkstemp(suffix)
+
+        os.close(fd)
+
+        return result
+
+
+@register
+class WSLBackend(ProcessBackend):
+    """
+    Run the Windows build of Tesseract from WSL.
+
+    The executable and the tessdata directory are read from the TESSERACT and
+    TESSERACT_DATA environment variables.
+    """
+
+    name: str = 'wsl'
+
+    def __init__(self) -> None:
+        super().__init__(
+            os.environ['TESSERACT'], os.environ['TESSERACT_DATA']
+        )
+
+    @override
+    def _path(self, path: str) -> str:
+        return win_from_wsl(path)
+
+    @override
+    def _temp(self, suffix: str = '') -> str:
+        return mktemp(suffix=suffix)
+
+
+@register
+class NativeBackend(ProcessBackend):
+    """
+    Run Tesseract installed on a Linux host.
+
+    The executable is read from the TESSERACT environment variable, and is
+    'tesseract' if it is unset. The tessdata directory is read from the
+    TESSERACT_DATA environment variable, and is Tesseract's default directory
+    if it is unset.
+    """
+
+    name: str = 'native'
+
+    def __init__(self) -> None:
+        super().__init__(
+            os.environ.get('TESSERACT', 'tesseract'),
+            os.environ.get('TESSERACT_DATA')
+        )
+
+
+def _wsl() -> WSLBackend:
+    return ensure_type(get_backend('wsl'), WSLBackend)
+
+
+def tesseract_wsl(path_: str) -> str:
+    """
+    Generate OCR text from an image using Tesseract, and return the string.
+
+    This function assumes that the module is running in a WSL environment.
+    When building the command line, it makes the path manipulations required to
+    run Windows executables from WSL.
+    """
+
+    return _wsl().ocr_path(path_)
+
+
+def tesseract_wsl_list(paths: list[str]) -> list[str]:
+    """
+    Generate OCR text from several images using a single Tesseract run, and
+    return a string for each image.
+
+    Like tesseract_wsl, this function assumes that the module is running in a
+    WSL environment.
+    """
+
+    return _wsl().ocr_paths(paths)
+
+
+def tesseract_wsl_stdin(data: bytes) -> str:
+    """
+    Generate OCR text from an encoded image using Tesseract, and return the
+    string.
+
+    The image is written to Tesseract's standard input, and the text is read
+    from its standard output.
+    """
+
+    return _wsl().ocr_encoded(data)
+
+
+def tesseract_wsl_structured(data: bytes) -> tuple[str, str]:
+    """
+    Generate OCR text and its structure from an encoded image using Tesseract.
+    Return the text and Tesseract's TSV output.
+
+    Both outputs are generated by a single run. Like tesseract_wsl, this
+    function assumes that the module is running in a WSL environment.
+    """
+
+    return _wsl().ocr_structured_encoded(data)
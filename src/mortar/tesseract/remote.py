@@ -0,0 +1,248 @@
+"""
+This module provides the OCR backend which runs Tesseract on remote hosts over
+SSH connections.
+
+Jobs are spread between the hosts defined in configuration by a shared
+Balancer. Each job runs in a directory of its own on the remote host, so jobs
+may run concurrently.
+"""
+
+import io
+import os
+import shlex
+import tarfile
+import threading
+import uuid
+from pathlib import PurePath
+from typing import override
+
+from mortar.config import SSHHost, config
+from mortar.image import Image
+
+from .backend import (
+    OCRBackend,
+    decode,
+    encode,
+    encode_pages,
+    register,
+    split_pages,
+    structured_args,
+    traineddata,
+)
+from .balance import Balancer
+
+# The temporary directory of the remote host, as seen by Tesseract and by the
+# remote shell.
+
+_remote_temp_win = 'C:/Windows/Temp'
+_remote_temp_nix = '/mnt/c/Windows/Temp'
+
+
+def _tess_ssh_cmd() -> str:
+    """ Return the command line of Tesseract on a remote host. """
+
+    return (
+        f"{os.environ['TESSERACT']}"
+        f" -l jpn --tessdata-dir {shlex.quote(os.environ['TESSERACT_DATA'])}"
+    )
+
+
+def _remote_job() -> tuple[str, str]:
+    """
+    Return the paths of a new directory on the remote host, unique to a job, as
+    seen by Tesseract and quoted for the remote shell.
+    """
+
+    job = f'mortar-{uuid.uuid4().hex}'
+
+    return (
+        f'{_remote_temp_win}/{job}',
+        shlex.quote(f'{_remote_temp_nix}/{job}')
+    )
+
+
+_balancer: Balancer | None = None
+_balancer_lock = threading.Lock()
+
+
+def _shared_balancer() -> Balancer:
+    global _balancer
+
+    with _balancer_lock:
+        if _balancer is None:
+            hosts = config.ssh.hosts or [
+                SSHHost(host=config.ssh.host, port=config.ssh.port)
+            ]
+
+            _balancer = Balancer(hosts, multiplex=config.ssh.multiplex)
+
+    return _balancer
+
+
+@register
+class SSHBackend(OCRBackend):
+    """
+    Run Tesseract on the remote hosts defined in configuration.
+
+    The executable and the tessdata directory on the remote hosts are read
+    from the TESSERACT and TESSERACT_DATA environment variables.
+    """
+
+    name: str = 'ssh'
+
+    @override
+    def ocr(self, image: Image) -> str:
+        return tesseract_ssh_stdin(encode(image))
+
+    @override
+    def ocr_path(self, path: str) -> str:
+        return tesseract_ssh(path)
+
+    @override
+    def ocr_paths(self, paths: list[str]) -> list[str]:
+        return tesseract_ssh_list(paths)
+
+    @override
+    def ocr_images(self, images: list[Image]) -> list[str]:
+        if len(images) == 0:
+            return []
+
+        text = tesseract_ssh_stdin(encode_pages(images))
+
+        return split_pages(text, len(images))
+
+    @override
+    def ocr_structured(self, image: Image) -> tuple[str, str]:
+        return tesseract_ssh_structured(encode(image))
+
+    @override
+    def describe(self) -> str:
+        balancer = _shared_balancer()
+
+        command = ' '.join(
+            [f'{it.host}:{it.port}' for it in balancer.hosts] +
+            [_tess_ssh_cmd()]
+        )
+        version = balancer.run(
+            lambda ssh: ssh.run([f"{os.environ['TESSERACT']} --version"])
+        )
+
+        return '\n'.join(
+            [
+                command,
+                traineddata(os.environ['TESSERACT_DATA']),
+                decode(version.stdout + version.stderr).split('\n')[0],
+            ]
+        )
+
+    @override
+    def concurrency(self) -> int | None:
+        return _shared_balancer().capacity
+
+
+def tesseract_ssh(path_: str) -> str:
+    """
+    Generate OCR text from an image using Tesseract, and return the string.
+
+    Tesseract is executed on one of the remote hosts defined in
+    configuration.
+    """
+
+    return tesseract_ssh_list([path_])[0]
+
+
+def tesseract_ssh_list(paths: list[str]) -> list[str]:
+    """
+    Generate OCR text from several images using a single Tesseract run on one
+    of the remote hosts defined in configuration, and return a string for each
+    image.
+
+    The images are sent to the remote host in a single archive over the SSH
+    connection, and extracted into a directory unique to the job. The text of
+    all the images is read from Tesseract's standard output. The directory is
+    removed when Tesseract exits, so jobs may run concurrently.
+    """
+
+    if len(paths) == 0:
+        return []
+
+    dir_win, dir_nix = _remote_job()
+
+    names = [
+        f'{index}{PurePath(it).suffix}' for index, it in enumerate(paths)
+    ]
+    list_data = ''.join(f'{dir_win}/{it}\n' for it in names).encode()
+
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for path, name in zip(paths, names):
+            archive.add(path, arcname=name)
+
+        info = tarfile.TarInfo('list.txt')
+        info.size = len(list_data)
+
+        archive.addfile(info, io.BytesIO(list_data))
+
+    list_path = shlex.quote(f'{dir_win}/list.txt')
+
+    script = (
+        f'mkdir {dir_nix} && tar -x -f - -C {dir_nix}'
+        f' && {_tess_ssh_cmd()} {list_path} stdout;'
+        f' status=$?; rm -rf {dir_nix}; exit $status'
+    )
+
+    result = _shared_balancer().run(
+        lambda ssh: ssh.run([script], input=buffer.getvalue())
+    )
+
+    return split_pages(decode(result.stdout), len(paths))
+
+
+def tesseract_ssh_stdin(data: bytes) -> str:
+    """
+    Generate OCR text from an encoded image using Tesseract, and return the
+    string.
+
+    Tesseract is executed on one of the remote hosts defined in configuration.
+    The image is sent to its standard input over the SSH connection, and the
+    text is read from its standard output.
+    """
+
+    tess_cmd = f'{_tess_ssh_cmd()} stdin stdout'
+
+    result = _shared_balancer().run(
+        lambda ssh: ssh.run([tess_cmd], input=data)
+    )
+
+    return decode(result.stdout)
+
+
+def tesseract_ssh_structured(data: bytes) -> tuple[str, str]:
+    """
+    Generate OCR text and its structure from an encoded image using Tesseract.
+    Return the text and Tesseract's TSV output.
+
+    Tesseract is executed on one of the remote hosts defined in configuration.
+    Both outputs are generated by a single run.
+    """
+
+    dir_win, dir_nix = _remote_job()
+
+    out_stem = shlex.quote(f'{dir_win}/out')
+    tess_cmd = ' '.join([_tess_ssh_cmd()] + structured_args)
+
+    # The outputs are written to the standard output, separated by a null
+    # character.
+
+    script = (
+        f'mkdir {dir_nix} && {tess_cmd} stdin {out_stem}'
+        f' && cat {dir_nix}/out.txt && printf "\\0" && cat {dir_nix}/out.tsv;'
+        f' status=$?; rm -rf {dir_nix}; exit $status'
+    )
+
+    result = _shared_balancer().run(lambda ssh: ssh.run([script], input=data))
+
+    text, tsv = decode(result.stdout).split('\0', 1)
+
+    return (text, tsv)
@@ -0,0 +1,138 @@
+"""
+This module provides the structure of OCR text: the lines and words found by
+Tesseract, with their bounding boxes and confidences.
+
+The structure is parsed from the TSV output of Tesseract, which is generated
+by the same run as the text.
+"""
+
+from typing import override
+
+type Box = tuple[int, int, int, int]
+" A bounding box, as (left, top, width, height) in pixels. "
+
+# The level of TSV rows which describe lines and words.
+
+_line_level = 4
+_word_level = 5
+
+
+class Word:
+    """ A word of OCR text. """
+    def __init__(self, text: str, box: Box, confidence: float) -> None:
+        self.text: str = text
+        " The text of the word. "
+
+        self.box: Box = box
+        " The bounding box of the word. "
+
+        self.confidence: float = confidence
+        " Tesseract's confidence in the word, from 0 to 100. "
+
+    @override
+    def __repr__(self) -> str:
+        return f'Word({self.text!r}, {self.box}, {self.confidence})'
+
+
+class Line:
+    """ A line of OCR text. """
+    def __init__(self, box: Box, words: list[Word] | None = None) -> None:
+        self.box: Box = box
+        " The bounding box of the line. "
+
+        self.words: list[Word] = [] if words is None else words
+        " The words of the line. "
+
+    @property
+    def text(self) -> str:
+        """ The text of the line, with its words separated by spaces. """
+
+        return ' '.join(it.text for it in self.words)
+
+    @property
+    def confidence(self) -> float:
+        """
+        The mean confidence of the words of the line, or 0 if it has no words.
+        """
+
+        if len(self.words) == 0:
+            return 0.0
+
+        return sum(it.confidence for it in self.words) / len(self.words)
+
+    def rect(self) -> tuple[int, int, int, int]:
+        """
+        Return the bounding box of the line as (x1, y1, x2, y2), for use with
+        Image.crop.
+        """
+
+        left, top, width, height = self.box
+
+        return (left, top, left + width, top + height)
+
+    @override
+    def __repr__(self) -> str:
+        return f'Line({self.box}, {self.words})'
+
+
+class OCRText(str):
+    """
+    OCR text, together with the lines and words it was read from.
+
+    An OCRText is a str, so it may be used wherever plain OCR text is.
+    """
+
+    lines: list[Line]
+    " The lines of the text, in reading order. "
+
+    def __new__(cls, text: str, lines: list[Line] | None = None) -> 'OCRText':
+        result = super().__new__(cls, text)
+
+        result.lines = [] if lines is None else lines
+
+        return result
+
+    @property
+    def words(self) -> list[Word]:
+        """ The words of the text, in reading order. """
+
+        return [word for line in self.lines for word in line.words]
+
+
+def parse_tsv(tsv: str) -> list[Line]:
+    """
+    Parse the TSV output of Tesseract, and return the lines of text it
+    describes. Lines without any words are omitted.
+    """
+
+    result: list[Line] = []
+    lines: dict[tuple[str, ...], Line] = {}
+
+    for row in tsv.splitlines()[1:]:
+        fields = row.split('\t')
+
+        if len(fields) < 11:
+            continue
+
+        level = int(fields[0])
+        key = tuple(fields[1:5])
+
+        box = (
+            int(fields[6]), int(fields[7]), int(fields[8]), int(fields[9])
+        )
+
+        if level == _line_level:
+            line = Line(box)
+
+            lines[key] = line
+
+            result.append(line)
+        elif level == _word_level:
+            text = fields[11].strip() if len(fields) > 11 else ''
+
+            if text == '' or key not in lines:
+                continue
+
+            lines[key].words.append(Word(text, box, float(fields[10])))
+
+    return [it for it in result if len(it.words) > 0]
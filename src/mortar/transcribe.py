@@ -0,0 +1,339 @@
+"""
+This module transcribes the dialog of a video into timestamped captions.
+
+A Transcriber decodes the frames of a video through a FrameReader, and passes
+only the frames at which the dialog changes to an OCR pipeline. Frames are
+decoded, compared and OCRed concurrently, and captions are yielded as soon as
+the dialog moves on, so that a transcript can be written while the video is
+still being read.
+"""
+
+import json
+import os
+import runpy
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import override
+
+from mktech.path import PathInput
+
+from mortar.config import VideoProfile
+from mortar.pipeline import OCR, Dedup, Filter, Pipeline, Refine, Retention
+from mortar.video import (
+    Frame,
+    FrameReader,
+    changes,
+    profile_filters,
+)
+
+# The default rate at which frames are sampled, in frames per second.
+
+_default_rate = 10.0
+
+# The default time for which dialog must stay unchanged before it is OCRed,
+# in seconds.
+
+_default_settle = 0.25
+
+
+class Caption:
+    """ A line of dialog shown in a video. """
+    def __init__(
+        self, index: int, start: float, end: float, text: str
+    ) -> None:
+        self.index: int = index
+        " The position of the caption in the transcript. "
+
+        self.start: float = start
+        " The time at which the dialog is first shown, in seconds. "
+
+        self.end: float = end
+        " The time at which the dialog stops being shown, in seconds. "
+
+        self.text: str = text
+        " The OCR text of the dialog. "
+
+    def to_json(self) -> str:
+        """ Return the caption as a single line of JSON. """
+
+        return json.dumps(
+            {
+                'index': self.index,
+                'start': round(self.start, 3),
+                'end': round(self.end, 3),
+                'text': self.text
+            },
+            ensure_ascii=False
+        )
+
+    def to_srt(self) -> str:
+        """ Return the caption as an entry of an SRT subtitle file. """
+
+        return (
+            f'{self.index + 1}\n'
+            f'{_srt_time(self.start)} --> {_srt_time(self.end)}\n'
+            f'{self.text}\n'
+        )
+
+    @override
+    def __repr__(self) -> str:
+        return (
+            f'Caption({self.index}, {self.start}, {self.end}, {self.text!r})'
+        )
+
+
+def _srt_time(seconds: float) -> str:
+    milliseconds = round(seconds * 1000)
+
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds_, milliseconds = divmod(milliseconds, 1000)
+
+    return f'{hours:02}:{minutes:02}:{seconds_:02},{milliseconds:03}'
+
+
+class Stats:
+    """ Throughput statistics of a transcription. """
+    def __init__(self) -> None:
+        self.frames: int = 0
+        " The number of frames read from the video. "
+
+        self.ocr_runs: int = 0
+        " The number of frames passed to the OCR pipeline. "
+
+        self.captions: int = 0
+        " The number of captions yielded. "
+
+        self.duration: float = 0.0
+        " The time of the last frame read, in seconds of video. "
+
+        self.elapsed: float = 0.0
+        " The time taken by the transcription, in seconds. "
+
+    @property
+    def frame_rate(self) -> float:
+        """ The number of frames read per second. """
+
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def ocr_rate(self) -> float:
+        """ The number of OCR pipeline runs per second. """
+
+        return self.ocr_runs / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def speed(self) -> float:
+        """ The number of seconds of video transcribed per second. """
+
+        return self.duration / self.elapsed if self.elapsed > 0 else 0.0
+
+    @override
+    def __str__(self) -> str:
+        return (
+            f'{self.frames} frames, {self.ocr_runs} OCR runs and'
+            f' {self.captions} captions in {self.elapsed:.1f} s:'
+            f' {self.frame_rate:.1f} frames/s, {self.ocr_rate:.1f} OCR runs/s,'
+            f' {self.speed:.1f}x real time'
+        )
+
+
+def load_pipeline(path: PathInput) -> Pipeline:
+    """
+    Return the pipeline defined by the Python file at path, as its module-level
+    variable named pipeline. Raise ValueError if it doesn't define one.
+    """
+
+    result = runpy.run_path(str(path)).get('pipeline')
+
+    if not isinstance(result, Pipeline):
+        raise ValueError(f'{path} does not define a Pipeline named pipeline')
+
+    return result
+
+
+def _reads_text(stage: Filter) -> bool:
+    """ Return True if stage generates the text of its input image. """
+
+    if isinstance(stage, Dedup):
+        return _reads_text(stage.inner)
+
+    return isinstance(stage, OCR | Refine)
+
+
+class Transcriber:
+    """
+    Transcribe the dialog of videos into Captions.
+
+    Frames are sampled at rate frames per second, and cropped, scaled and
+    converted as described by profile. A frame is passed to pipeline only when
+    the content of region, a box (left, top, right, bottom) in the converted
+    frames, has changed and then stayed unchanged for settle seconds. See
+    video.changes. If region is None, the whole frame is compared.
+
+    pipeline must contain a stage which reads text, such as OCR, Refine, or
+    Dedup wrapping either of them. If it is None, the pipeline defined
+    by the file named by profile.pipeline is used if it is set, and a pipeline
+    of a single OCR stage otherwise.
+
+    Up to jobs frames are OCRed concurrently, each by a copy of the pipeline.
+    If jobs is None, one job per CPU is used.
+    """
+    def __init__(
+        self,
+        pipeline: Pipeline | None = None,
+        profile: VideoProfile | None = None,
+        region: tuple[int, int, int, int] | None = None,
+        rate: float = _default_rate,
+        settle: float = _default_settle,
+        jobs: int | None = None
+    ) -> None:
+        if pipeline is None:
+            if profile is not None and profile.pipeline != '':
+                pipeline = load_pipeline(profile.pipeline)
+            else:
+                pipeline = Pipeline()
+
+                pipeline.add(OCR())
+
+        if not any(_reads_text(it) for it in pipeline.stages):
+            raise ValueError('a transcription pipeline must contain OCR')
+
+        self.pipeline: Pipeline = pipeline
+        " The pipeline which generates the text of a frame. "
+
+        self.profile: VideoProfile | None = profile
+        " The conversion applied to frames as they are decoded. "
+
+        self.region: tuple[int, int, int, int] | None = region
+        " The box of the frames in which dialog is shown. "
+
+        self.rate: float = rate
+        " The rate at which frames are sampled, in frames per second. "
+
+        self.settle: float = settle
+        " The time for which dialog must stay unchanged, in seconds. "
+
+        self.jobs: int = jobs or os.cpu_count() or 1
+        " The number of frames OCRed concurrently. "
+
+        self.stats: Stats = Stats()
+        " The statistics of the last transcription. "
+
+        self._local: threading.local = threading.local()
+
+    def run(self, path: PathInput) -> Iterator[Caption]:
+        """
+        Transcribe the video file at path, and yield its Captions in order.
+
+        A caption is yielded once the dialog following it has been OCRed, so
+        that its end time is known. Consecutive frames with the same text are
+        merged into one caption, and frames without text end the caption
+        before them.
+        """
+
+        self.stats = Stats()
+
+        start_time = time.perf_counter()
+
+        reader = FrameReader(
+            path,
+            rate=self.rate,
+            filters=profile_filters(self.profile),
+            gray=self.profile is not None and self.profile.gray
+        )
+
+        caption: Caption | None = None
+        index = 0
+
+        try:
+            for frame, text in self._ocr(reader):
+                self.stats.ocr_runs += 1
+
+                if caption is not None and text == caption.text:
+                    continue
+
+                if caption is not None:
+                    caption.end = frame.timestamp
+
+                    yield self._emit(caption, start_time)
+
+                    caption = None
+                    index += 1
+
+                if text != '':
+                    caption = Caption(
+                        index, frame.timestamp, frame.timestamp, text
+                    )
+
+            if caption is not None:
+                caption.end = self.stats.duration + 1 / self.rate
+
+                yield self._emit(caption, start_time)
+        finally:
+            reader.close()
+
+            self.stats.elapsed = time.perf_counter() - start_time
+
+    def _emit(self, caption: Caption, start_time: float) -> Caption:
+        self.stats.captions += 1
+        self.stats.elapsed = time.perf_counter() - start_time
+
+        return caption
+
+    def _frames(self, reader: FrameReader) -> Iterator[Frame]:
+        """ Yield the frames of reader, counting them. """
+
+        for it in reader:
+            self.stats.frames += 1
+            self.stats.duration = it.timestamp
+
+            yield it
+
+    def _ocr(self, reader: FrameReader) -> Iterator[tuple[Frame, str]]:
+        """
+        Yield each changed frame of reader with its text, in order. Frames are
+        OCRed concurrently, with at most twice as many frames in flight as
+        jobs.
+        """
+
+        pending: deque[tuple[Frame, Future[str]]] = deque()
+
+        with ThreadPoolExecutor(self.jobs) as executor:
+            for frame in changes(
+                self._frames(reader), self.region, settle=self.settle
+            ):
+                pending.append((frame, executor.submit(self._text, frame)))
+
+                while len(pending) > 2 * self.jobs or (
+                    len(pending) > 0 and pending[0][1].done()
+                ):
+                    frame, future = pending.popleft()
+
+                    yield frame, future.result()
+
+            while len(pending) > 0:
+                frame, future = pending.popleft()
+
+                yield frame, future.result()
+
+    def _text(self, frame: Frame) -> str:
+        """ Return the text of a frame, using this thread's pipeline. """
+
+        pipeline: Pipeline | None = getattr(self._local, 'pipeline', None)
+
+        if pipeline is None:
+            pipeline = self.pipeline.copy()
+
+            self._local.pipeline = pipeline
+
+        output = pipeline.run(frame.image, retention=Retention.FINAL)
+        result = output.stages[-1].data  # pyright: ignore[reportAny]
+
+        if isinstance(result, list):
+            result = '\n'.join(str(it) for it in result if it is not None)  # pyright: ignore[reportUnknownVariableType] # noqa: E501
+
+        return str(result or '').strip()
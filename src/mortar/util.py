@@ -3,8 +3,8 @@ This module provides miscellaneous utilities that don't obviously fit into
 other existing modules.
 """
 
+import os
 import platform
-import time
 from os import PathLike
 from os.path import isfile
 from tempfile import mkstemp
@@ -36,22 +36,18 @@ def mktemp(
     Make a temporary file, taking the host system into account.
 
     If the host system is WSL, the file is created in the global Windows
-    temporary directory.
+    temporary directory, so that it is accessible to Windows processes.
 
-    Otherwise, this function delegates to tempfile.mkstemp. args and kwargs are
-    passed through.
+    This function delegates to tempfile.mkstemp, so the name of the file is
+    unique, and safe to use from concurrent threads and processes. args and
+    kwargs are passed through. The file is closed, and its path is returned.
     """
 
     if system() == 'wsl':
-        now = time.time()
+        dir = _windows_temp
 
-        if suffix is None:
-            suffix = ''
+    fd, output_path = mkstemp(suffix, prefix, dir, **kwargs)  # pyright: ignore[reportAny] # noqa: E501
 
-        output_path = f'{_windows_temp}/{now}{suffix}'
-
-        _ = open(output_path, 'w')
-    else:
-        _, output_path = mkstemp(suffix, prefix, dir, **kwargs)  # pyright: ignore[reportAny] # noqa: E501
+    os.close(fd)
 
     return output_path
@@ -1,12 +1,75 @@
 """
 This module extracts screenshots from a collection of video files.
+
+extract_frames writes frames of the videos to image files, running several
+ffmpeg processes at once, and skipping videos it has already extracted. Frames
+may be sampled at a fixed rate, at changes of scene, or at changes of the
+content of a region such as a text box. A VideoProfile in configuration
+crops, scales and converts the frames of a game as ffmpeg decodes them. A
+FrameReader instead decodes the frames of a video into Images in memory,
+through a pipe from ffmpeg, so that they can be passed to a Pipeline without
+touching the disk.
 """
 
-from os import makedirs, walk
+import glob
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from os import PathLike, makedirs, walk
 from pathlib import Path
+from queue import Queue, SimpleQueue
+from subprocess import CalledProcessError
+from tempfile import mkstemp
+from typing import Any, override
+
+import numpy as np
+import numpy.typing as npt
+
+from mortar.config import VideoProfile, config
+from mortar.image import Image
+from mortar.process import Popen, run, start
+
+# showinfo logs a line for each frame passing through it, before the frame is
+# written to the output pipe. A line is searched for the pattern rather than
+# matched, in case other output, such as a progress line ended by a carriage
+# return, precedes it.
+
+_showinfo_pattern = re.compile(
+    r'\[Parsed_showinfo.*\] n: *\d+ .*pts_time:(\S+) .* s:(\d+)x(\d+) '
+)
+
+# The name of the manifest of extracted videos, in the video directory.
+
+_manifest_name = '.mortar-frames.json'
+
+# The file name suffixes of extracted frames.
+
+_suffixes = ['.png', '.pgm', '.ppm']
+
+# The default rate at which frames are sampled for changes of a region, in
+# frames per second.
+
+_change_rate = 10.0
+
+# The fraction of the pixels of a region which must change for the region to
+# have changed, and the change in gray level of a changed pixel.
 
-from mortar.config import config
-from mortar.process import run
+_default_threshold = 0.002
+_tolerance = 32
+
+# The default time for which the content of a region must stay unchanged
+# before it is extracted, in seconds.
+
+_default_settle = 0.25
+
+# The number of lines of ffmpeg's log kept for error reports.
+
+_log_lines = 20
 
 
 def _flatten(entry: tuple[str, list[str], list[str]]) -> list[Path]:
@@ -39,45 +102,611 @@ def _files(input_path: Path | None) -> list[Path]:
     return flat_files
 
 
-def extract_frames(input_path: Path | None = None) -> int:
+def profile_filters(profile: VideoProfile | None) -> list[str]:
+    """
+    Return the ffmpeg video filters which crop, scale and convert frames as
+    described by profile.
+    """
+
+    return _crop_filters(profile) + _convert_filters(profile)
+
+
+def _crop_filters(profile: VideoProfile | None) -> list[str]:
+    if profile is None or profile.crop is None:
+        return []
+
+    left, top, right, bottom = profile.crop
+
+    return [f'crop={right - left}:{bottom - top}:{left}:{top}']
+
+
+def _convert_filters(profile: VideoProfile | None) -> list[str]:
+    if profile is None:
+        return []
+
+    result: list[str] = []
+
+    if profile.scale != 1:
+        result.append(
+            f'scale=round(iw*{profile.scale:g}):round(ih*{profile.scale:g})'
+            ':flags=area'
+        )
+
+    if profile.gray:
+        result.append('format=gray')
+
+    return result
+
+
+def _suffix(profile: VideoProfile | None) -> str:
+    """ Return the file name suffix of frames extracted with profile. """
+
+    if profile is None or profile.format == 'png':
+        return '.png'
+
+    if profile.format == 'pnm':
+        return '.pgm' if profile.gray else '.ppm'
+
+    raise ValueError(
+        f'unknown frame format {profile.format!r}, expected png or pnm'
+    )
+
+
+def _output_args(
+    rate: float | None, scene: float | None, profile: VideoProfile | None
+) -> list[str]:
+    """
+    Return the ffmpeg output arguments with which extract_frames writes the
+    frames of a video, sampled at rate frames per second, or at changes of
+    scene if scene is not None, and converted as described by profile.
+    """
+
+    filters = [] if scene is None or rate is None else [f'fps={rate:g}']
+
+    # The scene score is computed on the cropped frames, so that it only
+    # reflects changes in the cropped region.
+
+    filters += _crop_filters(profile)
+
+    if scene is not None:
+        # The first frame is always written, as it has no scene score.
+
+        filters.append(f"select='eq(n,0)+gt(scene,{scene:g})'")
+
+    filters += _convert_filters(profile)
+
+    result = (
+        ['-r', f'{1 if rate is None else rate:g}'] if scene is None else []
+    )
+
+    if len(filters) > 0:
+        result += ['-vf', ','.join(filters)]
+
+    if scene is not None:
+        result += ['-fps_mode', 'vfr']
+
+    if profile is not None and profile.gray:
+        result += ['-pix_fmt', 'gray']
+
+    return result
+
+
+class _Manifest:
     """
-    For each of the mkv files in the dataset, extract png images from the file
-    at a rate of 1 image per second.
+    A record of the videos whose frames have been extracted, stored as JSON at
+    path.
+
+    Each video is recorded with the extraction settings, modification time
+    and size it was extracted with, so that a video is extracted again if any
+    of those change.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        " The path of the manifest file. "
+
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+        if path.exists():
+            with open(path, 'r') as fi:
+                self._entries = json.load(fi)  # pyright: ignore[reportAny]
+
+    @staticmethod
+    def entry(file: Path, settings: dict[str, Any]) -> dict[str, Any]:
+        """ Return the manifest entry of a video extracted with settings. """
+
+        stat = file.stat()
 
-    Reads optional terminal argument `-i/--input INPUT`.
+        return {
+            'settings': settings,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size
+        }
+
+    def done(self, file: Path, settings: dict[str, Any]) -> bool:
+        """
+        Return True if the frames of file have been extracted with settings
+        since it was last modified.
+        """
+
+        with self._lock:
+            return self._entries.get(str(file)) == self.entry(file, settings)
+
+    def record(self, file: Path, settings: dict[str, Any]) -> None:
+        """
+        Record that the frames of file have been extracted with settings.
+        """
+
+        with self._lock:
+            self._entries[str(file)] = self.entry(file, settings)
+
+            # Write to a temporary file first, so that an interrupted write
+            # doesn't lose the manifest.
+
+            fd, temp_path = mkstemp(dir=self.path.parent, prefix='.')
+
+            with os.fdopen(fd, 'w') as fo:
+                json.dump(self._entries, fo, indent=2, sort_keys=True)
+
+            os.replace(temp_path, self.path)
+
+
+def _extract(file: Path, settings: dict[str, Any]) -> bool:
+    """
+    Extract the frames of the video file with settings. Return True if
+    ffmpeg succeeds.
 
-    Assumes that videos must be in an `INPUT/jp` subfolder.
+    If settings has a region, frames are written where the region changes.
+    Otherwise, the frames are written by ffmpeg with the output arguments in
+    settings.
     """
 
+    out_dir = Path(file.parent, 'png')
+    out_template = Path(out_dir, f'{file.stem}-%04d{settings["suffix"]}')
+
+    makedirs(out_dir, exist_ok=True)
+
+    # Remove the frames of an earlier, possibly interrupted, extraction, which
+    # may not all be overwritten. Only names generated from out_template are
+    # matched, with at least 4 digits, so that other images in the directory,
+    # such as test cases named after the video, are kept.
+
+    generated = re.compile(
+        rf'{re.escape(file.stem)}-[0-9]{{4,}}'
+        rf'({"|".join(re.escape(it) for it in _suffixes)})'
+    )
+
+    for it in out_dir.glob(f'{glob.escape(file.stem)}-*'):
+        if generated.fullmatch(it.name):
+            it.unlink()
+
+    if 'region' in settings:
+        frames = FrameReader(
+            file,
+            rate=settings['rate'],
+            filters=settings['filters'],
+            gray=settings['gray']
+        )
+
+        try:
+            for index, it in enumerate(
+                changes(
+                    frames,
+                    tuple(settings['region']),
+                    settings['threshold'],
+                    settings['settle']
+                )
+            ):
+                it.image.save(str(out_template) % (index + 1))
+        except CalledProcessError:
+            return False
+
+        return True
+
+    command = [
+        'ffmpeg', '-nostdin', '-y', '-i', file, *settings['args'],
+        out_template, '-loglevel', 'error'
+    ]
+
+    try:
+        _ = run(command)
+    except CalledProcessError:
+        return False
+
+    return True
+
+
+def extract_frames(
+    input_path: Path | None = None,
+    jobs: int = 1,
+    force: bool = False,
+    rate: float | None = None,
+    scene: float | None = None,
+    region: tuple[int, int, int, int] | None = None,
+    settle: float = _default_settle,
+    profile: str | None = None
+) -> int:
+    """
+    For each of the mkv files in the dataset, extract images of its frames
+    into the `png` subfolder next to it, named after the file and numbered.
+    Return 0 if every file was extracted, or 1 otherwise. By default, frames
+    are sampled at 1 image per second. They are sampled at rate, at changes of
+    scene, or at changes of the dialog in region instead, and converted as
+    described by profile, as below. Images are written as png files, or as pgm
+    or ppm files if the format of profile is pnm.
+
+    input_path is the directory of the dataset, or data in configuration if
+    it is None. Videos must be in its `jp` subfolder.
+
+    Up to jobs videos are extracted concurrently, by separate ffmpeg
+    processes. Extracted videos are recorded in a manifest in the `jp`
+    subfolder, and are skipped by later calls unless they have been modified
+    since, or force is True. An interrupted call therefore resumes with the
+    videos it didn't finish.
+
+    If rate is not None, images are extracted at rate images per second
+    instead. If scene is not None, only images whose ffmpeg scene change score
+    is above scene, between 0 and 1, are extracted, after sampling at rate if
+    it is not None.
+
+    If region is not None, an image is extracted for each distinct content of
+    the region (left, top, right, bottom) of the frames, sampled at rate, or
+    10 images per second if rate is None. The content must settle for settle
+    seconds first. See changes.
+
+    Frames are cropped, scaled and converted by ffmpeg as they are decoded, as
+    described by the video.profiles entry named profile in configuration. If
+    profile is None, videos in a directory named after a profile use that
+    profile. A region is a box in the converted frames. Raise ValueError if
+    profile is not configured.
+    """
+
+    data = Path(config.data) if input_path is None else input_path
+
     files = _files(input_path)
 
-    mkv_files = list(filter(lambda x: x.suffix == '.mkv', files))
+    mkv_files = sorted(filter(lambda x: x.suffix == '.mkv', files))
+
+    if profile is not None and profile not in config.video.profiles:
+        raise ValueError(f'unknown video profile {profile!r}')
+
+    def settings(file: Path) -> dict[str, Any]:
+        video_profile = config.video.profiles.get(
+            file.parent.name if profile is None else profile
+        )
+
+        result: dict[str, Any] = {'suffix': _suffix(video_profile)}
+
+        if region is None:
+            result['args'] = _output_args(rate, scene, video_profile)
+        else:
+            result |= {
+                'rate': _change_rate if rate is None else rate,
+                'region': list(region),
+                'threshold': _default_threshold,
+                'settle': settle,
+                'filters': profile_filters(video_profile),
+                'gray': video_profile is not None and video_profile.gray
+            }
+
+        return result
+
+    manifest = _Manifest(Path(data, 'jp', _manifest_name))
+
+    items = [(it, settings(it)) for it in mkv_files]
+    pending = [it for it in items if force or not manifest.done(*it)]
+
+    if len(pending) < len(mkv_files):
+        print(f'{len(mkv_files) - len(pending)} videos already extracted')
+
+    def extract(index: int, item: tuple[Path, dict[str, Any]]) -> bool:
+        file, file_settings = item
+
+        print(f'{file.name}... ({index + 1}/{len(pending)})')
+
+        result = _extract(file, file_settings)
 
-    failed = False
+        if result:
+            manifest.record(file, file_settings)
+        else:
+            print(f'{file.name} failed')
+
+        return result
+
+    with ThreadPoolExecutor(jobs) as executor:
+        results = list(executor.map(extract, range(0, len(pending)), pending))
+
+    return 0 if all(results) else 1
+
+
+class Frame:
+    """ A decoded frame of a video. """
+    def __init__(self, index: int, timestamp: float, image: Image) -> None:
+        self.index: int = index
+        " The position of the frame among the frames read from the video. "
+
+        self.timestamp: float = timestamp
+        " The presentation time of the frame in the video, in seconds. "
+
+        self.image: Image = image
+        " The image of the frame. "
+
+    @override
+    def __repr__(self) -> str:
+        return f'Frame({self.index}, {self.timestamp})'
+
+
+class FrameReader:
+    """
+    Read the frames of the video file at path, decoded by ffmpeg and passed
+    through a pipe as raw pixels, as Frame objects.
 
-    for index, file in enumerate(mkv_files):
-        parent = file.parent
-        out_dir = Path(parent, 'png')
-        out_template = Path(out_dir, f'{file.stem}-%04d.png')
+    If rate is not None, frames are sampled at rate frames per second.
+    Otherwise, every frame of the video is read. filters is a list of ffmpeg
+    video filters, such as 'crop=640:120:0:600', applied to the sampled
+    frames. Frames are read as 8-bit grayscale images if gray is True, and as
+    RGB images otherwise.
 
-        makedirs(out_dir, exist_ok=True)
+    Frames are decoded ahead of the reader in a background thread, up to
+    buffer frames, so that decoding overlaps the processing of earlier frames
+    without holding the whole video in memory. The frames may be passed
+    straight to Pipeline.run_many:
 
-        command = [
+        with FrameReader(path, rate=2) as reader:
+            for output in pipeline.run_many(it.image for it in reader):
+                ...
+
+    A FrameReader may be iterated once. When the iteration stops early, or the
+    reader is closed, ffmpeg is stopped. If ffmpeg fails, the iteration raises
+    CalledProcessError.
+    """
+    def __init__(
+        self,
+        path: str | PathLike[str],
+        rate: float | None = None,
+        filters: Sequence[str] = (),
+        gray: bool = False,
+        buffer: int = 16
+    ) -> None:
+        self.path: Path = Path(path)
+        " The path of the video file. "
+
+        # -nostats stops ffmpeg from writing its progress to the log, where it
+        # would be joined to the next showinfo line. -fps_mode passthrough
+        # stops ffmpeg from duplicating or dropping frames of a video with a
+        # variable frame rate after showinfo, so that each frame written to
+        # the pipe has exactly one showinfo line.
+
+        self.args: list[str] = [
             'ffmpeg',
-            '-i',
-            file,
-            '-r',
-            '1',
-            out_template,
+            '-nostdin',
+            '-hide_banner',
+            '-nostats',
             '-loglevel',
-            'error'
+            'info',
+            '-i',
+            str(path),
+            '-vf',
+            ','.join(
+                ([] if rate is None else [f'fps={rate}']) + list(filters) +
+                ['showinfo']
+            ),
+            '-fps_mode',
+            'passthrough',
+            '-f',
+            'rawvideo',
+            '-pix_fmt',
+            'gray' if gray else 'rgb24',
+            '-'
+        ]
+        " The ffmpeg command line. "
+
+        self._mode: str = 'L' if gray else 'RGB'
+        self._frames: Queue[Frame | Exception | None] = Queue(buffer)
+        self._infos: SimpleQueue[tuple[float, int, int] | None] = (
+            SimpleQueue()
+        )
+        self._log: list[str] = []
+        self._process: Popen[bytes] | None = None
+        self._threads: list[threading.Thread] = []
+        self._closed: bool = False
+
+    def __iter__(self) -> Iterator[Frame]:
+        if self._process is not None:
+            raise RuntimeError('a FrameReader may only be iterated once')
+
+        self._process = start(
+            self.args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+        self._threads = [
+            threading.Thread(target=self._read_log, daemon=True),
+            threading.Thread(target=self._read_frames, daemon=True)
         ]
 
-        print(f'{file.name}... ({index + 1}/{len(mkv_files)})')
+        for it in self._threads:
+            it.start()
+
+        try:
+            while True:
+                item = self._frames.get()
+
+                if item is None:
+                    break
+
+                if isinstance(item, Exception):
+                    raise item
+
+                yield item
+
+            if self._process.wait() != 0:
+                raise CalledProcessError(
+                    self._process.returncode,
+                    self.args,
+                    stderr='\n'.join(self._log).encode()
+                )
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """ Stop ffmpeg and the background threads. """
+
+        self._closed = True
+
+        if self._process is None:
+            return
+
+        if self._process.poll() is None:
+            self._process.kill()
+
+        # Unblock the decoding thread if it is waiting for buffer space.
+
+        while any(it.is_alive() for it in self._threads):
+            while not self._frames.empty():
+                _ = self._frames.get_nowait()
+
+            for it in self._threads:
+                it.join(0.01)
+
+        _ = self._process.wait()
+
+        for it in [self._process.stdout, self._process.stderr]:
+            if it is not None:
+                it.close()
+
+    def __enter__(self) -> 'FrameReader':
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def _read_log(self) -> None:
+        assert self._process is not None and self._process.stderr is not None
+
+        for it in self._process.stderr:
+            line = it.decode(errors='replace').rstrip()
+            match = _showinfo_pattern.search(line)
+
+            if match is None:
+                self._log = (self._log + [line])[-_log_lines:]
+
+                continue
+
+            try:
+                timestamp = float(match[1])
+            except ValueError:
+                timestamp = math.nan
+
+            self._infos.put((timestamp, int(match[2]), int(match[3])))
+
+        self._infos.put(None)
+
+    def _read_frames(self) -> None:
+        assert self._process is not None and self._process.stdout is not None
+
+        channels = len(self._mode)
+        index = 0
+
+        try:
+            while not self._closed:
+                info = self._infos.get()
+
+                if info is None:
+                    break
+
+                timestamp, width, height = info
+                size = width * height * channels
+                data = self._process.stdout.read(size)
+
+                if len(data) < size:
+                    break
+
+                image = Image.frombytes(self._mode, (width, height), data)
+
+                self._frames.put(Frame(index, timestamp, image))
+
+                index += 1
+        except Exception as e:
+            self._frames.put(e)
+
+        self._frames.put(None)
+
+
+def _region_pixels(
+    image: Image, region: tuple[int, int, int, int] | None
+) -> npt.NDArray[np.int16]:
+    if region is not None:
+        image = image.crop(region)
+
+    return image.convert('L').as_array().astype(np.int16)
+
+
+def _differs(
+    a: npt.NDArray[np.int16], b: npt.NDArray[np.int16], threshold: float
+) -> bool:
+    """
+    Return True if more than threshold of the pixels of a differ from those of
+    b by more than _tolerance.
+    """
+
+    if a.shape != b.shape:
+        return True
+
+    changed = np.count_nonzero(np.abs(a - b) > _tolerance)
+
+    return changed > threshold * a.size
+
+
+def changes(
+    frames: Iterable[Frame],
+    region: tuple[int, int, int, int] | None = None,
+    threshold: float = _default_threshold,
+    settle: float = 0.0
+) -> Iterator[Frame]:
+    """
+    Yield the frames of a sequence at which the content of region changes.
+    region is a box (left, top, right, bottom) in frame pixels, such as the
+    text box of a game, or None for the whole frame.
+
+    A frame has changed if more than threshold of the pixels of its region
+    differ in gray level from those of the last yielded frame, ignoring small
+    differences such as compression noise.
+
+    If settle is greater than 0, changed content is only yielded once it has
+    stayed unchanged for settle seconds, so that text which is still being
+    drawn, or a transition, doesn't yield a frame for each step. The yielded
+    frame is the first frame of the settled content. Otherwise, the first
+    frame is always yielded.
+    """
+
+    last: npt.NDArray[np.int16] | None = None
+    previous: npt.NDArray[np.int16] | None = None
+    candidate: tuple[Frame, npt.NDArray[np.int16]] | None = None
+
+    for frame in frames:
+        pixels = _region_pixels(frame.image, region)
+
+        if previous is None or _differs(pixels, previous, threshold) or (
+            candidate is None and last is not None
+            and _differs(pixels, last, threshold)
+        ):
+            candidate = (frame, pixels)
+
+        previous = pixels
+
+        if candidate is None or (
+            frame.timestamp - candidate[0].timestamp < settle
+        ):
+            continue
+
+        if last is None or _differs(candidate[1], last, threshold):
+            yield candidate[0]
 
-        process_exit_code = run(command).returncode
+            last = candidate[1]
 
-        if process_exit_code != 0:
-            failed = True
+        candidate = None
 
-    return 1 if failed else 0
+    if candidate is not None and (
+        last is None or _differs(candidate[1], last, threshold)
+    ):
+        yield candidate[0]
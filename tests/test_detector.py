@@ -4,7 +4,7 @@ results of rectangles from known images
 """
 import os
 
-from mortar.image import Detector
+from mortar.image import Detector, Image
 
 data = f'{os.getcwd()}/tests/data/detector'
 
@@ -33,6 +33,19 @@ def test_detector_iog_top_big() -> None:
     assert (h == 343)
 
 
+def test_detector_iog_top_big_image() -> None:
+    """
+    iog_top_big.png / iog_test_45m-173.png, passed as an Image
+    """
+    detector = Detector()
+    rects = detector.detect_rects(
+        Image.open(f'{os.getcwd()}/tests/data/detector/iog_top_big.png'),
+        iog_jp_charity_detector_fn
+    )
+
+    assert rects == [(685, 270, 1056, 343)]
+
+
 def test_detector_iog_top_small() -> None:
     """
     iog_top_small.png / iog_test_45m-169.png
@@ -1,13 +1,25 @@
+import ctypes.util
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+import pytest
 from mktech.validate import ensure_type
 
-from mortar.image import Image
+from mortar.config import config
+from mortar.image import Image, dedup, dhash, hamming
 from mortar.pipeline import OCR, Threshold
+from mortar.tesseract import OCRText, ocr_image, tesseract_capi
 
 data = f'{os.getcwd()}/tests/data'
 
+_hiragana_ocr_text = '''ご ぞ ど ば ぼ ば ぼ ま
+げ ゼ ぜ ゼ ぜ で べ ペ
+ぐず づい ぶ い ぶ
+ぎじ ぢ びび で び
+が ざさ ざ だ ば だ ぱ ば
+'''
+
 
 class TestImage:
     def test_copy(self) -> None:
@@ -21,6 +33,90 @@ class TestImage:
         assert image.size == copy.size
         assert image.tobytes() == copy.tobytes()
 
+    def test_copy_on_write(self) -> None:
+        image = Image.new('RGB', (100, 100), color=(0, 128, 0))
+        patch = Image.new('RGB', (10, 10), color=(255, 0, 0))
+
+        # A copy shares pixel data until it is modified.
+
+        copy = image.copy()
+
+        assert copy.pil_image is image.pil_image
+
+        copy.paste(patch, (0, 0))
+
+        assert copy.pil_image is not image.pil_image
+        assert copy.getpixel((0, 0)) == (255, 0, 0)
+        assert image.getpixel((0, 0)) == (0, 128, 0)
+
+        # Modifying the original leaves the copy unchanged.
+
+        copy = image.copy()
+
+        image.paste(patch, (0, 0))
+
+        assert image.getpixel((0, 0)) == (255, 0, 0)
+        assert copy.getpixel((0, 0)) == (0, 128, 0)
+
+    def test_transforms_return_new_images(self) -> None:
+        image = Image.new('RGB', (100, 100), color=(0, 128, 0))
+
+        cropped = image.crop((0, 0, 50, 50))
+        resized = image.resize((20, 20))
+        converted = image.convert('L')
+
+        assert image.size == (100, 100)
+        assert image.mode == 'RGB'
+
+        assert cropped.size == (50, 50)
+        assert resized.size == (20, 20)
+        assert converted.mode == 'L'
+
+    def test_array(self) -> None:
+        data = np.array([[i] * 100 for i in range(0, 255)], dtype='uint8')
+
+        image = Image.from_array(data)
+
+        assert image.mode == 'L'
+        assert image.size == (100, 255)
+        assert image.getpixel((0, 200)) == 200
+
+        array = image.as_array()
+
+        assert array.shape == (255, 100)
+        assert np.array_equal(array, data)
+
+        rgb = Image.new('RGB', (30, 20), color=(1, 2, 3))
+        rgb_array = rgb.as_array()
+
+        assert rgb_array.shape == (20, 30, 3)
+        assert tuple(rgb_array[0, 0]) == (1, 2, 3)  # pyright: ignore[reportAny] # noqa: E501
+        assert Image.from_array(rgb_array).tobytes() == rgb.tobytes()
+
+    def test_dhash(self) -> None:
+        gradient = np.array([list(range(0, 256, 2))] * 64, dtype='uint8')
+
+        image = Image.from_array(gradient)
+
+        spotted = gradient.copy()
+        spotted[10, 10] = 255
+
+        assert hamming(dhash(image), dhash(image.copy())) == 0
+        assert hamming(dhash(image), dhash(Image.from_array(spotted))) <= 1
+        assert hamming(dhash(image), dhash(Image.invert(image))) == 64
+
+    def test_dedup(self) -> None:
+        images = [
+            Image.new('L', (40, 20), color=it)
+            for it in [10, 10, 200, 200, 200, 10]
+        ]
+
+        assert dedup(images) == [0, 0, 2, 2, 2, 5]
+
+        # Solid images all have the same difference hash.
+
+        assert dedup(images, exact=False) == [0, 0, 0, 0, 0, 0]
+
 
 class TestFilter:
     def test_threshold(self) -> None:
@@ -60,9 +156,68 @@ class TestFilter:
 
         output = OCR().run(image)
 
-        assert output == '''ご ぞ ど ば ぼ ば ぼ ま
-げ ゼ ぜ ゼ ぜ で べ ペ
-ぐず づい ぶ い ぶ
-ぎじ ぢ びび で び
-が ざさ ざ だ ば だ ぱ ば
-'''
+        assert output == _hiragana_ocr_text
+
+    def test_ocr_batch(self) -> None:
+        image = Image.open(f'{data}/hiragana_ocr.png')
+        blank = Image.new('L', image.size, color=255)
+
+        output = OCR(batch=True).run([image, blank, image])
+
+        assert output == [_hiragana_ocr_text, '', _hiragana_ocr_text]
+
+    def test_ocr_structured(self) -> None:
+        image = Image.open(f'{data}/hiragana_ocr.png')
+
+        output = ensure_type(OCR(structured=True).run(image), OCRText)
+
+        assert output == _hiragana_ocr_text
+        assert len(output.lines) == len(_hiragana_ocr_text.splitlines())
+
+        for line, text in zip(output.lines, _hiragana_ocr_text.splitlines()):
+            assert line.text.replace(' ', '') == text.replace(' ', '')
+            assert 0 < line.confidence <= 100
+
+            left, top, width, height = line.box
+
+            assert 0 <= left and left + width <= image.size[0]
+            assert 0 <= top and top + height <= image.size[1]
+
+    @pytest.mark.skipif(
+        ctypes.util.find_library('tesseract') is None,
+        reason='libtesseract is not installed'
+    )
+    def test_ocr_in_process(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        image = Image.open(f'{data}/hiragana_ocr.png')
+
+        monkeypatch.setattr(config.tesseract, 'backend', 'capi')
+
+        assert ocr_image(image, use_cache=False) == _hiragana_ocr_text
+        assert tesseract_capi(image.convert('RGB')) == _hiragana_ocr_text
+
+        output = ensure_type(OCR(structured=True).run(image), OCRText)
+
+        assert len(output.lines) == len(_hiragana_ocr_text.splitlines())
+
+    def test_ocr_threads(self) -> None:
+        image = Image.open(f'{data}/hiragana_ocr.png')
+        blank = Image.new('L', image.size, color=255)
+
+        # Concurrent OCR runs don't share any files, so their results don't
+        # mix.
+
+        def run(index: int) -> str | list[str] | None:
+            input = image if index % 2 == 0 else blank
+
+            if index % 3 == 0:
+                return OCR(batch=True).run([input])
+            else:
+                return OCR().run(input)
+
+        with ThreadPoolExecutor(8) as executor:
+            outputs = list(executor.map(run, range(0, 16)))
+
+        for index, output in enumerate(outputs):
+            text = _hiragana_ocr_text if index % 2 == 0 else ''
+
+            assert output == ([text] if index % 3 == 0 else text)
@@ -7,7 +7,7 @@ from pathlib import Path
 import pytest
 
 from mortar.image import Image
-from mortar.tesseract import ocr
+from mortar.tesseract import ocr, ocr_many
 from mortar.util import mktemp
 
 data = f'{os.getcwd()}/tests/data'
@@ -99,6 +99,49 @@ def test_rudra(index: int) -> None:
     ocr_test_case(_rudra, index)
 
 
+@pytest.mark.parametrize(
+    'test_case',
+    [
+        _7thelnard,
+        _aretha,
+        _aretha2,
+        _bof,
+        _bof2,
+        _ff4,
+        _ff6_01,
+        _ff6_02,
+        _iog,
+        _rudra,
+    ],
+    ids=lambda it: it.base_name  # pyright: ignore[reportUnknownLambdaType, reportUnknownMemberType, reportUnknownArgumentType] # noqa: E501
+)
+def test_many(test_case: OCRTest) -> None:
+    """ OCR all images of a test case with batched Tesseract runs. """
+
+    output_paths: list[str] = []
+    expected_texts: list[str] = []
+
+    for index in range(0, test_case.count):
+        name = f'{test_case.base_name}-{index + 1:02}'
+        input_png_path = f'''{dir_mkr(test_case, 'png')}/{name}.png'''
+        input_txt_path = f'''{dir_mkr(test_case, 'txt')}/{name}.txt'''
+        output_path = mktemp(suffix='.png')
+
+        image = Image.open(input_png_path)
+        image.crop(test_case.rectangle).save(output_path)
+
+        output_paths.append(output_path)
+        expected_texts.append(Path(input_txt_path).read_text())
+
+    try:
+        results = ocr_many(output_paths)
+    finally:
+        for it in output_paths:
+            os.remove(it)
+
+    assert results == expected_texts
+
+
 def ocr_test_case(test_case: OCRTest, index: int) -> None:
     name = f'{test_case.base_name}-{index + 1:02}'
     input_png_path = f'''{dir_mkr(test_case, 'png')}/{name}.png'''
@@ -2,7 +2,8 @@ import os
 
 import pytest
 
-from mortar.tesseract import ocr
+from mortar.image import Image
+from mortar.tesseract import Pool, ocr, ocr_image
 
 data = f'{os.getcwd()}/tests/data/mort'
 
@@ -21,3 +22,36 @@ def test_mort_tess(index: int) -> None:
     print(f'result: {result}')
 
     assert result == mort_str
+
+
+@pytest.mark.parametrize('index', range(0, 9))
+def test_mort_tess_image(index: int) -> None:
+    """ Run test data previously gathered from MORT through tesseract from
+        memory, confirming that OCR results are the same. """
+
+    with open(f'{data}/capture_{index:02}.str') as fi:
+        mort_str = fi.read()
+
+    result = ocr_image(Image.open(f'{data}/capture_{index:02}.png'))
+
+    assert result == mort_str
+
+
+def test_mort_tess_pool() -> None:
+    """ Run the MORT test data through a worker pool, confirming that the
+        results are the same as OCR of each image alone. """
+
+    indices = range(0, 9)
+
+    mort_strs: list[str] = []
+
+    for index in indices:
+        with open(f'{data}/capture_{index:02}.str') as fi:
+            mort_strs.append(fi.read())
+
+    with Pool(workers=2, batch_size=4) as pool:
+        results = pool.map(
+            f'{data}/capture_{index:02}.png' for index in indices
+        )
+
+    assert results == mort_strs
@@ -1,20 +1,33 @@
 import os
 from collections.abc import Sequence
+from pathlib import Path
 from shutil import rmtree
 from tempfile import mkdtemp
+from typing import override
 
+import numpy as np
+import pytest
 from mktech.validate import ensure_type
 
+import mortar.pipeline.filter
 from mortar.pipeline import (
     OCR,
     Crop,
+    Dedup,
+    Filter,
+    Fused,
     Gray,
     Image,
     Invert,
     Output,
     Pipeline,
+    Refine,
+    Retention,
+    Scale,
+    StageCache,
     Threshold,
 )
+from mortar.tesseract import Line, OCRText, Word
 
 data = f'{os.getcwd()}/tests/data'
 
@@ -107,6 +120,373 @@ def test_pipeline_ocr() -> None:
     rmtree(temp)
 
 
+def test_pipeline_run_many() -> None:
+    size = (100, 100)
+    crop = (50, 50, 100, 100)
+
+    images = [
+        Image.new('RGB', size, color=(value, value, value))
+        for value in range(0, 250, 50)
+    ]
+
+    pipeline = Pipeline()
+    pipeline.add(Crop(crop))
+    pipeline.add(Gray())
+    pipeline.add(Invert())
+
+    inputs: list[Image | str] = [*images, f'{data}/does_not_exist.png']
+
+    outputs = list(pipeline.run_many(inputs, jobs=2))
+
+    assert [it.index for it in outputs] == list(range(0, len(inputs)))
+
+    for image, output in zip(images, outputs):
+        assert output.error is None
+        assert output.pipeline is pipeline
+
+        result = ensure_type(output.stages[-1].data, Image)  # pyright: ignore[reportAny] # noqa: E501
+
+        assert result.size == (50, 50)
+        assert result.getpixel((0, 0)) == 255 - image.getpixel((0, 0))[0]  # pyright: ignore[reportAny] # noqa: E501
+
+    # A failing input is reported without aborting the rest of the batch.
+
+    assert outputs[-1].error is not None
+    assert len(outputs[-1].stages) == 0
+
+    # Unordered results contain the same set of inputs.
+
+    unordered = pipeline.run_many(inputs, jobs=2, ordered=False)
+
+    assert sorted(it.index or 0 for it in unordered) == list(
+        range(0, len(inputs))
+    )
+
+    # A single job runs serially in the current process.
+
+    serial = list(pipeline.run_many(images, jobs=1))
+
+    assert [it.index for it in serial] == list(range(0, len(images)))
+
+
+def test_pipeline_cache() -> None:
+    class Count(Filter):
+        """ Pass an image through unchanged, counting the runs. """
+
+        name: str = 'Count'
+        runs: int = 0
+
+        def __init__(self, tag: str) -> None:
+            super().__init__()
+
+            self.tag: str = tag
+
+        @override
+        def run(self, input: Image) -> Image:
+            super().run(input)
+
+            Count.runs += 1
+
+            return input
+
+    image = Image.new('L', (100, 100), color=100)
+
+    cache = StageCache()
+
+    pipeline = Pipeline()
+    pipeline.add(Count('a'))
+    pipeline.add(Count('b'))
+    pipeline.add(Threshold(threshval=50))
+
+    output = pipeline.run(image, cache)
+
+    assert Count.runs == 2
+    assert cache.misses == 3
+
+    # Changing only the last stage reuses the results of the preceding stages.
+
+    _ = pipeline.pop(2)
+    pipeline.add(Threshold(threshval=150))
+
+    cached_output = pipeline.run(image, cache)
+
+    assert Count.runs == 2
+    assert cache.hits == 2
+
+    assert ensure_type(output.stages[-1].data, Image).getpixel((0, 0)) == 255  # pyright: ignore[reportAny] # noqa: E501
+    assert ensure_type(cached_output.stages[-1].data, Image).getpixel((0, 0)) == 0  # pyright: ignore[reportAny] # noqa: E501
+
+    # Changing an earlier stage recomputes every stage from that one onward.
+
+    pipeline.insert(1, Count('c'))
+
+    _ = pipeline.run(image, cache)
+
+    assert Count.runs == 4
+
+    # A different input shares no results with the first.
+
+    _ = pipeline.run(Image.new('L', (100, 100), color=200), cache)
+
+    assert Count.runs == 7
+
+
+def test_pipeline_cache_engine(monkeypatch: pytest.MonkeyPatch) -> None:
+    def engine() -> str:
+        return description
+
+    monkeypatch.setattr(mortar.pipeline.filter, 'describe_engine', engine)
+
+    stages = [OCR(), OCR(structured=True), Refine([[Invert()]])]
+
+    description = 'tesseract 5.3.0'
+    keys = [StageCache.chain('', it) for it in stages]
+
+    assert [StageCache.chain('', it) for it in stages] == keys
+
+    # The results of OCR stages aren't reused with a different OCR engine.
+
+    description = 'tesseract 5.4.0'
+
+    assert all(
+        StageCache.chain('', it) != key for it, key in zip(stages, keys)
+    )
+
+
+def test_pipeline_dedup() -> None:
+    class Pixel(Filter):
+        """ Return the value of the first pixel of an image as text. """
+
+        name: str = 'Pixel'
+
+        @override
+        def run(self, input: Image) -> str:
+            super().run(input)
+
+            return str(input.getpixel((0, 0)))
+
+    values = [10, 10, 10, 200, 200, 10]
+
+    dedup = Dedup(Pixel(), exact=True)
+
+    pipeline = Pipeline()
+    pipeline.add(Threshold(threshval=5, maxval=100))
+    pipeline.add(dedup)
+
+    outputs = [
+        pipeline.run(Image.new('L', (20, 20), color=it)).stages[-1].data
+        for it in values
+    ]
+
+    # The inner filter only runs when the image changes.
+
+    assert outputs == ['100', '100', '100', '100', '100', '100']
+    assert (dedup.runs, dedup.skips) == (1, 5)
+
+    # Images are compared exactly by default, so solid images of different
+    # colors, which have the same difference hash, are changes.
+
+    dedup = Dedup(Pixel())
+
+    outputs = [dedup.run(Image.new('L', (20, 20), color=it)) for it in values]
+
+    assert outputs == ['10', '10', '10', '200', '200', '10']
+    assert (dedup.runs, dedup.skips) == (3, 3)
+
+    assert dedup.info() == 'Dedup Pixel'
+    assert dedup == Dedup(Pixel(), exact=True)
+    assert dedup != Dedup(Pixel(), exact=False)
+
+
+def test_pipeline_retention(tmp_path: Path) -> None:
+    image = Image.new('RGB', (100, 100), color=(255, 255, 255))
+
+    pipeline = Pipeline()
+    pipeline.add(Crop((0, 0, 50, 50)))
+    pipeline.add(Gray())
+    pipeline.add(Invert())
+
+    output = pipeline.run(image, retention=Retention.FINAL)
+
+    assert [it.data is None for it in output.stages] == [
+        True, True, True, False
+    ]
+    assert [it.info[0] for it in output.stages] == [
+        'Start', 'Crop box=(0, 0, 50, 50)', 'Gray', 'Invert'
+    ]
+
+    # Filters do not hold on to their input after the pipeline has run.
+
+    assert all(it._input is None for it in pipeline.stages)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+
+    # Released stages can be spilled to disk and loaded back.
+
+    output = pipeline.run(image, retention=Retention.FINAL, spill=tmp_path)
+
+    gray = ensure_type(output.stages[2].load(), Image)
+
+    assert output.stages[2].data is None
+    assert gray.mode == 'L'
+    assert gray.size == (50, 50)
+
+    # Text results, including lists of strings, are retained as text.
+
+    output = Output(pipeline)
+
+    output.add(image)
+    output.add('テキスト')
+    output.add(['一行目', '二行目'])  # pyright: ignore[reportArgumentType]
+    output.add(image)
+
+    for index in range(0, 3):
+        output.release(index, Retention.TEXT)
+
+    assert [it.data is None for it in output.stages] == [
+        True, False, False, False
+    ]
+
+
+def test_output_empty_list() -> None:
+    output = Output(Pipeline())
+
+    output.add(Image.new('L', (20, 20)))
+    output.add([])
+
+    # An empty list of results, such as a batch OCR of no crops, is shown as
+    # empty text.
+
+    assert output._composite().size[1] > 20  # pyright: ignore[reportPrivateUsage] # noqa: E501
+
+
+def test_pipeline_compile() -> None:
+    size = (256, 100)
+
+    data = np.array([list(range(0, 256))] * size[1], dtype='uint8')
+
+    inputs = [
+        Image.fromarray(data, mode='L'),
+        Image.fromarray(np.stack([data, data[:, ::-1], data], axis=2)),
+    ]
+
+    pipeline = Pipeline()
+    pipeline.add(Crop((10, 10, 200, 90)))
+    pipeline.add(Gray())
+    pipeline.add(Invert())
+    pipeline.add(Threshold(threshval=99.5, maxval=200))
+    pipeline.add(Invert())
+
+    compiled = pipeline.compile()
+
+    assert len(compiled.stages) == 2
+    assert isinstance(compiled.stages[1], Fused)
+    assert len(pipeline.stages) == 5
+    assert pipeline.compile() == compiled
+
+    for image in inputs:
+        output = pipeline.run(image)
+        compiled_output = compiled.run(image)
+
+        expected = ensure_type(output.stages[-1].data, Image)  # pyright: ignore[reportAny] # noqa: E501
+        actual = ensure_type(compiled_output.stages[-1].data, Image)  # pyright: ignore[reportAny] # noqa: E501
+
+        assert actual.mode == expected.mode
+        assert actual.tobytes() == expected.tobytes()
+
+        # The compiled pipeline still reports each of the original stages.
+
+        assert [it.info for it in compiled_output.stages] == [
+            it.info for it in output.stages
+        ]
+
+        # Compiled and original pipelines share cached results.
+
+        cache = StageCache()
+
+        _ = pipeline.run(image, cache)
+        cached_output = compiled.run(image, cache)
+
+        actual = ensure_type(cached_output.stages[-1].data, Image)  # pyright: ignore[reportAny] # noqa: E501
+
+        # The fused stage can't reuse the cached result for an RGB input, as
+        # the mode of its intermediate results isn't known, so it is
+        # recomputed, materializing the result of Gray.
+
+        fusible = ensure_type(compiled.stages[1], Fused).fusible(image.mode)
+
+        assert cache.hits == (2 if fusible else 1)
+        assert (cached_output.stages[2].data is None) == fusible  # pyright: ignore[reportAny] # noqa: E501
+        assert actual.tobytes() == expected.tobytes()
+
+
+def test_pipeline_refine(monkeypatch: pytest.MonkeyPatch) -> None:
+    input = Image.new('L', (200, 100), color=255)
+    sizes: list[tuple[int, int]] = []
+
+    # The first pass finds a good line and a bad one. The line is read best
+    # from the scaled variant.
+
+    def ocr_structured(image: Image) -> OCRText:
+        sizes.append(image.size)
+
+        if image.size == input.size:
+            return OCRText(
+                'good line\n\nbad line\n',
+                [
+                    Line(
+                        (0, 0, 200, 40),
+                        [
+                            Word('good', (0, 0, 80, 40), 95),
+                            Word('line', (100, 0, 80, 40), 95)
+                        ]
+                    ),
+                    Line(
+                        (10, 50, 100, 40), [Word('bad', (10, 50, 40, 40), 30)]
+                    )
+                ]
+            )
+
+        width, height = image.size
+        confidence = 90 if width > 200 else 50
+
+        return OCRText(
+            'fixed\n',
+            [
+                Line(
+                    (0, 0, width, height),
+                    [Word('fixed', (0, 0, width // 2, height), confidence)]
+                )
+            ]
+        )
+
+    monkeypatch.setattr(
+        mortar.pipeline.filter, 'ocr_structured', ocr_structured
+    )
+    monkeypatch.setattr(
+        mortar.pipeline.filter, 'describe_engine', lambda: 'tesseract'
+    )
+
+    refine = Refine(
+        [[Threshold(100)], [Scale(2), Threshold(150)]], min_confidence=80
+    )
+
+    output = ensure_type(refine.run(input), OCRText)
+
+    # Only the bad line is OCRed again, once for each variant.
+
+    assert sizes == [(200, 100), (108, 48), (216, 96)]
+
+    assert output == 'good line\n\nfixed\n'
+    assert [it.text for it in output.lines] == ['good line', 'fixed']
+    assert output.lines[1].box == (6, 46, 108, 48)
+    assert output.lines[1].words[0].box == (6, 46, 54, 48)
+    assert output.lines[1].confidence == 90
+
+    # Equal variants identify equal output.
+
+    assert Refine([[Threshold(100)]]).params() == \
+        Refine([[Threshold(100)]]).params()
+
+
 def test_pipeline_modify() -> None:
     def make_pipeline_0() -> Pipeline:
         pipeline = Pipeline()
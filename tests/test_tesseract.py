@@ -0,0 +1,500 @@
+import ctypes
+import gc
+import io
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import Any
+
+import pytest
+
+import mortar.tesseract as tesseract
+import mortar.tesseract.backend as backend_
+import mortar.tesseract.capi as capi
+import mortar.tesseract.remote as remote
+from mortar.config import SSHHost, config
+from mortar.image import Image
+from mortar.pipeline import OCR
+from mortar.ssh import SSH
+from mortar.tesseract import (
+    Balancer,
+    Engine,
+    FakeBackend,
+    OCRCache,
+    OCRIndex,
+    OCRText,
+    Pool,
+    backends,
+    get_backend,
+    ocr_image,
+    ocr_images,
+    ocr_many,
+    ocr_structured,
+    parse_tsv,
+    tesseract_ssh_list,
+)
+
+
+def test_ocr_cache(tmp_path: Path) -> None:
+    path = tmp_path / 'ocr.sqlite3'
+
+    cache = OCRCache(path)
+
+    assert cache.get('a') is None
+
+    cache.put('a', 'テキスト')
+
+    assert cache.get('a') == 'テキスト'
+
+    # Results persist between cache instances.
+
+    cache.close()
+
+    cache = OCRCache(path)
+
+    assert cache.get('a') == 'テキスト'
+
+    cache.clear()
+
+    assert cache.get('a') is None
+
+
+def test_ocr_cache_eviction(tmp_path: Path) -> None:
+    path = tmp_path / 'ocr.sqlite3'
+
+    cache = OCRCache(path)
+
+    for index in range(0, 100):
+        cache.put(f'{index:03}', 'x' * 97)
+
+    cache.close()
+
+    # The least recently used results are evicted to fit the size limit.
+
+    cache = OCRCache(path, max_bytes=1000)
+
+    assert cache.get('000') is None
+    assert cache.get('089') is None
+    assert cache.get('090') == 'x' * 97
+    assert cache.get('099') == 'x' * 97
+
+
+def test_parse_tsv() -> None:
+    tsv = '\n'.join(
+        [
+            'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\t'
+            'left\ttop\twidth\theight\tconf\ttext',
+            '1\t1\t0\t0\t0\t0\t0\t0\t640\t480\t-1\t',
+            '2\t1\t1\t0\t0\t0\t10\t20\t300\t90\t-1\t',
+            '3\t1\t1\t1\t0\t0\t10\t20\t300\t90\t-1\t',
+            '4\t1\t1\t1\t1\t0\t10\t20\t300\t40\t-1\t',
+            '5\t1\t1\t1\t1\t1\t10\t20\t100\t40\t96.5\tこんにちは',
+            '5\t1\t1\t1\t1\t2\t120\t20\t190\t40\t80.5\t世界',
+            '4\t1\t1\t1\t2\t0\t10\t70\t300\t40\t-1\t',
+            '5\t1\t1\t1\t2\t1\t10\t70\t300\t40\t-1\t ',
+            '4\t1\t1\t1\t3\t0\t10\t120\t50\t40\t-1\t',
+            '5\t1\t1\t1\t3\t1\t10\t120\t50\t40\t42\tです',
+        ]
+    )
+
+    lines = parse_tsv(tsv)
+
+    # Lines without words are omitted.
+
+    assert [it.text for it in lines] == ['こんにちは 世界', 'です']
+    assert [it.box for it in lines] == [(10, 20, 300, 40), (10, 120, 50, 40)]
+    assert [it.confidence for it in lines] == [88.5, 42.0]
+    assert lines[0].rect() == (10, 20, 310, 60)
+    assert lines[0].words[1].box == (120, 20, 190, 40)
+
+    text = OCRText('こんにちは 世界\nです\n', lines)
+
+    assert text == 'こんにちは 世界\nです\n'
+    assert [it.text for it in text.words] == ['こんにちは', '世界', 'です']
+
+
+def test_tesseract_ssh_list(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    directory = str(tmp_path)
+
+    # tesseract prints the content of each image in its list file as the text
+    # of the image.
+
+    _write_ssh_script(directory)
+
+    _write_script(
+        f'{directory}/tesseract',
+        'eval list=\\${$(($# - 1))}\n'
+        'while read -r path; do cat "$path"; printf "\\f"; done < "$list"\n'
+    )
+
+    monkeypatch.setenv('PATH', f'{directory}:{os.environ["PATH"]}')
+    monkeypatch.setattr(config.ssh, 'host', 'localhost')
+    monkeypatch.setattr(remote, '_balancer', None)
+    monkeypatch.setattr(config.ssh, 'multiplex', False)
+    monkeypatch.setattr(remote, '_remote_temp_win', directory)
+    monkeypatch.setattr(remote, '_remote_temp_nix', directory)
+    monkeypatch.setenv('TESSERACT', 'tesseract')
+    monkeypatch.setenv('TESSERACT_DATA', directory)
+
+    paths = [f'{directory}/{index}.png' for index in range(0, 500)]
+
+    for index, path in enumerate(paths):
+        with open(path, 'w') as fo:
+            _ = fo.write(f'テキスト{index}\n')
+
+    result = tesseract_ssh_list(paths)
+
+    assert result == [f'テキスト{index}\n' for index in range(0, 500)]
+
+    # The remote job directory is removed.
+
+    assert sorted(os.listdir(directory)) == sorted(
+        ['ssh', 'tesseract'] + [os.path.basename(it) for it in paths]
+    )
+
+
+def test_balancer(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    directory = str(tmp_path)
+
+    _write_ssh_script(directory)
+
+    monkeypatch.setenv('PATH', f'{directory}:{os.environ["PATH"]}')
+
+    balancer = Balancer(
+        [SSHHost(host='down'), SSHHost(host='up', weight=2)],
+        multiplex=False,
+        cooldown=0
+    )
+
+    def job(ssh: SSH) -> str:
+        return ssh.run([f'echo {ssh.host}']).stdout.decode().strip()
+
+    # The job fails over from the unreachable host, which is marked as down.
+
+    assert balancer.run(job) == 'up'
+    assert [it.host for it in balancer.down()] == ['down']
+
+    # With no cooldown, the host is checked again by each job, and concurrent
+    # jobs keep failing over from it.
+
+    with ThreadPoolExecutor(3) as executor:
+        assert list(executor.map(lambda _: balancer.run(job), range(0, 9))) \
+            == ['up'] * 9
+
+    # A job fails when no host can be reached.
+
+    balancer = Balancer([SSHHost(host='down')], multiplex=False)
+
+    with pytest.raises(CalledProcessError):
+        _ = balancer.run(job)
+
+    with pytest.raises(RuntimeError):
+        _ = balancer.run(job)
+
+
+def _write_ssh_script(directory: str) -> None:
+    # ssh runs the command locally, unless the host is named 'down'.
+
+    _write_script(
+        f'{directory}/ssh',
+        'while [ $# -gt 1 ]; do\n'
+        '    case "$1" in\n'
+        '        -o|-p) shift 2 ;;\n'
+        '        *) host=$1; shift; break ;;\n'
+        '    esac\n'
+        'done\n'
+        '[ "$host" = down ] && exit 255\n'
+        'exec sh -c "$*"\n'
+    )
+
+
+def _write_script(path: str, body: str) -> None:
+    with open(path, 'w') as fo:
+        _ = fo.write(f'#!/bin/sh\n{body}')
+
+    os.chmod(path, 0o755)
+
+
+def test_ocr_index(tmp_path: Path) -> None:
+    path = tmp_path / 'ocr_index.sqlite3'
+
+    index = OCRIndex(path)
+
+    hash = 0xF0F0_1234_8000_FFFF
+
+    index.put(hash, 'テキスト')
+    index.put(hash ^ 0xFFFF_FFFF, 'ほか')
+
+    assert index.get(hash) == 'テキスト'
+
+    # Hashes which differ in a few bits, even in every chunk, are found within
+    # a large enough distance.
+
+    near = hash ^ 0x0001_0001_0001_0001 ^ 0x8000_0000_0000_0000
+
+    assert index.get(near) is None
+    assert index.get(near, 4) is None
+    assert index.nearest(near, 5) == (5, 'テキスト')
+
+    # Results persist between index instances.
+
+    index.close()
+
+    index = OCRIndex(path)
+
+    assert len(index) == 2
+    assert index.get(hash ^ 0xFFFF_FFFE, 1) == 'ほか'
+
+    with pytest.raises(ValueError):
+        _ = index.get(hash, 12)
+
+    # Results are only found in their own scope, and with a digest, only for
+    # the same image.
+
+    index.put(hash, '別', scope='other', digest='b')
+
+    assert index.get(hash, scope='other') == '別'
+    assert index.get(hash, scope='other', digest='b') == '別'
+    assert index.get(hash, scope='other', digest='c') is None
+    assert index.get(hash ^ 0xFFFF_FFFF, scope='other') is None
+
+    index.clear()
+
+    assert len(index) == 0
+
+
+def test_ocr_image_index(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    backend = FakeBackend(latency=0)
+
+    monkeypatch.setitem(backend_._instances, 'fake', backend)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+    monkeypatch.setattr(config.tesseract, 'backend', 'fake')
+    monkeypatch.setattr(config.tesseract, 'cache', False)
+    monkeypatch.setattr(config.tesseract, 'index', True)
+    monkeypatch.setattr(
+        tesseract, '_ocr_index', OCRIndex(tmp_path / 'ocr_index.sqlite3')
+    )
+
+    # Solid images all have the same difference hash, so their text is reused
+    # for each other, but only for images of the same size.
+
+    images = [
+        Image.new('L', (40, 20), color=10),
+        Image.new('L', (40, 20), color=200),
+        Image.new('L', (20, 40), color=10),
+    ]
+
+    assert [ocr_image(it) for it in images] == [
+        backend.text(images[0]), backend.text(images[0]),
+        backend.text(images[2])
+    ]
+    assert backend.runs == 2
+
+    # With verification, text is only reused for the same image.
+
+    monkeypatch.setattr(config.tesseract, 'index_verify', True)
+
+    assert ocr_image(images[0]) == backend.text(images[0])
+    assert ocr_image(images[1]) == backend.text(images[1])
+    assert backend.runs == 3
+
+
+def test_backends(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert backends() == ['capi', 'fake', 'native', 'ssh', 'wsl']
+
+    monkeypatch.setattr(config.tesseract, 'backend', '')
+    monkeypatch.setattr(config.ssh, 'use_ssh', True)
+
+    assert get_backend().name == 'ssh'
+
+    monkeypatch.setattr(config.ssh, 'use_ssh', False)
+
+    assert get_backend().name == 'wsl'
+
+    monkeypatch.setattr(config.tesseract, 'backend', 'fake')
+
+    assert get_backend() is get_backend('fake')
+
+    with pytest.raises(ValueError):
+        _ = get_backend('unknown')
+
+
+def test_fake_backend(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    directory = str(tmp_path)
+
+    paths = [f'{directory}/{index}.png' for index in range(0, 5)]
+
+    for index, path in enumerate(paths):
+        Image.new('L', (40, 20), color=index).save(path)
+
+    with open(f'{directory}/0.txt', 'w') as fo:
+        _ = fo.write('テキスト\n')
+
+    backend = FakeBackend(directory, latency=0.01)
+
+    monkeypatch.setattr(config.tesseract, 'batch_size', 2)
+    monkeypatch.setitem(backend_._instances, 'fake', backend)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+    monkeypatch.setattr(config.tesseract, 'backend', 'fake')
+
+    result = ocr_many(paths, use_cache=False)
+
+    assert result[0] == 'テキスト\n'
+    assert result[1] == backend.text(Image.open(paths[1]))
+    assert len(set(result)) == 5
+
+    # The images are recognized in batches, one run per batch.
+
+    assert (backend.runs, backend.images) == (3, 5)
+
+    # Images held in memory are batched in the same way.
+
+    images = [Image.open(it) for it in paths]
+
+    assert ocr_images(images, use_cache=False) == result
+    assert (backend.runs, backend.images) == (6, 10)
+
+    # Structured output holds the words of the stored text.
+
+    output = ocr_structured(paths[0], use_cache=False)
+
+    assert output == 'テキスト\n'
+    assert [it.text for it in output.words] == ['テキスト']
+
+
+def test_pool_filter(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    backend = FakeBackend(latency=0)
+    pool = Pool(workers=1, batch_size=4)
+    submitted: list[Image | str] = []
+
+    def submit(image: Image | str) -> Future[str]:
+        submitted.append(image)
+
+        return Pool.submit(pool, image)
+
+    monkeypatch.setattr(pool, 'submit', submit)
+    monkeypatch.setitem(backend_._instances, 'fake', backend)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+    monkeypatch.setattr(tesseract, '_pool', pool)
+    monkeypatch.setattr(config.tesseract, 'backend', 'fake')
+    monkeypatch.setattr(config.tesseract, 'cache', False)
+    monkeypatch.setattr(config.tesseract, 'workers', 2)
+
+    images = [Image.new('L', (40, 20), color=it) for it in range(0, 3)]
+
+    # With pooled workers, the OCR filter passes its images to the pool in
+    # memory, singly and in batches.
+
+    assert OCR().run(images[0]) == backend.text(images[0])
+    assert OCR(batch=True).run(images) == [backend.text(it) for it in images]
+    assert submitted == [images[0], *images]
+
+    # A batch may mix Images and paths of image files.
+
+    path = str(tmp_path / 'image.png')
+
+    images[2].save(path)
+
+    assert pool.map([images[1], path]) == [
+        backend.text(images[1]), backend.text(images[2])
+    ]
+
+    pool.close()
+
+
+def test_encode_pages() -> None:
+    images = [
+        Image.new('L', (40, 20), color=1),
+        Image.new('RGB', (30, 10), color=(1, 2, 3)),
+    ]
+
+    # Each image is a page of the TIFF, with its own mode and size.
+
+    tiff = Image.open(io.BytesIO(backend_.encode_pages(images)))
+    pages = [(tiff.mode, tiff.size, tiff.getpixel((0, 0)))]
+
+    tiff.pil_image.seek(1)
+
+    pages.append((tiff.mode, tiff.size, tiff.getpixel((0, 0))))
+
+    assert pages == [('L', (40, 20), 1), ('RGB', (30, 10), (1, 2, 3))]
+
+
+def test_traineddata(tmp_path: Path) -> None:
+    (tmp_path / 'jpn.traineddata').write_bytes(b'data')
+
+    assert backend_.traineddata(str(tmp_path)).startswith('4 ')
+
+    # A relative directory isn't a Windows path, so it isn't converted.
+
+    assert backend_.traineddata('tessdata') == ''
+
+
+class _FakeLibrary:
+    """ The functions of the libtesseract C API used by Engine. """
+    def __init__(self, init: int = 0) -> None:
+        self.init = init
+        self.calls: list[str] = []
+        self.images: list[tuple[bytes, int, int, int, int]] = []
+        self._text = ctypes.create_string_buffer('テキスト\n'.encode())
+
+    def __getattr__(self, name: str) -> Any:
+        def call(*args: Any) -> Any:
+            self.calls.append(name)
+
+            return {
+                'TessVersion': b'5.3.0',
+                'TessBaseAPICreate': 1,
+                'TessBaseAPIInit2': self.init,
+                'TessBaseAPIGetUTF8Text': ctypes.addressof(self._text),
+                'TessBaseAPIGetTsvText': ctypes.addressof(self._text),
+            }.get(name)
+
+        return call
+
+    def TessBaseAPISetImage(self, *args: Any) -> None:
+        self.images.append(args[1:])
+
+
+def test_capi_engine(monkeypatch: pytest.MonkeyPatch) -> None:
+    lib = _FakeLibrary()
+
+    monkeypatch.setitem(capi._libraries, 'fake', lib)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+
+    engine = Engine(None, library='fake')
+
+    assert engine.version() == '5.3.0'
+    assert engine.text(Image.new('P', (4, 2))) == 'テキスト\n'
+
+    # Images are passed as 8-bit grayscale or color buffers, and the text is
+    # released after it is read.
+
+    assert lib.images == [(bytes(8), 4, 2, 1, 4)]
+    assert lib.calls[-2:] == ['TessDeleteText', 'TessBaseAPIClear']
+
+    engine.close()
+    engine.close()
+
+    assert lib.calls.count('TessBaseAPIDelete') == 1
+
+    # An engine which fails to load its model or its library can be closed
+    # and deleted.
+
+    monkeypatch.setitem(capi._libraries, 'fake', _FakeLibrary(init=-1))  # pyright: ignore[reportPrivateUsage] # noqa: E501
+
+    with pytest.raises(RuntimeError):
+        _ = Engine(None, library='fake')
+
+    unraisable: list[object] = []
+
+    monkeypatch.setattr(sys, 'unraisablehook', unraisable.append)
+
+    with pytest.raises(OSError):
+        _ = Engine(None, library=f'{os.devnull}/missing')
+
+    _ = gc.collect()
+
+    assert unraisable == []
@@ -0,0 +1,134 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import mortar.tesseract.backend as backend_
+from mortar.config import VideoProfile, config
+from mortar.pipeline import (
+    OCR,
+    Crop,
+    Dedup,
+    Gray,
+    Image,
+    Pipeline,
+    Threshold,
+)
+from mortar.process import run
+from mortar.tesseract import FakeBackend
+from mortar.transcribe import Caption, Transcriber
+
+
+def test_caption() -> None:
+    caption = Caption(0, 61.5, 3723.25, 'こんにちは')
+
+    assert json.loads(caption.to_json()) == {
+        'index': 0, 'start': 61.5, 'end': 3723.25, 'text': 'こんにちは'
+    }  # yapf: disable
+
+    assert caption.to_srt() == (
+        '1\n00:01:01,500 --> 01:02:03,250\nこんにちは\n'
+    )
+
+
+@pytest.mark.skipif(
+    shutil.which('ffmpeg') is None, reason='ffmpeg is not installed'
+)
+def test_transcriber(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    path = str(tmp_path / 'video.mkv')
+
+    # The text box in the lower half of the frames shows one line between 1
+    # and 2 seconds, and another between 3 and 4 seconds. A moving object
+    # outside the text box changes every frame.
+
+    _ = run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            'color=c=black:s=64x48:r=10:d=5'
+            ',drawbox=x=0:y=24:w=64:h=24:color=white:t=fill'
+            ":enable='between(t,1,1.99)'"
+            ',drawbox=x=0:y=24:w=32:h=24:color=white:t=fill'
+            ":enable='between(t,3,3.99)'"
+            ",drawbox=x='mod(t*100,56)':y=0:w=8:h=8:color=white:t=fill",
+            '-pix_fmt',
+            'yuv420p',
+            path,
+            '-loglevel',
+            'error'
+        ]
+    )
+
+    fake = FakeBackend()
+
+    def box(width: int) -> Image:
+        array = np.zeros((24, 64), dtype=np.uint8)
+        array[:, :width] = 255
+
+        return Image.from_array(array)
+
+    fake.add(box(0), '')
+    fake.add(box(64), '一行目')
+    fake.add(box(32), '二行目')
+
+    monkeypatch.setitem(backend_._instances, 'fake', fake)  # pyright: ignore[reportPrivateUsage] # noqa: E501
+    monkeypatch.setattr(config.tesseract, 'backend', 'fake')
+    monkeypatch.setattr(config.tesseract, 'cache', False)
+
+    pipeline = Pipeline()
+
+    pipeline.add(Gray())
+    pipeline.add(Threshold())
+    pipeline.add(OCR())
+
+    profile = VideoProfile(crop=(0, 24, 64, 48), gray=True)
+    transcriber = Transcriber(pipeline, profile, jobs=2)
+
+    captions = list(transcriber.run(path))
+
+    assert [(it.index, it.text) for it in captions] == [
+        (0, '一行目'), (1, '二行目')
+    ]
+    assert captions[0].start == pytest.approx(1.0)
+    assert captions[0].end == pytest.approx(2.0)
+    assert captions[1].start == pytest.approx(3.0)
+    assert captions[1].end == pytest.approx(4.0)
+
+    # Only the frames at which the text box changes are OCRed.
+
+    assert transcriber.stats.frames == 50
+    assert transcriber.stats.ocr_runs == 5
+    assert fake.runs == 5
+
+    # Without a profile, changes are detected in a region of the frames, and
+    # the pipeline crops the text box itself.
+
+    pipeline.insert(0, Crop((0, 24, 64, 48)))
+
+    transcriber = Transcriber(pipeline, region=(0, 24, 64, 48), settle=0)
+
+    assert [it.text for it in transcriber.run(path)] == [
+        '一行目', '二行目'
+    ]
+
+    # A pipeline may read the text through any OCR stage, including one
+    # wrapped by Dedup, but must read it.
+
+    pipeline.stages[-1] = Dedup(OCR())
+
+    assert [it.text for it in Transcriber(pipeline).run(path)] == [
+        '一行目', '二行目'
+    ]
+
+    with pytest.raises(ValueError):
+        _ = Transcriber(Pipeline())
+
+    _ = pipeline.stages.pop()
+
+    with pytest.raises(ValueError):
+        _ = Transcriber(pipeline)
@@ -0,0 +1,335 @@
+import os
+import shutil
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import Any
+
+import numpy as np
+import pytest
+from mktech.validate import ensure_type
+
+import mortar.video as video
+from mortar.config import VideoProfile, config
+from mortar.pipeline import Crop, Image, Pipeline
+from mortar.process import run
+from mortar.video import (
+    Frame,
+    FrameReader,
+    changes,
+    extract_frames,
+    profile_filters,
+)
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('ffmpeg') is None, reason='ffmpeg is not installed'
+)
+
+
+def _write_video(
+    path: str, duration: int = 2, rate: int = 10, source: str | None = None
+) -> None:
+    """
+    Write a video of 64x48 pixels from an ffmpeg source filter, or a test
+    pattern if source is None.
+    """
+
+    if source is None:
+        source = f'testsrc=size=64x48:rate={rate}:duration={duration}'
+
+    _ = run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            source,
+            '-pix_fmt',
+            'yuv420p',
+            path,
+            '-loglevel',
+            'error'
+        ]
+    )
+
+
+def test_frame_reader(tmp_path: Path) -> None:
+    path = str(tmp_path / 'video.mkv')
+
+    _write_video(path)
+
+    with FrameReader(path) as reader:
+        frames = list(reader)
+
+    assert [it.index for it in frames] == list(range(0, 20))
+    assert frames[1].timestamp == pytest.approx(0.1)
+    assert frames[0].image.mode == 'RGB'
+    assert frames[0].image.size == (64, 48)
+
+    # Frames are sampled, filtered and converted by ffmpeg.
+
+    reader = FrameReader(path, rate=2, filters=['crop=32:16:0:0'], gray=True)
+    frames = list(reader)
+
+    assert [it.timestamp for it in frames] == pytest.approx(
+        [it / 2 for it in range(0, 4)]
+    )
+    assert frames[0].image.mode == 'L'
+    assert frames[0].image.size == (32, 16)
+
+    # Frames can be passed straight to a pipeline.
+
+    pipeline = Pipeline()
+
+    pipeline.add(Crop((0, 0, 16, 16)))
+
+    with FrameReader(path, rate=2) as reader:
+        outputs = list(pipeline.run_many((it.image for it in reader), jobs=1))
+
+    assert len(outputs) == 4
+    assert ensure_type(outputs[0].stages[-1].data, Image).size == (16, 16)  # pyright: ignore[reportAny] # noqa: E501
+
+
+def test_frame_reader_variable_rate(tmp_path: Path) -> None:
+    path = str(tmp_path / 'video.mkv')
+
+    # The first second has 10 frames, and the next 3 seconds only 10 more.
+
+    _ = run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            'testsrc=size=64x48:rate=10:duration=2,settb=1/1000'
+            ",setpts='if(lt(N,10),N,10+(N-10)*3)/10/TB'",
+            '-fps_mode',
+            'passthrough',
+            '-pix_fmt',
+            'yuv420p',
+            path,
+            '-loglevel',
+            'error'
+        ]
+    )
+
+    # Each frame is read once, with its own timestamp.
+
+    frames = list(FrameReader(path))
+
+    assert [it.index for it in frames] == list(range(0, 20))
+    assert [it.timestamp for it in frames] == pytest.approx(
+        [it / 10 for it in range(0, 10)] +
+        [1 + it * 0.3 for it in range(0, 10)]
+    )
+
+
+def test_frame_reader_stop(tmp_path: Path) -> None:
+    path = str(tmp_path / 'video.mkv')
+
+    _write_video(path, duration=10, rate=25)
+
+    # Stopping early stops ffmpeg, without decoding the rest of the video.
+
+    reader = FrameReader(path, buffer=2)
+
+    for it in reader:
+        if it.index == 3:
+            break
+
+    assert reader._process is not None  # pyright: ignore[reportPrivateUsage]
+    assert reader._process.returncode is not None  # pyright: ignore[reportPrivateUsage] # noqa: E501
+
+    with pytest.raises(CalledProcessError):
+        _ = list(FrameReader(f'{path}.missing'))
+
+
+def test_extract_frames(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    input = tmp_path
+    paths = [Path(input, 'jp', 'game', f'{it}.mkv') for it in ['a', 'b', 'c']]
+
+    os.makedirs(paths[0].parent)
+
+    for it in paths:
+        _write_video(str(it))
+
+    runs: list[Path] = []
+
+    def counted_run(args: list[Any]) -> object:  # pyright: ignore[reportExplicitAny] # noqa: E501
+        runs.append(args[4])
+
+        return run(args)
+
+    monkeypatch.setattr(video, 'run', counted_run)
+
+    assert extract_frames(input, jobs=2) == 0
+
+    def frames(name: str) -> list[str]:
+        return sorted(
+            it for it in os.listdir(Path(input, 'jp', 'game', 'png'))
+            if it.startswith(f'{name}-')
+        )
+
+    count = len(frames('a'))
+
+    assert count > 0
+    assert frames('a')[0] == 'a-0001.png'
+    assert len(frames('b')) == len(frames('c')) == count
+    assert sorted(runs) == paths
+
+    # Unchanged videos are skipped, and modified videos are extracted again.
+
+    runs.clear()
+
+    assert extract_frames(input, jobs=2) == 0
+    assert runs == []
+
+    _write_video(str(paths[1]), duration=3)
+
+    assert extract_frames(input, jobs=2) == 0
+    assert runs == [paths[1]]
+    assert len(frames('b')) > count
+
+    runs.clear()
+
+    # Only the frames written by an extraction are removed by the next one,
+    # and other files named after the video are kept.
+
+    others = ['a-01.png', 'a-01-02.png', 'a-0001.txt', 'ab-0001.png']
+
+    for it in others + ['a-12345.png']:
+        Path(input, 'jp', 'game', 'png', it).touch()
+
+    assert extract_frames(input, force=True) == 0
+    assert sorted(runs) == paths
+    assert sorted(set(frames('a')) - set(others)) == [
+        f'a-{it:04}.png' for it in range(1, count + 1)
+    ]
+
+    for it in others:
+        assert Path(input, 'jp', 'game', 'png', it).exists()
+
+
+def test_changes() -> None:
+    def frame(index: int, text: int, noise: bool = False) -> Frame:
+        """
+        Return a frame at 10 frames per second, with text wide lines drawn in
+        its text box, and a moving object outside it.
+        """
+
+        array = np.zeros((48, 64), dtype=np.uint8)
+        array[0:16, index % 64] = 255
+        array[32:32 + 2 * text:2, 4:60] = 200
+
+        if noise:
+            array[32:48, 4:60] += 8
+
+        return Frame(index, index / 10, Image.from_array(array))
+
+    # Text is drawn line by line, then held, then cleared.
+
+    texts = [0, 0, 1, 2, 3, 3, 3, 3, 3, 0, 0]
+    frames = [
+        frame(index, text, index == 6) for index, text in enumerate(texts)
+    ]
+
+    region = (0, 32, 64, 48)
+
+    assert [it.index for it in changes(frames, region)] == [0, 2, 3, 4, 9]
+
+    # Text being drawn, and the blank text box which is shown too briefly,
+    # are skipped.
+
+    assert [it.index for it in changes(frames, region, settle=0.2)] == [4, 9]
+
+    # Without a region, every frame changes.
+
+    assert len(list(changes(frames))) == len(frames)
+
+
+def test_extract_frames_changes(tmp_path: Path) -> None:
+    input = tmp_path
+    path = Path(input, 'jp', 'video.mkv')
+    out_dir = Path(input, 'jp', 'png')
+
+    os.makedirs(path.parent)
+
+    # The lower half of the frames is white between 1 and 2 seconds.
+
+    _write_video(
+        str(path),
+        source=(
+            'color=c=black:s=64x48:r=10:d=3,drawbox=x=0:y=24:w=64:h=24'
+            ":color=white:t=fill:enable='between(t,1,1.99)'"
+        )
+    )
+
+    assert extract_frames(input, scene=0.1) == 0
+    assert len(os.listdir(out_dir)) == 3
+
+    assert extract_frames(input, region=(0, 24, 64, 48)) == 0
+    assert sorted(os.listdir(out_dir)) == [
+        'video-0001.png', 'video-0002.png', 'video-0003.png'
+    ]
+
+    image = Image.open(Path(out_dir, 'video-0002.png'))
+
+    assert image.getpixel((32, 40)) == (255, 255, 255)
+
+    # A region outside the box never changes.
+
+    assert extract_frames(input, region=(0, 0, 64, 16)) == 0
+    assert os.listdir(out_dir) == ['video-0001.png']
+
+
+def test_extract_frames_profile(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    input = tmp_path
+    path = Path(input, 'jp', 'game', 'video.mkv')
+    out_dir = Path(input, 'jp', 'game', 'png')
+
+    os.makedirs(path.parent)
+
+    _write_video(str(path))
+
+    profile = VideoProfile(crop=(8, 16, 56, 40), gray=True, scale=0.5)
+
+    monkeypatch.setattr(config.video, 'profiles', {'game': profile})
+
+    # Videos in the directory of a profile are extracted with it.
+
+    assert extract_frames(input) == 0
+
+    image = Image.open(Path(out_dir, 'video-0001.png'))
+
+    assert image.mode == 'L'
+    assert image.size == (24, 12)
+
+    # A changed profile extracts the video again.
+
+    profile.format = 'pnm'
+
+    assert extract_frames(input) == 0
+
+    names = os.listdir(out_dir)
+
+    assert len(names) > 0
+    assert all(it.endswith('.pgm') for it in names)
+    assert Image.open(Path(out_dir, names[0])).size == (24, 12)
+
+    with pytest.raises(ValueError):
+        _ = extract_frames(input, profile='missing')
+
+    # Frames read from a pipe are converted in the same way.
+
+    reader = FrameReader(
+        path, filters=profile_filters(profile), gray=profile.gray
+    )
+
+    assert next(iter(reader)).image.size == (24, 12)
+
+    reader.close()